@@ -0,0 +1,211 @@
+"""Example selector backed by a persistent FAISS index.
+
+Passing every labelled example to FewShotPromptTemplate makes the prompt grow
+with the example list. IndexedExampleSelector keeps the examples in a FAISS
+index on disk and picks the most similar ones for each input, stopping at a
+token budget:
+
+    selector = IndexedExampleSelector.load_or_create("examples_index", embeddings, examples)
+    prompt = FewShotPromptTemplate(
+        example_selector=selector,
+        example_prompt=example_prompt,
+        suffix="text: {input}",
+        input_variables=["input"],
+    )
+    selector.add_examples(new_examples)  # embeds only the new examples, saves once
+
+Examples that are already in the index are skipped, so re-running the same
+additions does not grow it. ``save_every`` bounds how often the index, which
+FAISS can only write as a whole, is saved; call ``save`` to flush the rest.
+"""
+
+import json
+import os
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_community.vectorstores.faiss import FAISS
+from langchain_core.embeddings import Embeddings
+from langchain_core.example_selectors import BaseExampleSelector
+from langchain_core.messages import HumanMessage
+from langchain_core.messages.utils import count_tokens_approximately
+
+
+def _approximate_tokens(text: str) -> int:
+    return int(count_tokens_approximately([HumanMessage(content=text)], extra_tokens_per_message=0))
+
+
+class IndexedExampleSelector(BaseExampleSelector):
+    """Select the top-k most similar examples that fit into ``max_tokens``.
+
+    Args:
+        vectorstore: FAISS store holding one entry per example.
+        example_keys: Example keys that are embedded, e.g. ``["text"]``.
+            Defaults to all keys of the example.
+        k: Number of candidates fetched from the index.
+        max_tokens: Token budget for the selected examples.
+        count_tokens: Counts the tokens of an example's text. Defaults to
+            ``count_tokens_approximately``; pass the model's tokenizer for exact counts.
+        path: Directory the index is saved to.
+        cache_size: Number of inputs whose selection is cached.
+        save_every: Number of added examples after which the index is saved to
+            ``path``; unsaved additions are written by ``save``.
+    """
+
+    def __init__(
+        self,
+        vectorstore: FAISS,
+        example_keys: Optional[List[str]] = None,
+        k: int = 4,
+        max_tokens: int = 400,
+        count_tokens: Callable[[str], int] = _approximate_tokens,
+        path: Optional[str] = None,
+        cache_size: int = 1024,
+        save_every: int = 1,
+    ):
+        self.vectorstore = vectorstore
+        self.example_keys = example_keys
+        self.k = k
+        self.max_tokens = max_tokens
+        self.count_tokens = count_tokens
+        self.path = path
+        self.cache_size = cache_size
+        self.save_every = save_every
+        self._cache = OrderedDict()
+        self._unsaved = 0
+        self._stored = {
+            self._example_key(vectorstore.docstore.search(doc_id).metadata): doc_id
+            for doc_id in vectorstore.index_to_docstore_id.values()
+        }
+
+    @classmethod
+    def load_or_create(
+        cls,
+        path: str,
+        embeddings: Embeddings,
+        examples: List[Dict[str, str]],
+        example_keys: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> "IndexedExampleSelector":
+        """Load the index from ``path`` or build it from ``examples`` and save it.
+
+        Examples missing from a loaded index are added, so the index follows
+        the ``examples`` list.
+        """
+        if os.path.exists(path):
+            vectorstore = FAISS.load_local(
+                path, embeddings, allow_dangerous_deserialization=True
+            )
+            selector = cls(vectorstore, example_keys=example_keys, path=path, **kwargs)
+            selector.add_examples(examples)
+            selector.save()
+            return selector
+
+        texts = [cls._example_text(example, example_keys) for example in examples]
+        vectorstore = FAISS.from_texts(texts, embeddings, metadatas=examples)
+        vectorstore.save_local(path)
+        return cls(vectorstore, example_keys=example_keys, path=path, **kwargs)
+
+    @staticmethod
+    def _example_text(values: Dict[str, str], example_keys: Optional[List[str]]) -> str:
+        keys = example_keys or sorted(values)
+        return " ".join(str(values[key]) for key in keys if key in values)
+
+    @staticmethod
+    def _example_key(example: Dict[str, str]) -> str:
+        return json.dumps(example, sort_keys=True, default=str)
+
+    def add_example(self, example: Dict[str, str]) -> Any:
+        """Embed and index a single example without rebuilding the index."""
+        return self.add_examples([example])[0]
+
+    def add_examples(self, examples: List[Dict[str, str]]) -> List[Any]:
+        """Embed and index the examples not stored yet; returns the id of every example."""
+        new = {}
+        for example in examples:
+            key = self._example_key(example)
+            if key not in self._stored:
+                new.setdefault(key, example)
+        if new:
+            ids = self.vectorstore.add_texts(
+                [self._example_text(example, self.example_keys) for example in new.values()],
+                metadatas=list(new.values()),
+            )
+            self._stored.update(zip(new, ids))
+            self._unsaved += len(ids)
+            if self._unsaved >= self.save_every:
+                self.save()
+            # New examples can change any earlier selection
+            self._cache.clear()
+        return [self._stored[self._example_key(example)] for example in examples]
+
+    def save(self) -> None:
+        """Write the index to ``path`` if there are unsaved additions."""
+        if self.path and self._unsaved:
+            self.vectorstore.save_local(self.path)
+        self._unsaved = 0
+
+    def select_examples(self, input_variables: Dict[str, str]) -> List[dict]:
+        query = self._example_text(input_variables, None)
+        if query in self._cache:
+            self._cache.move_to_end(query)
+            return list(self._cache[query])
+
+        docs = self.vectorstore.similarity_search(query, k=self.k)
+        selected, remaining = [], self.max_tokens
+        for doc in docs:
+            example = dict(doc.metadata)
+            tokens = self.count_tokens(" ".join(map(str, example.values())))
+            if tokens > remaining:
+                break
+            selected.append(example)
+            remaining -= tokens
+
+        self._cache[query] = selected
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return list(selected)
+
+
+if __name__ == "__main__":
+    from dotenv import find_dotenv, load_dotenv
+    from langchain_core.prompts.few_shot import FewShotPromptTemplate
+    from langchain_core.prompts.prompt import PromptTemplate
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+    load_dotenv(find_dotenv())
+
+    examples = [
+        {
+            "text": "The BellaVista restaurant offers an exquisite dining experience. The flavors are rich and the presentation is impeccable.",
+            "response": "sentiment: positive\nsubject: BellaVista",
+        },
+        {
+            "text": "BellaVista restaurant was alright. The food was decent, but nothing stood out.",
+            "response": "sentiment: neutral\nsubject: BellaVista",
+        },
+        {
+            "text": "I didn't enjoy my meal at SeoulSavor. The tteokbokki was too mushy and the service was not attentive.",
+            "response": "sentiment: negative\nsubject: SeoulSavor",
+        },
+    ]
+
+    embeddings = GoogleGenerativeAIEmbeddings(model="gemini-embedding-001")
+    selector = IndexedExampleSelector.load_or_create(
+        "examples_index", embeddings, examples, example_keys=["text"], k=2
+    )
+    selector.add_example(
+        {
+            "text": "SeoulSavor was okay. The bibimbap was good but the bulgogi was a bit too sweet for my taste.",
+            "response": "sentiment: neutral\nsubject: SeoulSavor",
+        }
+    )
+
+    example_prompt = PromptTemplate(input_variables=["text", "response"], template="Text: {text}\n{response}")
+    prompt = FewShotPromptTemplate(
+        example_selector=selector,
+        example_prompt=example_prompt,
+        suffix="text: {input}",
+        input_variables=["input"],
+    )
+    print(prompt.format(input="The MunichDeals experience was just awesome!"))
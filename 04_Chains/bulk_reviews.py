@@ -0,0 +1,262 @@
+"""Bulk sentiment/subject/price extraction for large review files.
+
+The chain in basics_and_outputerparsers.ipynb classifies one text per `invoke`.
+This script streams reviews from a JSONL or CSV file and packs several reviews
+into one Gemini request with structured output. Each response is validated per
+review, and only the reviews that failed are retried. Requests run with bounded
+concurrency. Results are appended to a JSONL file that doubles as the
+checkpoint: a restarted run skips every review id already in the output.
+Reviews that still fail after all retries are appended to ``<output>.failed.jsonl``
+and are skipped as well, unless the run is started with ``--retry-failed``.
+
+Usage:
+    python bulk_reviews.py reviews.jsonl results.jsonl --pack-size 20 --concurrency 8
+
+Input rows need a "text" field and may have an "id" field (the row number is
+used otherwise).
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Literal, Optional
+
+from dotenv import find_dotenv, load_dotenv
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_google_genai import ChatGoogleGenerativeAI
+from pydantic import BaseModel, Field, ValidationError
+
+load_dotenv(find_dotenv())
+
+# USD per 1M tokens, used for the cost report only
+INPUT_TOKEN_PRICE = 0.30
+OUTPUT_TOKEN_PRICE = 2.50
+
+
+class ReviewOutput(BaseModel):
+    id: str = Field(description="The id of the review exactly as given.")
+    sentiment: Literal["positive", "neutral", "negative"] = Field(
+        description="is the text in a positive, neutral or negative sentiment?"
+    )
+    subject: Optional[str] = Field(
+        description="What subject is the text about? Use exactly one word. Use None if no subject was provided."
+    )
+    price: Optional[float] = Field(
+        description="How much did the customer pay? Use None if no price was provided.",
+        default=None,
+    )
+
+
+class ReviewBatch(BaseModel):
+    reviews: List[ReviewOutput]
+
+
+prompt = ChatPromptTemplate.from_messages([
+    ("system", "Interprete every review and evaluate it. "
+               "sentiment: is the text in a positive, neutral or negative sentiment? "
+               "subject: What subject is the text about? Use exactly one word. "
+               "price: How much did the customer pay? "
+               "Return exactly one result per review and copy its id unchanged."),
+    ("human", "{reviews}")
+])
+
+
+def read_reviews(path: Path) -> Iterator[Dict[str, str]]:
+    """Yield ``{"id", "text"}`` rows from a JSONL or CSV file without loading it fully."""
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.suffix == ".csv":
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for number, row in enumerate(rows):
+            yield {"id": str(row.get("id", number)), "text": row["text"]}
+
+
+def read_done_ids(path: Path) -> set:
+    """Ids already in the output; a last line torn by a crash is cut off."""
+    if not path.exists():
+        return set()
+    done, valid = set(), 0
+    with open(path, "rb") as f:
+        for line in f:
+            # Lines are written with their newline, a line without one is incomplete
+            if not line.endswith(b"\n"):
+                break
+            try:
+                if line.strip():
+                    done.add(json.loads(line)["id"])
+            except (ValueError, KeyError):
+                break
+            valid += len(line)
+    with open(path, "r+b") as f:
+        f.truncate(valid)
+    return done
+
+
+def raw_items(raw) -> List[dict]:
+    """Review dicts of a structured-output response, before validation."""
+    tool_calls = getattr(raw, "tool_calls", None)
+    if tool_calls:
+        data = tool_calls[0]["args"]
+    else:
+        try:
+            data = json.loads(raw.content)
+        except (TypeError, ValueError):
+            return []
+    items = data.get("reviews") if isinstance(data, dict) else None
+    return [item for item in items if isinstance(item, dict)] if isinstance(items, list) else []
+
+
+def failed_path(output: Path) -> Path:
+    return output.with_name(output.stem + ".failed.jsonl")
+
+
+def format_pack(pack: List[Dict[str, str]]) -> str:
+    return "\n\n".join(f"id: {review['id']}\ntext: {review['text']}" for review in pack)
+
+
+class BulkExtractor:
+    """Classify packs of reviews concurrently and append results to ``output``."""
+
+    def __init__(
+        self,
+        output: Path,
+        model: str = "gemini-2.5-flash",
+        pack_size: int = 20,
+        concurrency: int = 8,
+        max_retries: int = 2,
+    ):
+        self.output = output
+        self.failed_output = failed_path(output)
+        self.pack_size = pack_size
+        self.max_retries = max_retries
+        self.concurrency = concurrency
+        self.chain = prompt | ChatGoogleGenerativeAI(model=model, temperature=0).with_structured_output(
+            ReviewBatch, include_raw=True
+        )
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.stats = {"done": 0, "failed": 0, "requests": 0, "input_tokens": 0, "output_tokens": 0}
+        self._write_lock = asyncio.Lock()
+
+    async def _classify(self, pack):
+        """Return (results by id, ids that are missing or invalid)."""
+        async with self.semaphore:
+            self.stats["requests"] += 1
+            try:
+                response = await self.chain.ainvoke({"reviews": format_pack(pack)})
+            except Exception:
+                return {}, [review["id"] for review in pack]
+
+        usage = getattr(response["raw"], "usage_metadata", None) or {}
+        self.stats["input_tokens"] += usage.get("input_tokens", 0)
+        self.stats["output_tokens"] += usage.get("output_tokens", 0)
+
+        # Each review is validated on its own, so one bad item does not fail the pack
+        expected = {review["id"] for review in pack}
+        results = {}
+        for data in raw_items(response["raw"]):
+            try:
+                item = ReviewOutput.model_validate(data)
+            except ValidationError:
+                continue
+            if item.id in expected:
+                results[item.id] = item
+        return results, [review["id"] for review in pack if review["id"] not in results]
+
+    async def _write(self, results):
+        async with self._write_lock:
+            with open(self.output, "a", encoding="utf-8") as f:
+                for item in results:
+                    f.write(item.model_dump_json() + "\n")
+            self.stats["done"] += len(results)
+
+    async def _write_failed(self, review_ids):
+        async with self._write_lock:
+            with open(self.failed_output, "a", encoding="utf-8") as f:
+                for review_id in review_ids:
+                    f.write(json.dumps({"id": review_id}) + "\n")
+            self.stats["failed"] += len(review_ids)
+
+    async def process_pack(self, pack):
+        by_id = {review["id"]: review for review in pack}
+        for _ in range(self.max_retries + 1):
+            results, failed = await self._classify(list(by_id.values()))
+            await self._write(results.values())
+            by_id = {review_id: by_id[review_id] for review_id in failed}
+            if not by_id:
+                return
+        # Recorded, so a resumed run does not spend requests on them again
+        await self._write_failed(list(by_id))
+
+    async def run(self, reviews: Iterator[Dict[str, str]], retry_failed: bool = False):
+        if retry_failed:
+            self.failed_output.unlink(missing_ok=True)
+        skip_ids = read_done_ids(self.output) | read_done_ids(self.failed_output)
+        pending = set()
+        pack = []
+        try:
+            for review in reviews:
+                if review["id"] in skip_ids:
+                    continue
+                pack.append(review)
+                if len(pack) == self.pack_size:
+                    pending.add(asyncio.create_task(self.process_pack(pack)))
+                    pack = []
+                # Keep only a bounded number of packs in memory
+                if len(pending) >= 2 * self.concurrency:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        task.result()
+            if pack:
+                pending.add(asyncio.create_task(self.process_pack(pack)))
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task.result()
+        except BaseException:
+            # A failed write must stop the run instead of being lost with its task
+            for task in pending:
+                task.cancel()
+            raise
+
+    def report(self, seconds: float) -> Dict[str, float]:
+        done = max(self.stats["done"], 1)
+        cost = (
+            self.stats["input_tokens"] * INPUT_TOKEN_PRICE
+            + self.stats["output_tokens"] * OUTPUT_TOKEN_PRICE
+        ) / 1_000_000
+        return {
+            **self.stats,
+            "reviews_per_second": self.stats["done"] / seconds if seconds else 0.0,
+            "cost_per_1k_reviews_usd": cost * 1000 / done,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk sentiment/subject extraction")
+    parser.add_argument("input", type=Path, help="JSONL or CSV file with a 'text' column")
+    parser.add_argument("output", type=Path, help="JSONL results file (also the checkpoint)")
+    parser.add_argument("--model", default="gemini-2.5-flash")
+    parser.add_argument("--pack-size", type=int, default=20, help="Reviews per request")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight")
+    parser.add_argument("--max-retries", type=int, default=2)
+    parser.add_argument("--retry-failed", action="store_true", help="Retry reviews recorded as failed")
+    args = parser.parse_args()
+
+    extractor = BulkExtractor(
+        args.output,
+        model=args.model,
+        pack_size=args.pack_size,
+        concurrency=args.concurrency,
+        max_retries=args.max_retries,
+    )
+    start = time.perf_counter()
+    asyncio.run(extractor.run(read_reviews(args.input), retry_failed=args.retry_failed))
+    print(json.dumps(extractor.report(time.perf_counter() - start), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""Embedding-based router for the sentiment destination chains in advanced_chains.ipynb.
+
+The LLM router sends `router_template` to the model before any real work starts.
+EmbeddingRouter embeds the destination descriptions (plus optional labelled
+examples) once and routes every input to the nearest centroid. The LLM router is
+only asked when the margin between the two best destinations is too small.
+
+    router = EmbeddingRouter(
+        embeddings, prompt_infos, destination_chains,
+        examples=EXAMPLES, llm_router=router_prompt | llm | StrOutputParser(),
+    )
+    router.invoke({"input": "I ordered Pizza Salami for 9.99$ and it was awesome!"})
+"""
+
+import time
+from typing import Any, Dict, List, Mapping, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.runnables import Runnable, RunnableConfig
+
+# A few labelled examples per destination sharpen the description centroids
+EXAMPLES = {
+    "positive": [
+        "The pizza was amazing and the staff were so friendly!",
+        "Best lasagna I have had in years, we will be back.",
+    ],
+    "neutral": [
+        "The restaurant is open from 11 a.m. to 11 p.m.",
+        "I ordered a Margherita and a glass of water.",
+    ],
+    "negative": [
+        "The food was cold and we waited over an hour.",
+        "Overpriced, rude waiter, never again.",
+    ],
+}
+
+
+def _normalize(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    return matrix / np.linalg.norm(matrix, axis=-1, keepdims=True)
+
+
+class EmbeddingRouter(Runnable[Dict[str, Any], Dict[str, Any]]):
+    """Route inputs to destination chains by nearest embedding centroid.
+
+    Args:
+        embeddings: Embedding model used for descriptions, examples and inputs.
+        prompt_infos: Destinations as ``{"name": ..., "description": ...}`` dicts.
+        destination_chains: Mapping of destination name to chain.
+        examples: Optional few-shot bank, ``{name: [text, ...]}``.
+        llm_router: Optional runnable returning a destination name for
+            ``{"input": text}``. Used below ``min_margin``.
+        min_margin: Minimum difference between the best and second best
+            centroid similarity to trust the embedding decision.
+        default: Destination used when the LLM router answers something unknown.
+            Defaults to "neutral" if that is a destination, else the first one.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        prompt_infos: Sequence[Mapping[str, str]],
+        destination_chains: Mapping[str, Runnable],
+        examples: Optional[Mapping[str, List[str]]] = None,
+        llm_router: Optional[Runnable] = None,
+        min_margin: float = 0.02,
+        default: Optional[str] = None,
+    ):
+        self.embeddings = embeddings
+        self.destination_chains = dict(destination_chains)
+        self.llm_router = llm_router
+        self.min_margin = min_margin
+        self.names = [info["name"] for info in prompt_infos]
+        if default is None:
+            default = "neutral" if "neutral" in self.destination_chains else self.names[0]
+        if default not in self.destination_chains:
+            raise ValueError(f"Default destination {default!r} is not in destination_chains")
+        self.default = default
+        self.stats = {"routed": 0, "llm_fallbacks": 0, "routing_seconds": 0.0}
+
+        # Embed all descriptions and examples in a single call
+        texts, owners = [], []
+        for info in prompt_infos:
+            for text in [info["description"], *(examples or {}).get(info["name"], [])]:
+                texts.append(text)
+                owners.append(info["name"])
+        vectors = _normalize(self.embeddings.embed_documents(texts))
+        owners = np.array(owners)
+        self.centroids = _normalize(
+            np.stack([vectors[owners == name].mean(axis=0) for name in self.names])
+        )
+
+    def classify(self, texts: Sequence[str]) -> List[tuple]:
+        """Return ``(destination, margin)`` per text using embeddings only."""
+        if not texts:
+            return []
+        vectors = _normalize(self.embeddings.embed_documents(list(texts)))
+        scores = vectors @ self.centroids.T
+        order = np.argsort(-scores, axis=1)
+        best = scores[np.arange(len(scores)), order[:, 0]]
+        second = scores[np.arange(len(scores)), order[:, 1]] if len(self.names) > 1 else 0
+        return [
+            (self.names[i], float(margin))
+            for i, margin in zip(order[:, 0], best - second)
+        ]
+
+    def _llm_route(self, inputs_list, config):
+        if not inputs_list:
+            return []
+        answers = self.llm_router.batch(inputs_list, config)
+        destinations = []
+        for answer in answers:
+            destination = answer.strip().lower()
+            destinations.append(destination if destination in self.destination_chains else self.default)
+        return destinations
+
+    def route(self, inputs_list: Sequence[Dict[str, Any]], config=None) -> List[str]:
+        """Pick a destination per input, asking the LLM router only when unsure.
+
+        ``config`` is one config for all inputs or a list with one per input.
+        """
+        start = time.perf_counter()
+        decisions = self.classify([inputs["input"] for inputs in inputs_list])
+        destinations = [name for name, _ in decisions]
+
+        unsure = [i for i, (_, margin) in enumerate(decisions) if margin < self.min_margin]
+        if unsure and self.llm_router is not None:
+            if isinstance(config, list):
+                config = [config[i] for i in unsure]
+            for i, destination in zip(
+                unsure, self._llm_route([inputs_list[i] for i in unsure], config)
+            ):
+                destinations[i] = destination
+            self.stats["llm_fallbacks"] += len(unsure)
+
+        self.stats["routed"] += len(inputs_list)
+        self.stats["routing_seconds"] += time.perf_counter() - start
+        return destinations
+
+    def invoke(
+        self, input: Dict[str, Any], config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> Dict[str, Any]:
+        return self.batch([input], config)[0]
+
+    def batch(
+        self,
+        inputs: List[Dict[str, Any]],
+        config: Optional[RunnableConfig] = None,
+        **kwargs: Any,
+    ) -> List[Dict[str, Any]]:
+        destinations = self.route(inputs, config)
+
+        # One batch call per destination chain instead of one invoke per input
+        outputs = [None] * len(inputs)
+        for name in set(destinations):
+            positions = [i for i, d in enumerate(destinations) if d == name]
+            # A config list has one config per input, so it is split like the inputs
+            chain_config = [config[i] for i in positions] if isinstance(config, list) else config
+            results = self.destination_chains[name].batch([inputs[i] for i in positions], chain_config)
+            for i, result in zip(positions, results):
+                outputs[i] = {"result": result, "destination": name}
+        return outputs
+
+    def agreement(self, texts: Sequence[str], config=None) -> Dict[str, Any]:
+        """Compare embedding decisions with the LLM router on ``texts``."""
+        inputs_list = [{"input": text} for text in texts]
+
+        start = time.perf_counter()
+        embedding_destinations = [name for name, _ in self.classify(texts)]
+        embedding_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        llm_destinations = self._llm_route(inputs_list, config)
+        llm_seconds = time.perf_counter() - start
+
+        matches = sum(a == b for a, b in zip(embedding_destinations, llm_destinations))
+        return {
+            "agreement": matches / len(texts) if texts else 1.0,
+            "embedding_ms_per_input": embedding_seconds * 1000 / max(len(texts), 1),
+            "llm_ms_per_input": llm_seconds * 1000 / max(len(texts), 1),
+            "disagreements": [
+                (text, a, b)
+                for text, a, b in zip(texts, embedding_destinations, llm_destinations)
+                if a != b
+            ],
+        }
+
+
+if __name__ == "__main__":
+    from dotenv import find_dotenv, load_dotenv
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.prompts import ChatPromptTemplate
+    from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
+
+    load_dotenv(find_dotenv())
+
+    llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash")
+    embeddings = GoogleGenerativeAIEmbeddings(model="gemini-embedding-001")
+
+    prompt_infos = [
+        {"name": "positive", "description": "Good for analyzing positive sentiments"},
+        {"name": "neutral", "description": "Good for analyzing neutral sentiments"},
+        {"name": "negative", "description": "Good for analyzing negative sentiments"},
+    ]
+    destination_chains = {
+        info["name"]: ChatPromptTemplate.from_template(
+            f"Analyze the {info['name']} aspects of this text: {{input}}"
+        )
+        | llm
+        | StrOutputParser()
+        for info in prompt_infos
+    }
+    destinations_str = "\n".join(f"{p['name']}: {p['description']}" for p in prompt_infos)
+    router_prompt = ChatPromptTemplate.from_template(
+        "Given a piece of text, determine which sentiment analysis approach to use. "
+        "Here are the available options:\n" + destinations_str + "\n\n"
+        "Return the name of the destination chain to use (positive, neutral, or negative).\n"
+        "Text: {input}\nDestination:"
+    )
+
+    router = EmbeddingRouter(
+        embeddings,
+        prompt_infos,
+        destination_chains,
+        examples=EXAMPLES,
+        llm_router=router_prompt | llm | StrOutputParser(),
+    )
+    texts = [
+        "I ordered Pizza Salami for 9.99$ and it was awesome!",
+        "The tiramisu was soggy and the waiter ignored us.",
+        "We had a table for four at 7 p.m.",
+    ]
+    print(router.agreement(texts))
+    print(router.invoke({"input": texts[0]})["destination"])
+    print(router.stats)
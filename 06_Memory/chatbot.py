@@ -1,5 +1,7 @@
 """Python file to serve as the frontend"""
 
+import uuid
+
 import streamlit as st
 from streamlit_chat import message
 from dotenv import load_dotenv, find_dotenv
@@ -7,7 +9,8 @@ from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain_community.chat_message_histories.streamlit import StreamlitChatMessageHistory
+
+from history_store import get_session_history
 
 load_dotenv(find_dotenv())
 
@@ -18,10 +21,22 @@ prompt = ChatPromptTemplate.from_messages([
     ("human", "{input}")
 ])
 
-# Create Streamlit chat message history
-msgs = StreamlitChatMessageHistory(key="special_app_key")
+# All users share one local history store, keyed by their own session id
+HISTORY_DB = "chat_history.sqlite"
+# Number of past messages sent to the model with every question
+HISTORY_WINDOW = 20
+# Number of messages rendered initially and per "Show older messages" click
+PAGE_SIZE = 20
+# Messages drawn at most; the ones furthest from the current view are dropped
+MAX_RENDERED = 3 * PAGE_SIZE
+
 
+def session_history(session_id):
+    return get_session_history(session_id, path=HISTORY_DB, window=HISTORY_WINDOW)
 
+
+# Built once per process and shared by all sessions; history is per session_id
+@st.cache_resource
 def load_chain():
     # Initialize the LLM with model parameter
     llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash")
@@ -32,7 +47,7 @@ def load_chain():
     # Wrap the chain with message history
     conversation = RunnableWithMessageHistory(
         chain,
-        lambda session_id: msgs,
+        session_history,
         input_messages_key="input",
         history_messages_key="history"
     )
@@ -41,14 +56,14 @@ def load_chain():
 
 
 def initialize_session_state():
-    if "chain" not in st.session_state:
-        st.session_state.chain = load_chain()
-
-    if "generated" not in st.session_state:
-        st.session_state.generated = []
+    if "session_id" not in st.session_state:
+        # The id is kept in the URL so a page reload continues the conversation
+        st.session_state.session_id = st.query_params.get("session") or uuid.uuid4().hex
+        st.query_params["session"] = st.session_state.session_id
 
-    if "past" not in st.session_state:
-        st.session_state.past = []
+    if "rendered" not in st.session_state:
+        # (seq, message) pairs currently shown, oldest first
+        st.session_state.rendered = session_history(st.session_state.session_id).latest(PAGE_SIZE)
 
     if "user_input" not in st.session_state:
         st.session_state.user_input = ""
@@ -71,17 +86,50 @@ def submit():
 st.text_input("You:", key="widget_input", on_change=submit)
 
 if st.session_state.user_input:
-    # Use invoke instead of run (modern LCEL approach)
-    output = st.session_state.chain.invoke(
+    # Tokens are shown as they arrive; the history is written once the stream ends
+    chunks = load_chain().stream(
         {"input": st.session_state.user_input},
-        config={"configurable": {"session_id": "streamlit_session"}}
+        config={"configurable": {"session_id": st.session_state.session_id}}
     )
-    st.session_state.past.append(st.session_state.user_input)
-    st.session_state.generated.append(output)
+    placeholder = st.empty()
+    with placeholder.container():
+        st.write_stream(chunks)
+    placeholder.empty()
+
+    rendered = st.session_state.rendered
+    if st.session_state.get("scrolled_back"):
+        # The newest messages were dropped while reading older ones, jump back to the end
+        rendered[:] = session_history(st.session_state.session_id).latest(PAGE_SIZE)
+        st.session_state.scrolled_back = False
+    else:
+        # Only fetch what was added since the last rendered message
+        last_seq = rendered[-1][0] if rendered else 0
+        rendered.extend(session_history(st.session_state.session_id).after(last_seq))
+        del rendered[:-MAX_RENDERED]
 
     st.session_state.user_input = ""
 
-if st.session_state["generated"]:
-    for i in range(len(st.session_state["generated"]) - 1, -1, -1):
-        message(st.session_state["generated"][i], key=str(i))
-        message(st.session_state["past"][i], is_user=True, key=str(i) + "_user")
+
+# Paging reruns only this fragment, not the whole app; at most MAX_RENDERED messages are drawn
+@st.fragment
+def conversation_view():
+    rendered = st.session_state.rendered
+    for seq, msg in reversed(rendered):
+        message(msg.content, is_user=msg.type == "human", key=f"msg_{seq}")
+
+    if rendered and st.button("Show older messages"):
+        older = session_history(st.session_state.session_id).before(rendered[0][0], PAGE_SIZE)
+        if older:
+            rendered[:0] = older
+            if len(rendered) > MAX_RENDERED:
+                del rendered[MAX_RENDERED:]
+                st.session_state.scrolled_back = True
+            st.rerun(scope="fragment")
+
+    if st.session_state.get("scrolled_back") and st.button("Show newest messages"):
+        rendered[:] = session_history(st.session_state.session_id).latest(PAGE_SIZE)
+        st.session_state.scrolled_back = False
+        st.rerun(scope="fragment")
+
+
+conversation_view()
@@ -0,0 +1,112 @@
+"""SQLite-backed chat history keyed per user session, with windowed loading.
+
+Every session's messages are stored as rows of compressed JSON in one local
+SQLite file shared by all users of the app. Only the last ``window`` messages
+are loaded for the prompt, so long conversations do not grow the model input
+or the memory of the process.
+"""
+
+import json
+import sqlite3
+import threading
+import zlib
+from typing import List, Optional, Sequence, Tuple
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+
+_connections = {}
+_connections_lock = threading.Lock()
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    # One connection per database file and process, shared by all sessions
+    with _connections_lock:
+        if path not in _connections:
+            conn = sqlite3.connect(path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "session_id TEXT NOT NULL, seq INTEGER PRIMARY KEY AUTOINCREMENT, data BLOB NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS messages_session ON messages (session_id, seq)")
+            conn.commit()
+            _connections[path] = (conn, threading.Lock())
+        return _connections[path]
+
+
+def _encode(message: BaseMessage) -> bytes:
+    return zlib.compress(json.dumps(message_to_dict(message)).encode("utf-8"))
+
+
+def _decode(data: bytes) -> BaseMessage:
+    return messages_from_dict([json.loads(zlib.decompress(data))])[0]
+
+
+class SQLiteChatMessageHistory(BaseChatMessageHistory):
+    """Chat history of one session, persisted in a shared SQLite file.
+
+    Args:
+        session_id: Key of the conversation.
+        path: SQLite database file.
+        window: Number of most recent messages returned by ``messages``, None for all.
+    """
+
+    def __init__(self, session_id: str, path: str = "chat_history.sqlite", window: Optional[int] = 20):
+        self.session_id = session_id
+        self.window = window
+        self.conn, self.lock = _connect(path)
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        return [message for _, message in self.latest(self.window)]
+
+    def latest(self, limit: Optional[int]) -> List[Tuple[int, BaseMessage]]:
+        """The last ``limit`` messages (all if None) as ``(seq, message)``, oldest first."""
+        query = "SELECT seq, data FROM messages WHERE session_id = ? ORDER BY seq DESC"
+        params: tuple = (self.session_id,)
+        if limit is not None:
+            query += " LIMIT ?"
+            params += (limit,)
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+        return [(seq, _decode(data)) for seq, data in reversed(rows)]
+
+    def after(self, seq: int) -> List[Tuple[int, BaseMessage]]:
+        """Messages stored after ``seq`` as ``(seq, message)``, oldest first."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT seq, data FROM messages WHERE session_id = ? AND seq > ? ORDER BY seq",
+                (self.session_id, seq),
+            ).fetchall()
+        return [(row_seq, _decode(data)) for row_seq, data in rows]
+
+    def before(self, seq: int, limit: int) -> List[Tuple[int, BaseMessage]]:
+        """Up to ``limit`` messages stored before ``seq``, oldest first."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT seq, data FROM messages WHERE session_id = ? AND seq < ? "
+                "ORDER BY seq DESC LIMIT ?",
+                (self.session_id, seq, limit),
+            ).fetchall()
+        return [(row_seq, _decode(data)) for row_seq, data in reversed(rows)]
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        with self.lock:
+            self.conn.executemany(
+                "INSERT INTO messages (session_id, data) VALUES (?, ?)",
+                [(self.session_id, _encode(message)) for message in messages],
+            )
+            self.conn.commit()
+
+    def clear(self) -> None:
+        with self.lock:
+            self.conn.execute("DELETE FROM messages WHERE session_id = ?", (self.session_id,))
+            self.conn.commit()
+
+
+def get_session_history(
+    session_id: str, path: str = "chat_history.sqlite", window: Optional[int] = 20
+) -> SQLiteChatMessageHistory:
+    """Factory for RunnableWithMessageHistory."""
+    return SQLiteChatMessageHistory(session_id, path=path, window=window)
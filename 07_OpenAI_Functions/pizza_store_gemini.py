@@ -3,6 +3,7 @@ from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.tools import tool
 from langchain_core.messages import HumanMessage, ToolMessage
 from dotenv import load_dotenv, find_dotenv
+from course_utils.rate_limiter import limiter_from_env
 
 load_dotenv(find_dotenv())
 
@@ -50,15 +51,16 @@ def add_pizza(pizza_name: str, price: float) -> dict:
     return {"message": f"Pizza {pizza_name} added successfully!"}
 
 
-# Initialize the LLM with Gemini
-llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash", temperature=0)
+# Initialize the LLM with Gemini; retries of 429s are left to the shared rate limiter
+llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash", temperature=0, max_retries=0)
+limiter = limiter_from_env()
 
 
 # Define the tools
 tools = [get_pizza_info, add_pizza]
 
-# Bind tools to the LLM
-llm_with_tools = llm.bind_tools(tools)
+# Bind tools to the LLM and route every call through the rate limiter
+llm_with_tools = limiter.wrap(llm.bind_tools(tools))
 
 # Create a prompt template
 prompt = ChatPromptTemplate.from_messages([
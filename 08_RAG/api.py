@@ -1,27 +1,40 @@
-from fastapi import FastAPI, HTTPException
+"""RAG service answering questions about Bella Vista.
+
+Only FastAPI is imported at module level. LangChain, the Gemini clients and the
+FAISS index are imported and built by a warm-up task that the lifespan starts in
+the background, so the server listens right away. Independent parts (index,
+LLM) are built in parallel threads. /ready returns 503 until the warm-up is
+done, and the other endpoints answer 503 with Retry-After until then.
+
+    python startup_profile.py    # import-time profile and time to listening / ready
+"""
 
-from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
+import asyncio
+import json
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List
 
-# from langchain_classic.chains import RetrievalQA
-from langchain_core.prompts import PromptTemplate
-from langchain_community.vectorstores.faiss import FAISS
-from langchain_classic.chains.retrieval import create_retrieval_chain
-from langchain_classic.chains.combine_documents import create_stuff_documents_chain
+from fastapi import FastAPI, HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel
 
 from dotenv import load_dotenv, find_dotenv
 
 load_dotenv(find_dotenv())
 
-embeddings = GoogleGenerativeAIEmbeddings(model="gemini-embedding-001")
-app = FastAPI()
+logger = logging.getLogger(__name__)
 
-# Updated template with examples, context, and a non-related example
+# Instructions and examples come first so they form a static prompt prefix that
+# Gemini can cache; only the retrieved context and the question vary per request
 template = """
-You be an AI pirate matey, and when ye be answerin', ye must answer like one of us sea dogs. Yer duty is to respond to inquiries related to the given context:
+You be an AI pirate matey, and when ye be answerin', ye must answer like one of us sea dogs. Yer duty is to respond to inquiries related to the given context.
 If the context is empty, provide an answer in a pirate style that you are not allowed to answer the question.
 
-{context}
-
 Take guidance from the examples below:
 
 Text: "Tell me about the vegan options."
@@ -39,39 +52,227 @@ Answer: "Nay, we prefer shiny gold coins! But aye, credit cards will do."
 Text: "What's the meaning of life?"
 Answer: "That be outside of me duties to answer, matey!"
 
-Now, using this guidance and adhering to the context, process the text below and give yer best pirate answer:
+Now, using this guidance and adhering to the context below, process the text and give yer best pirate answer:
+
+context: {context}
+
 text: {input}
 """
 
-PROMPT = PromptTemplate(template=template, input_variables=["context", "input"])
 
-# chain_type_kwargs = {"prompt": PROMPT}
-llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash")
+LLM_MODEL = "gemini-1.5-flash"
+# Over-fetch 20 neighbours and keep 4 diverse ones; overlapping chunks are often near-copies
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.5"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "800"))
+
+# Number of documents per question and max. parallel LLM calls for /conversation/batch
+BATCH_TOP_K = 4
+BATCH_MAX_CONCURRENCY = 8
+
+# Filled by warm_up(): embeddings, vectorstore, retrievers, LLMs and chains
+state: Dict[str, Any] = {}
+startup = {"ready": False, "failed": False, "error": None, "attempts": 0, "seconds": {}}
+# Failed warm-ups are retried with backoff; after the last one /healthz fails so the pod is restarted
+WARM_UP_ATTEMPTS = int(os.getenv("WARM_UP_ATTEMPTS", "5"))
+
+
+def load_index():
+    from langchain_community.vectorstores.faiss import FAISS
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+    from course_utils.context_packer import ContextPacker, PackedRetriever
+    from mmr import MMRRetriever
+
+    embeddings = GoogleGenerativeAIEmbeddings(model="gemini-embedding-001")
+    vectorstore = FAISS.load_local("index", embeddings)
+    mmr_retriever = MMRRetriever(vectorstore=vectorstore, k=4, fetch_k=20, lambda_mult=MMR_LAMBDA)
+    # Only the query-relevant sentences of the retrieved chunks are stuffed into the prompt
+    packer = ContextPacker(max_tokens=CONTEXT_TOKEN_BUDGET)
+    return {
+        "embeddings": embeddings,
+        "vectorstore": vectorstore,
+        "mmr_retriever": mmr_retriever,
+        "packer": packer,
+        "retriever": PackedRetriever(retriever=mmr_retriever, packer=packer),
+    }
+
+
+def load_llm():
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    from compiled_prompt import CompiledPromptTemplate, create_context_cache
+    from course_utils.rate_limiter import BATCH, limiter_from_env
+
+    prompt = CompiledPromptTemplate.from_template(template)
+    llm_kwargs = {}
+    if os.getenv("GEMINI_CONTEXT_CACHE"):
+        # The static prefix is stored once on Gemini's side, requests only carry the rest
+        llm_kwargs["cached_content"] = create_context_cache(f"models/{LLM_MODEL}", prompt.static_prefix)
+        prompt = prompt.without_static_prefix()
+
+    # All Gemini calls share the project quota; the limiter retries 429s with jitter
+    limiter = limiter_from_env()
+    gemini = ChatGoogleGenerativeAI(model=LLM_MODEL, max_retries=0, **llm_kwargs)
+    return {
+        "prompt": prompt,
+        "limiter": limiter,
+        "llm": limiter.wrap(gemini),
+        # Batch answers only use quota that interactive /conversation calls leave over
+        "batch_llm": limiter.wrap(gemini, priority=BATCH),
+    }
+
+
+def build_chains(resources):
+    # from langchain_classic.chains import RetrievalQA
+    from langchain_classic.chains.combine_documents import create_stuff_documents_chain
+    from langchain_classic.chains.retrieval import create_retrieval_chain
+
+    # qa = RetrievalQA.from_chain_type(
+    #     llm=llm,
+    #     chain_type="stuff",
+    #     retriever=retriever,
+    #     chain_type_kwargs=chain_type_kwargs,
+    # )
+    combine_docs_chain = create_stuff_documents_chain(resources["llm"], resources["prompt"])
+    return {
+        "combine_docs_chain": combine_docs_chain,
+        "batch_docs_chain": create_stuff_documents_chain(resources["batch_llm"], resources["prompt"]),
+        "qa": create_retrieval_chain(retriever=resources["retriever"], combine_docs_chain=combine_docs_chain),
+    }
+
+
+async def timed(name, fn, *args):
+    start = time.perf_counter()
+    result = await asyncio.to_thread(fn, *args)
+    startup["seconds"][name] = round(time.perf_counter() - start, 3)
+    return result
 
-vectorstore = FAISS.load_local("index", embeddings)
-retriever = vectorstore.as_retriever()
 
-# qa = RetrievalQA.from_chain_type(
-#     llm=llm,
-#     chain_type="stuff",
-#     retriever=retriever,
-#     chain_type_kwargs=chain_type_kwargs,
-# )
+async def warm_up():
+    start = time.perf_counter()
+    for attempt in range(1, WARM_UP_ATTEMPTS + 1):
+        startup["attempts"] = attempt
+        try:
+            for resources in await asyncio.gather(timed("index", load_index), timed("llm", load_llm)):
+                state.update(resources)
+            state.update(await timed("chains", build_chains, state))
+        except Exception as e:
+            startup["error"] = repr(e)
+            logger.exception("Warm-up attempt %d of %d failed", attempt, WARM_UP_ATTEMPTS)
+            if attempt < WARM_UP_ATTEMPTS:
+                await asyncio.sleep(min(2**attempt, 30))
+            continue
+        startup["error"] = None
+        startup["seconds"]["total"] = round(time.perf_counter() - start, 3)
+        startup["ready"] = True
+        return
+    startup["failed"] = True
 
-combine_docs_chain = create_stuff_documents_chain(llm, PROMPT)
-qa = create_retrieval_chain(retriever=retriever, combine_docs_chain=combine_docs_chain)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Not awaited: the server accepts connections while the warm-up runs
+    task = asyncio.create_task(warm_up())
+    yield
+    task.cancel()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+def resources() -> Dict[str, Any]:
+    if not startup["ready"]:
+        raise HTTPException(detail="Warming up", status_code=503, headers={"Retry-After": "1"})
+    return state
+
+
+@app.get("/healthz")
+async def healthz():
+    if startup["failed"]:
+        return JSONResponse(startup, status_code=500)
+    return {"status": "ok"}
+
+
+@app.get("/ready")
+async def ready():
+    return JSONResponse(startup, status_code=200 if startup["ready"] else 503)
+
+
+class BatchQuery(BaseModel):
+    questions: List[str]
+
+
+def batch_retrieve(questions, k=BATCH_TOP_K):
+    """Embed all questions in one call and search the FAISS index as one matrix query.
+
+    The candidates of every question are then narrowed down to ``k`` diverse
+    documents and packed into the context budget, like the single-question retriever.
+    """
+    import numpy as np
+
+    # Same task type as embed_query, so batch answers match /conversation
+    vectors = np.asarray(
+        state["embeddings"].embed_documents(questions, task_type="RETRIEVAL_QUERY"), dtype=np.float32
+    )
+    _, indices = state["vectorstore"].index.search(vectors, max(k, state["mmr_retriever"].fetch_k))
+    selector = state["mmr_retriever"].model_copy(update={"k": k})
+    return [
+        state["packer"].pack(question, selector.select(vector, row))
+        for question, vector, row in zip(questions, vectors, indices)
+    ]
 
 
 @app.post("/conversation")
 async def conversation(query: str):
+    qa = resources()["qa"]
     try:
-        result = qa.invoke({"input": query})
+        # ainvoke keeps the limiter's waits and backoff off the event loop
+        result = await qa.ainvoke({"input": query})
         # result = qa.run(query=query)
         return {"response": result}
     except Exception as e:
         raise HTTPException(detail=str(e), status_code=500)
 
 
+@app.post("/conversation/batch")
+async def conversation_batch(batch: BatchQuery):
+    batch_docs_chain = resources()["batch_docs_chain"]
+    # Identical questions are only retrieved and answered once
+    positions = {}
+    for position, question in enumerate(batch.questions):
+        positions.setdefault(question.strip(), []).append(position)
+    unique_questions = list(positions)
+
+    try:
+        # Embedding call and FAISS search are blocking, keep them off the event loop
+        contexts = await run_in_threadpool(batch_retrieve, unique_questions) if unique_questions else []
+    except Exception as e:
+        raise HTTPException(detail=str(e), status_code=500)
+
+    inputs = [
+        {"input": question, "context": context}
+        for question, context in zip(unique_questions, contexts)
+    ]
+
+    async def results():
+        async for i, answer in batch_docs_chain.abatch_as_completed(
+            inputs,
+            config={"max_concurrency": BATCH_MAX_CONCURRENCY},
+            return_exceptions=True,
+        ):
+            question = unique_questions[i]
+            if isinstance(answer, Exception):
+                line = {"error": str(answer)}
+            else:
+                line = {"response": {**inputs[i], "answer": answer}}
+            for position in positions[question]:
+                yield json.dumps(
+                    jsonable_encoder({"index": position, "question": question, **line})
+                ) + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -0,0 +1,180 @@
+"""Precompiled f-string prompt templates with a cacheable static prefix.
+
+`PromptTemplate.format` parses and validates its template on every call and a
+`FewShotPromptTemplate` re-renders every example each time. Here templates are
+parsed once into literal chunks and variable slots. Few-shot example blocks are
+rendered once and baked into the literal text.
+
+Everything before the first variable is the *static prefix*. Keeping the long
+instructions and examples there lets Gemini reuse them between requests, either
+through implicit prefix caching or through an explicit context cache
+(`create_context_cache`). In the latter case the model only receives
+`suffix_template()` per request.
+"""
+
+import datetime
+from functools import lru_cache
+from string import Formatter
+from typing import Any, Dict, List, Mapping, Sequence, Tuple
+
+from langchain_core.prompts import StringPromptTemplate
+
+
+class CompiledTemplate:
+    """An f-string template parsed into literal and variable parts."""
+
+    def __init__(self, template: str):
+        self.template = template
+        self.parts: List[Tuple[str, str]] = []
+        for literal, field, spec, conversion in Formatter().parse(template):
+            if spec or conversion or (field is not None and not field.isidentifier()):
+                raise ValueError(f"Unsupported placeholder in template: {{{field}}}")
+            self.parts.append((literal, field))
+        self.input_variables = sorted({field for _, field in self.parts if field})
+
+    @property
+    def static_prefix(self) -> str:
+        """Text that is identical for every render."""
+        prefix = []
+        for literal, field in self.parts:
+            prefix.append(literal)
+            if field is not None:
+                break
+        return "".join(prefix)
+
+    def render(self, values: Mapping[str, Any]) -> str:
+        out = []
+        for literal, field in self.parts:
+            out.append(literal)
+            if field is not None:
+                out.append(str(values[field]))
+        return "".join(out)
+
+    def suffix_template(self) -> "CompiledTemplate":
+        """Template without its static prefix, for use with a context cache."""
+        text, in_prefix = [], True
+        for literal, field in self.parts:
+            if not in_prefix:
+                text.append(_escape(literal))
+            if field is not None:
+                text.append("{" + field + "}")
+                in_prefix = False
+        return compile_template("".join(text))
+
+
+def _escape(text: str) -> str:
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+@lru_cache(maxsize=256)
+def compile_template(template: str) -> CompiledTemplate:
+    """Parse ``template`` once; repeated calls return the cached result."""
+    return CompiledTemplate(template)
+
+
+@lru_cache(maxsize=64)
+def _compile_few_shot(
+    examples: Tuple[Tuple[Tuple[str, str], ...], ...],
+    example_template: str,
+    prefix: str,
+    suffix: str,
+    example_separator: str,
+) -> CompiledTemplate:
+    example = compile_template(example_template)
+    rendered = [example.render(dict(values)) for values in examples]
+    block = _escape(example_separator.join(rendered))
+    pieces = [piece for piece in (prefix, block, suffix) if piece]
+    return compile_template(example_separator.join(pieces))
+
+
+def compile_few_shot(
+    examples: Sequence[Mapping[str, str]],
+    example_template: str,
+    suffix: str,
+    prefix: str = "",
+    example_separator: str = "\n\n",
+) -> CompiledTemplate:
+    """Equivalent of FewShotPromptTemplate with the examples rendered only once.
+
+    The examples become part of the static prefix, so they have to come before
+    any variable in ``prefix``.
+    """
+    frozen = tuple(tuple(sorted(example.items())) for example in examples)
+    return _compile_few_shot(frozen, example_template, prefix, suffix, example_separator)
+
+
+class CompiledPromptTemplate(StringPromptTemplate):
+    """Drop-in PromptTemplate that renders through a compiled template."""
+
+    template: str
+
+    @classmethod
+    def from_template(cls, template: str, **kwargs: Any) -> "CompiledPromptTemplate":
+        compiled = compile_template(template)
+        return cls(template=template, input_variables=compiled.input_variables, **kwargs)
+
+    @property
+    def compiled(self) -> CompiledTemplate:
+        return compile_template(self.template)
+
+    @property
+    def static_prefix(self) -> str:
+        return self.compiled.static_prefix
+
+    def without_static_prefix(self) -> "CompiledPromptTemplate":
+        """Same prompt minus the static prefix, for use with a context cache."""
+        return CompiledPromptTemplate.from_template(self.compiled.suffix_template().template)
+
+    def format(self, **kwargs: Any) -> str:
+        return self.compiled.render(self._merge_partial_and_user_variables(**kwargs))
+
+    @property
+    def _prompt_type(self) -> str:
+        return "compiled-prompt"
+
+
+def create_context_cache(model: str, static_prefix: str, ttl_minutes: int = 60) -> str:
+    """Store ``static_prefix`` as a Gemini context cache and return its name.
+
+    Pass the name as ``cached_content`` to ChatGoogleGenerativeAI. Gemini only
+    accepts caches above a minimum token count, so this pays off for long
+    instruction and example blocks.
+    """
+    from google.generativeai import caching
+
+    cache = caching.CachedContent.create(
+        model=model,
+        system_instruction=static_prefix,
+        ttl=datetime.timedelta(minutes=ttl_minutes),
+    )
+    return cache.name
+
+
+def render_benchmark(template: str, values: Dict[str, Any], runs: int = 10_000) -> Dict[str, float]:
+    """Microseconds per render for PromptTemplate vs CompiledPromptTemplate."""
+    import time
+
+    from langchain_core.prompts import PromptTemplate
+
+    results = {}
+    for name, prompt in [
+        ("PromptTemplate", PromptTemplate.from_template(template)),
+        ("CompiledPromptTemplate", CompiledPromptTemplate.from_template(template)),
+    ]:
+        start = time.perf_counter()
+        for _ in range(runs):
+            prompt.format(**values)
+        results[name] = (time.perf_counter() - start) * 1e6 / runs
+    return results
+
+
+if __name__ == "__main__":
+    examples = [
+        {"text": f"Example review number {i}, the pasta was fine.", "response": "sentiment: neutral"}
+        for i in range(20)
+    ]
+    few_shot = compile_few_shot(
+        examples, "Text: {text}\n{response}", suffix="text: {input}", prefix="Classify the text."
+    )
+    print(f"static prefix: {len(few_shot.static_prefix)} of {len(few_shot.render({'input': 'x'}))} chars")
+    print(render_benchmark(few_shot.template, {"input": "The MunichDeals experience was just awesome!"}))
@@ -0,0 +1,263 @@
+"""Compressed vector index for gemini-embedding-001 vectors.
+
+A 3072-dim float32 vector takes 12 KB. Three options, which can be combined,
+keep only compact codes in RAM:
+
+* Matryoshka truncation: gemini-embedding-001 is trained so that the first
+  768 or 1536 dimensions (re-normalized) still work as an embedding.
+* int8 scalar quantization: one byte per dimension (4x smaller).
+* Product quantization: ``pq_m`` bytes per vector (for example 96 bytes).
+
+Search runs on the compressed index and fetches a shortlist of
+``rerank_factor * k`` candidates. The shortlist is re-ranked with the
+full-precision vectors, which stay in a memory-mapped .npy file on disk and are
+only paged in for the few rows that are read.
+
+The trained index, the row ids and the documents are saved next to ``full.npy``.
+A worker loads them with ``CompressedRetriever.load`` and never needs the
+float32 FAISS store in memory.
+
+    # once, where the FAISS store is available
+    CompressedIndex.from_faiss(vectorstore, "index_compressed", truncate_to=768, quantization="int8")
+    # in the worker
+    retriever = CompressedRetriever.load("index_compressed", embeddings, k=4)
+
+    python compressed_index.py --source index     # recall / memory / latency report
+"""
+
+import json
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_community.vectorstores.faiss import FAISS, dependable_faiss_import
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+
+from similarity import normalize, top_k
+
+QUANTIZATIONS = ("none", "int8", "pq")
+
+
+def truncate(vectors, dimensions: Optional[int]) -> np.ndarray:
+    """Keep the first ``dimensions`` components and re-normalize (Matryoshka)."""
+    matrix = np.array(vectors, dtype=np.float32, ndmin=2)
+    return normalize(matrix[:, :dimensions] if dimensions else matrix)
+
+
+class CompressedIndex:
+    """Compressed inner-product index with full-precision re-ranking.
+
+    Args:
+        path: Directory holding the saved index, ``full.npy`` with the
+            full-precision vectors and the documents.
+        truncate_to: Dimensions kept in the compressed index, None for all.
+        quantization: "none" (float32), "int8" or "pq".
+        pq_m: Number of PQ sub-quantizers (bytes per vector); must divide the dimension.
+        rerank_factor: Shortlist size as a multiple of k; 0 disables re-ranking.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        truncate_to: Optional[int] = None,
+        quantization: str = "int8",
+        pq_m: int = 96,
+        rerank_factor: int = 4,
+    ):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"quantization must be one of {QUANTIZATIONS}, got {quantization!r}")
+        self.path = Path(path)
+        self.truncate_to = truncate_to
+        self.quantization = quantization
+        self.pq_m = pq_m
+        self.rerank_factor = rerank_factor
+        self.index = None
+        self.full: Optional[np.ndarray] = None
+        self.ids: List[str] = []
+        self.documents: Dict[str, Document] = {}
+
+    def build(
+        self, vectors, ids: Optional[List[str]] = None, documents: Optional[Dict[str, Document]] = None
+    ) -> "CompressedIndex":
+        """Train and fill the compressed index and save it with the full vectors."""
+        faiss = dependable_faiss_import()
+        full = normalize(vectors)
+        codes = truncate(full, self.truncate_to)
+        n, dimension = codes.shape
+
+        if self.quantization == "none":
+            index = faiss.IndexFlatIP(dimension)
+        elif self.quantization == "int8":
+            index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+        else:
+            if dimension % self.pq_m:
+                raise ValueError(f"pq_m={self.pq_m} does not divide the dimension {dimension}")
+            # 8-bit codes need at least 256 training vectors; tiny corpora get fewer centroids
+            nbits = int(max(1, min(8, np.log2(n))))
+            index = faiss.IndexPQ(dimension, self.pq_m, nbits, faiss.METRIC_INNER_PRODUCT)
+        if not index.is_trained:
+            index.train(codes)
+        index.add(codes)
+
+        self.path.mkdir(parents=True, exist_ok=True)
+        np.save(self.path / "full.npy", full)
+        self.index = index
+        self.full = np.load(self.path / "full.npy", mmap_mode="r")
+        self.ids = list(ids) if ids is not None else [str(i) for i in range(n)]
+        self.documents = dict(documents or {})
+        self.save()
+        return self
+
+    def save(self) -> None:
+        """Write the trained index, its settings, the row ids and the documents."""
+        faiss = dependable_faiss_import()
+        faiss.write_index(self.index, str(self.path / "index.faiss"))
+        meta = {
+            "truncate_to": self.truncate_to,
+            "quantization": self.quantization,
+            "pq_m": self.pq_m,
+            "rerank_factor": self.rerank_factor,
+            "ids": self.ids,
+        }
+        (self.path / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+        documents = {
+            doc_id: {"page_content": doc.page_content, "metadata": doc.metadata}
+            for doc_id, doc in self.documents.items()
+        }
+        (self.path / "documents.json").write_text(json.dumps(documents), encoding="utf-8")
+
+    @classmethod
+    def load(cls, path: str) -> "CompressedIndex":
+        """Load a saved index; the full vectors are memory-mapped, not read."""
+        faiss = dependable_faiss_import()
+        path = Path(path)
+        meta = json.loads((path / "meta.json").read_text(encoding="utf-8"))
+        self = cls(
+            path,
+            truncate_to=meta["truncate_to"],
+            quantization=meta["quantization"],
+            pq_m=meta["pq_m"],
+            rerank_factor=meta["rerank_factor"],
+        )
+        self.index = faiss.read_index(str(path / "index.faiss"))
+        self.full = np.load(path / "full.npy", mmap_mode="r")
+        self.ids = meta["ids"]
+        documents = json.loads((path / "documents.json").read_text(encoding="utf-8"))
+        self.documents = {doc_id: Document(**doc) for doc_id, doc in documents.items()}
+        return self
+
+    @classmethod
+    def from_faiss(cls, store: FAISS, path: str, **kwargs) -> "CompressedIndex":
+        """Build from a LangChain FAISS store, reusing its vectors, docstore ids and documents."""
+        vectors = store.index.reconstruct_n(0, store.index.ntotal)
+        ids = [store.index_to_docstore_id[i] for i in range(store.index.ntotal)]
+        documents = {doc_id: store.docstore.search(doc_id) for doc_id in ids}
+        return cls(path, **kwargs).build(vectors, ids, documents)
+
+    def memory_bytes(self) -> int:
+        """Bytes of the in-RAM index (full vectors stay on disk)."""
+        return int(dependable_faiss_import().serialize_index(self.index).nbytes)
+
+    def search(self, query, k: int = 4) -> List[Tuple[str, float]]:
+        """``(id, cosine similarity)`` of the ``k`` best matches."""
+        scores, rows = self.search_rows(np.array(query, dtype=np.float32, ndmin=2), k)
+        return [(self.ids[row], float(score)) for score, row in zip(scores[0], rows[0]) if row != -1]
+
+    def search_rows(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Batched search returning (scores, row numbers), both shaped (len(queries), k)."""
+        full_queries = normalize(queries)
+        shortlist = k * self.rerank_factor if self.rerank_factor else k
+        shortlist = min(shortlist, self.index.ntotal)
+        scores, rows = self.index.search(truncate(full_queries, self.truncate_to), shortlist)
+        if not self.rerank_factor:
+            return scores, rows
+
+        out_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        out_rows = np.full((len(queries), k), -1, dtype=np.int64)
+        for i, (query, candidates) in enumerate(zip(full_queries, rows)):
+            # Only the shortlisted rows of the memory-mapped file are read (in file order)
+            candidates = np.sort(candidates[candidates != -1])
+            exact = np.asarray(self.full[candidates]) @ query
+            order = np.argsort(-exact)[:k]
+            out_scores[i, : len(order)] = exact[order]
+            out_rows[i, : len(order)] = candidates[order]
+        return out_scores, out_rows
+
+
+class CompressedRetriever(BaseRetriever):
+    """Retriever over a CompressedIndex and the documents saved with it."""
+
+    index: CompressedIndex
+    embeddings: Embeddings
+    k: int = 4
+
+    @classmethod
+    def load(cls, path: str, embeddings: Embeddings, k: int = 4) -> "CompressedRetriever":
+        return cls(index=CompressedIndex.load(path), embeddings=embeddings, k=k)
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        vector = self.embeddings.embed_query(query)
+        return [self.index.documents[doc_id] for doc_id, _ in self.index.search(vector, self.k)]
+
+
+SETTINGS = [
+    {"name": "float32", "truncate_to": None, "quantization": "none"},
+    {"name": "float32 / 1536d", "truncate_to": 1536, "quantization": "none"},
+    {"name": "float32 / 768d", "truncate_to": 768, "quantization": "none"},
+    {"name": "int8", "truncate_to": None, "quantization": "int8"},
+    {"name": "int8 / 768d", "truncate_to": 768, "quantization": "int8"},
+    {"name": "pq96", "truncate_to": None, "quantization": "pq", "pq_m": 96},
+    {"name": "pq48 / 768d", "truncate_to": 768, "quantization": "pq", "pq_m": 48},
+]
+
+
+def report(vectors, queries, k: int = 10, settings=SETTINGS) -> List[Dict]:
+    """recall@k, RAM per vector and query latency for every setting, with and without re-ranking."""
+    _, truth = top_k(queries, vectors, k=k)
+    rows = []
+    path = tempfile.mkdtemp(prefix="compressed_index_")
+    for setting in settings:
+        for rerank_factor in (0, 4):
+            params = {key: value for key, value in setting.items() if key != "name"}
+            index = CompressedIndex(path, rerank_factor=rerank_factor, **params).build(vectors)
+            start = time.perf_counter()
+            _, found = index.search_rows(queries, k)
+            latency = (time.perf_counter() - start) / len(queries)
+            recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(found, truth)])
+            rows.append({
+                "setting": setting["name"] + (f" + rerank x{rerank_factor}" if rerank_factor else ""),
+                f"recall@{k}": round(float(recall), 3),
+                "bytes/vector": round(index.memory_bytes() / len(vectors), 1),
+                "latency_ms": round(latency * 1000, 3),
+            })
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Recall / memory / latency report for compressed indexes")
+    parser.add_argument("--source", default="index", help="Directory with index.faiss")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    faiss = dependable_faiss_import()
+    source = faiss.read_index(str(Path(args.source) / "index.faiss"))
+    vectors = source.reconstruct_n(0, source.ntotal)
+    # Queries: perturbed copies of stored vectors, so no embedding calls are needed
+    rng = np.random.default_rng(0)
+    picked = vectors[rng.integers(0, len(vectors), args.queries)]
+    queries = picked + rng.normal(0, 0.3 * np.abs(picked).mean(), picked.shape).astype(np.float32)
+
+    k = min(args.k, len(vectors))
+    print(f"{len(vectors)} vectors x {vectors.shape[1]} dims, {args.queries} queries")
+    for row in report(vectors, queries, k=k):
+        print("  ".join(f"{key}: {value}" for key, value in row.items()))
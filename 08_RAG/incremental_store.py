@@ -0,0 +1,335 @@
+"""Incrementally updated FAISS store with a write-ahead log.
+
+Instead of rebuilding the index with ``FAISS.from_documents`` whenever
+bella_vista.txt changes, ``sync`` compares content hashes of the new chunks with
+the stored ones. Only new chunks are embedded and added; removed chunks are
+tombstoned (hidden from search) and physically dropped by ``compact`` once they
+make up ``compact_ratio`` of the index.
+
+Every change is appended to a write-ahead log, including the vectors, and
+fsynced before it is applied. A crash therefore loses nothing: on open the last
+snapshot is loaded and the log is replayed without calling the embedding API.
+``compact`` writes a new snapshot generation and switches the ``CURRENT`` file
+atomically, then the old snapshot and its log are removed.
+
+    index_incremental/
+        CURRENT                 name of the live generation, e.g. "snap-000003"
+        snap-000003/            FAISS save_local + state.json (hashes, tombstones)
+        snap-000003.wal         changes since that snapshot, one JSON line each
+
+    python incremental_store.py bella_vista.txt
+"""
+
+import base64
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores.faiss import FAISS, dependable_faiss_import
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+
+def content_hash(text: str, metadata: Optional[dict] = None) -> str:
+    source = (metadata or {}).get("source", "")
+    return hashlib.sha256(f"{source}\x1f{text}".encode("utf-8")).hexdigest()
+
+
+def _encode_vector(vector) -> str:
+    return base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode("ascii")
+
+
+def _decode_vector(data: str) -> List[float]:
+    return np.frombuffer(base64.b64decode(data), dtype=np.float32).tolist()
+
+
+def _fsync(path: Path) -> None:
+    """Flush a file, or a directory's entries, to disk."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_atomic(path: Path, text: str) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    _fsync(path.parent)
+
+
+class IncrementalFAISS(VectorStore):
+    """FAISS store with content-hash deduplication, tombstones and a WAL.
+
+    Use ``open`` rather than the constructor.
+
+    Args:
+        path: Directory holding snapshots, the log and ``CURRENT``.
+        embedding: Embeddings for new chunks and queries.
+        compact_ratio: Compact once tombstones exceed this share of the index.
+    """
+
+    def __init__(self, path: str, embedding: Embeddings, compact_ratio: float = 0.2):
+        self.path = Path(path)
+        self.embedding = embedding
+        self.compact_ratio = compact_ratio
+        self.store: Optional[FAISS] = None
+        self.hashes: Dict[str, str] = {}  # content hash -> docstore id
+        self.tombstones = set()
+        self.generation = 0
+        self._wal = None
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    # -- persistence ---------------------------------------------------------
+
+    @classmethod
+    def open(cls, path: str, embedding: Embeddings, compact_ratio: float = 0.2) -> "IncrementalFAISS":
+        """Load the current snapshot and replay its log (no embedding calls)."""
+        self = cls(path, embedding, compact_ratio)
+        self.path.mkdir(parents=True, exist_ok=True)
+        current = self.path / "CURRENT"
+        if current.exists():
+            name = current.read_text(encoding="utf-8").strip()
+            self.generation = int(name.split("-")[1])
+            snapshot = self.path / name
+            self.store = FAISS.load_local(str(snapshot), embedding, allow_dangerous_deserialization=True)
+            state = json.loads((snapshot / "state.json").read_text(encoding="utf-8"))
+            self.hashes = state["hashes"]
+            self.tombstones = set(state["tombstones"])
+        self._replay()
+        self._wal = open(self._wal_path(), "a", encoding="utf-8")
+        return self
+
+    def _snapshot_name(self, generation: int) -> str:
+        return f"snap-{generation:06d}"
+
+    def _wal_path(self, generation: Optional[int] = None) -> Path:
+        name = self._snapshot_name(self.generation if generation is None else generation)
+        return self.path / f"{name}.wal"
+
+    def _replay(self) -> None:
+        wal = self._wal_path()
+        if not wal.exists():
+            return
+        valid = 0
+        with open(wal, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A record torn by a crash is the last line; drop it and everything after
+                    break
+                self._apply(record)
+                valid += len(line)
+        with open(wal, "r+b") as f:
+            f.truncate(valid)
+
+    def _log(self, records: List[dict]) -> None:
+        self._wal.write("".join(json.dumps(record) + "\n" for record in records))
+        self._wal.flush()
+        os.fsync(self._wal.fileno())
+
+    def _apply(self, record: dict) -> None:
+        if record["op"] == "add":
+            vector = _decode_vector(record["vector"])
+            if self.store is None:
+                self.store = self._empty_store(len(vector))
+            self.store.add_embeddings(
+                [(record["text"], vector)], metadatas=[record["metadata"]], ids=[record["id"]]
+            )
+            self.hashes[record["hash"]] = record["id"]
+        elif record["op"] == "restore":
+            self.tombstones.discard(record["id"])
+            self.hashes[record["hash"]] = record["id"]
+        elif record["op"] == "delete":
+            self.tombstones.add(record["id"])
+            self.hashes.pop(record["hash"], None)
+
+    def _empty_store(self, dimension: int) -> FAISS:
+        faiss = dependable_faiss_import()
+        return FAISS(self.embedding, faiss.IndexFlatL2(dimension), InMemoryDocstore(), {})
+
+    def compact(self) -> None:
+        """Drop tombstoned vectors and write a new snapshot generation."""
+        if self.store is None:
+            return
+        if self.tombstones:
+            self.store.delete(list(self.tombstones))
+            self.tombstones.clear()
+
+        old_generation = self.generation
+        new_name = self._snapshot_name(old_generation + 1)
+        snapshot = self.path / new_name
+        self.store.save_local(str(snapshot))
+        _write_atomic(snapshot / "state.json", json.dumps({"hashes": self.hashes, "tombstones": []}))
+        # save_local does not fsync; the snapshot must be on disk before CURRENT names it
+        for name in ("index.faiss", "index.pkl"):
+            _fsync(snapshot / name)
+        _fsync(snapshot)
+        _fsync(self.path)
+        # The switch to the new generation is the atomic rename of CURRENT
+        _write_atomic(self.path / "CURRENT", new_name)
+
+        self._wal.close()
+        self.generation = old_generation + 1
+        self._wal = open(self._wal_path(), "a", encoding="utf-8")
+        shutil.rmtree(self.path / self._snapshot_name(old_generation), ignore_errors=True)
+        self._wal_path(old_generation).unlink(missing_ok=True)
+
+    def _maybe_compact(self) -> None:
+        if self.store is not None and len(self.tombstones) > self.compact_ratio * max(1, self.store.index.ntotal):
+            self.compact()
+
+    def close(self) -> None:
+        if self._wal is not None:
+            self._wal.close()
+            self._wal = None
+
+    # -- updates -------------------------------------------------------------
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, **kwargs: Any) -> List[str]:
+        """Add texts whose content hash is not stored yet; returns all their ids."""
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        new: Dict[str, Tuple[str, dict]] = {}
+        for text, metadata in zip(texts, metadatas):
+            digest = content_hash(text, metadata)
+            if digest not in self.hashes:
+                new.setdefault(digest, (text, metadata))
+
+        # Chunks deleted earlier but not compacted away yet still have their vector
+        records = []
+        for digest in list(new):
+            if digest[:32] in self.tombstones:
+                del new[digest]
+                records.append({"op": "restore", "id": digest[:32], "hash": digest})
+        if new:
+            vectors = self.embedding.embed_documents([text for text, _ in new.values()])
+            records += [
+                {
+                    "op": "add",
+                    "id": digest[:32],
+                    "hash": digest,
+                    "text": text,
+                    "metadata": metadata,
+                    "vector": _encode_vector(vector),
+                }
+                for (digest, (text, metadata)), vector in zip(new.items(), vectors)
+            ]
+        if records:
+            self._log(records)
+            for record in records:
+                self._apply(record)
+        return [self.hashes[content_hash(text, metadata)] for text, metadata in zip(texts, metadatas)]
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """Tombstone the given docstore ids."""
+        by_id = {doc_id: digest for digest, doc_id in self.hashes.items()}
+        records = [{"op": "delete", "id": doc_id, "hash": by_id[doc_id]} for doc_id in ids or [] if doc_id in by_id]
+        if records:
+            self._log(records)
+            for record in records:
+                self._apply(record)
+            self._maybe_compact()
+        return True
+
+    def sync(self, documents: List[Document]) -> Dict[str, int]:
+        """Make the store contain exactly ``documents``; embeds only new chunks."""
+        wanted = {content_hash(doc.page_content, doc.metadata) for doc in documents}
+        removed = [doc_id for digest, doc_id in self.hashes.items() if digest not in wanted]
+        before = len(self.hashes)
+        self.add_texts([doc.page_content for doc in documents], [doc.metadata for doc in documents])
+        added = len(self.hashes) - before
+        self.delete(removed)
+        return {"added": added, "deleted": len(removed), "unchanged": len(wanted) - added}
+
+    # -- search --------------------------------------------------------------
+
+    def similarity_search_with_score_by_vector(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        if self.store is None or not self.store.index.ntotal:
+            return []
+        # Over-fetch by the number of tombstones, compaction keeps that bounded
+        fetch_k = min(self.store.index.ntotal, k + len(self.tombstones))
+        scores, indices = self.store.index.search(np.asarray([embedding], dtype=np.float32), fetch_k)
+        results = []
+        for score, i in zip(scores[0], indices[0]):
+            if i == -1:
+                continue
+            doc_id = self.store.index_to_docstore_id[i]
+            if doc_id in self.tombstones:
+                continue
+            results.append((self.store.docstore.search(doc_id), float(score)))
+            if len(results) == k:
+                break
+        return results
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def _select_relevance_score_fn(self):
+        return self._euclidean_relevance_score_fn
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        path: str = "index_incremental",
+        **kwargs: Any,
+    ) -> "IncrementalFAISS":
+        store = cls.open(path, embedding, **kwargs)
+        store.add_texts(texts, metadatas)
+        return store
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    from dotenv import find_dotenv, load_dotenv
+    from langchain_community.document_loaders import TextLoader
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    parser = argparse.ArgumentParser(description="Sync a text file into the incremental FAISS store")
+    parser.add_argument("file", nargs="?", default="bella_vista.txt")
+    parser.add_argument("--path", default="index_incremental")
+    parser.add_argument("--compact", action="store_true", help="Compact after syncing")
+    args = parser.parse_args()
+
+    load_dotenv(find_dotenv())
+    embeddings = GoogleGenerativeAIEmbeddings(model="gemini-embedding-001")
+    splitter = RecursiveCharacterTextSplitter(chunk_size=100, chunk_overlap=20)
+    documents = splitter.split_documents(TextLoader(args.file).load())
+
+    start = time.perf_counter()
+    store = IncrementalFAISS.open(args.path, embeddings)
+    opened = time.perf_counter()
+    result = store.sync(documents)
+    synced = time.perf_counter()
+    if args.compact:
+        store.compact()
+    store.close()
+    print(
+        f"{result} - open {1000 * (opened - start):.1f} ms, "
+        f"sync {1000 * (synced - opened):.1f} ms, tombstones {len(store.tombstones)}"
+    )
@@ -0,0 +1,377 @@
+"""FAISS vector store split into independent shards on disk.
+
+Chunks are assigned to one of N shards by a stable hash of their text. Every
+shard is an ordinary LangChain FAISS store in its own directory, so a shard can
+be added to, rebuilt or moved to another machine without touching the others.
+The shard of a chunk depends on N, so changing the number of shards moves
+almost every chunk: ``reshard`` rebuilds all shards from their stored vectors
+(no embedding calls) instead of adding shards in place.
+
+    index_sharded/
+        manifest.json
+        shard-000/index.faiss, index.pkl
+        shard-001/...
+
+A query is embedded once, every shard is searched in a thread pool (FAISS
+releases the GIL while searching) and the per-shard top-k lists are merged.
+
+    python sharded_store.py build --source index --out index_sharded --shards 4
+    python sharded_store.py reshard --path index_sharded --out index_sharded_8 --shards 8
+    python sharded_store.py bench
+"""
+
+import heapq
+import json
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores.faiss import FAISS, dependable_faiss_import
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+MANIFEST = "manifest.json"
+
+
+def shard_of(text: str, num_shards: int) -> int:
+    """Stable shard number for a chunk text."""
+    return zlib.crc32(text.encode("utf-8")) % num_shards
+
+
+def _shard_dir(path: Path, shard: int) -> Path:
+    return path / f"shard-{shard:03d}"
+
+
+def _stored(store: FAISS) -> List[Tuple[str, List[float], dict]]:
+    """(text, vector, metadata) of every chunk of a FAISS store, in index order."""
+    vectors = store.index.reconstruct_n(0, store.index.ntotal)
+    docs = [store.docstore.search(store.index_to_docstore_id[i]) for i in range(store.index.ntotal)]
+    return [(doc.page_content, vector.tolist(), doc.metadata) for doc, vector in zip(docs, vectors)]
+
+
+class ShardedFAISS(VectorStore):
+    """Vector store searching ``num_shards`` FAISS stores concurrently.
+
+    Args:
+        embedding: Embeddings used for queries and new texts.
+        shards: One FAISS store per shard.
+        path: Directory the shards are saved to, if any.
+        max_workers: Threads searching the shards, defaults to one per shard.
+
+    Call ``close`` to stop the search threads once the store is no longer used.
+    """
+
+    def __init__(
+        self,
+        embedding: Embeddings,
+        shards: List[FAISS],
+        path: Optional[str] = None,
+        max_workers: Optional[int] = None,
+    ):
+        self.embedding = embedding
+        self.shards = shards
+        self.path = Path(path) if path else None
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or len(shards), thread_name_prefix="faiss-shard")
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    @property
+    def num_shards(self) -> int:
+        return len(self.shards)
+
+    @property
+    def distance_strategy(self) -> DistanceStrategy:
+        return self.shards[0].distance_strategy
+
+    def __len__(self) -> int:
+        return sum(shard.index.ntotal for shard in self.shards)
+
+    # -- building ------------------------------------------------------------
+
+    @staticmethod
+    def _build_shard(
+        embedding: Embeddings,
+        texts: List[str],
+        vectors: List[List[float]],
+        metadatas: List[dict],
+        dimension: int,
+        distance_strategy: DistanceStrategy = DistanceStrategy.EUCLIDEAN_DISTANCE,
+        **kwargs: Any,
+    ) -> FAISS:
+        if texts:
+            return FAISS.from_embeddings(
+                list(zip(texts, vectors)), embedding, metadatas=metadatas, distance_strategy=distance_strategy, **kwargs
+            )
+        # An empty shard still needs an index of the right dimension
+        faiss = dependable_faiss_import()
+        if distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT:
+            index = faiss.IndexFlatIP(dimension)
+        else:
+            index = faiss.IndexFlatL2(dimension)
+        return FAISS(embedding, index, InMemoryDocstore(), {}, distance_strategy=distance_strategy, **kwargs)
+
+    @classmethod
+    def from_embeddings(
+        cls,
+        text_embeddings: Iterable[Tuple[str, List[float]]],
+        embedding: Embeddings,
+        metadatas: Optional[Iterable[dict]] = None,
+        num_shards: int = 4,
+        path: Optional[str] = None,
+        **kwargs: Any,
+    ) -> "ShardedFAISS":
+        """Partition precomputed embeddings into shards and build them in parallel."""
+        text_embeddings = list(text_embeddings)
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in text_embeddings]
+        parts = [([], [], []) for _ in range(num_shards)]
+        for (text, vector), metadata in zip(text_embeddings, metadatas):
+            texts, vectors, metas = parts[shard_of(text, num_shards)]
+            texts.append(text)
+            vectors.append(vector)
+            metas.append(metadata)
+        if text_embeddings:
+            dimension = len(text_embeddings[0][1])
+        else:
+            dimension = len(embedding.embed_query("dimension"))
+
+        with ThreadPoolExecutor(max_workers=num_shards) as pool:
+            shards = list(pool.map(
+                lambda part: cls._build_shard(embedding, *part, dimension=dimension, **kwargs), parts
+            ))
+        store = cls(embedding, shards, path=path)
+        if path:
+            store.save_local(path)
+        return store
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        num_shards: int = 4,
+        path: Optional[str] = None,
+        **kwargs: Any,
+    ) -> "ShardedFAISS":
+        vectors = embedding.embed_documents(texts)
+        return cls.from_embeddings(zip(texts, vectors), embedding, metadatas, num_shards, path, **kwargs)
+
+    @classmethod
+    def from_faiss(cls, store: FAISS, num_shards: int = 4, path: Optional[str] = None) -> "ShardedFAISS":
+        """Split a monolithic FAISS store, reusing its stored vectors (no re-embedding)."""
+        chunks = _stored(store)
+        return cls.from_embeddings(
+            [(text, vector) for text, vector, _ in chunks],
+            store.embedding_function,
+            metadatas=[metadata for _, _, metadata in chunks],
+            num_shards=num_shards,
+            path=path,
+            distance_strategy=store.distance_strategy,
+        )
+
+    def reshard(self, num_shards: int, path: Optional[str] = None) -> "ShardedFAISS":
+        """Return a copy with ``num_shards`` shards, built from the stored vectors (no re-embedding).
+
+        Every chunk moves to the shard it hashes to for the new count. The new
+        store is written to ``path`` if given; this store is left unchanged.
+        """
+        chunks = [chunk for shard in self.shards for chunk in _stored(shard)]
+        return self.from_embeddings(
+            [(text, vector) for text, vector, _ in chunks],
+            self.embedding,
+            metadatas=[metadata for _, _, metadata in chunks],
+            num_shards=num_shards,
+            path=path,
+            distance_strategy=self.distance_strategy,
+        )
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, **kwargs: Any) -> List[str]:
+        """Embed and add texts; only the shards that received texts are saved again."""
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        given_ids = kwargs.pop("ids", None)
+        vectors = self.embedding.embed_documents(texts)
+
+        # One add_embeddings call per shard, ids are returned in input order
+        parts = {}
+        for position, (text, vector, metadata) in enumerate(zip(texts, vectors, metadatas)):
+            parts.setdefault(shard_of(text, self.num_shards), []).append((position, text, vector, metadata))
+        ids = [None] * len(texts)
+        for shard, items in parts.items():
+            shard_ids = self.shards[shard].add_embeddings(
+                [(text, vector) for _, text, vector, _ in items],
+                metadatas=[metadata for _, _, _, metadata in items],
+                ids=[given_ids[position] for position, _, _, _ in items] if given_ids else None,
+                **kwargs,
+            )
+            for (position, _, _, _), doc_id in zip(items, shard_ids):
+                ids[position] = doc_id
+        if self.path:
+            for shard in parts:
+                self._save_shard_files(shard)
+            self._write_manifest()
+        return ids
+
+    def rebuild_shard(self, shard: int, docs: List[Document]) -> None:
+        """Replace one shard with freshly embedded ``docs`` (which must belong to it)."""
+        wrong = [doc for doc in docs if shard_of(doc.page_content, self.num_shards) != shard]
+        if wrong:
+            raise ValueError(f"{len(wrong)} documents do not belong to shard {shard}")
+        texts = [doc.page_content for doc in docs]
+        vectors = self.embedding.embed_documents(texts) if texts else []
+        self.shards[shard] = self._build_shard(
+            self.embedding,
+            texts,
+            vectors,
+            [doc.metadata for doc in docs],
+            dimension=self.shards[shard].index.d,
+            distance_strategy=self.distance_strategy,
+        )
+        if self.path:
+            self.save_shard(shard)
+
+    # -- persistence ---------------------------------------------------------
+
+    def _save_shard_files(self, shard: int) -> None:
+        self.shards[shard].save_local(str(_shard_dir(self.path, shard)))
+
+    def _write_manifest(self) -> None:
+        manifest = {
+            "num_shards": self.num_shards,
+            "distance_strategy": self.distance_strategy.value,
+            "sizes": [shard.index.ntotal for shard in self.shards],
+        }
+        (self.path / MANIFEST).write_text(json.dumps(manifest, indent=1), encoding="utf-8")
+
+    def save_shard(self, shard: int) -> None:
+        """Save one shard and the manifest (whose sizes cover every shard)."""
+        self._save_shard_files(shard)
+        self._write_manifest()
+
+    def save_local(self, path: str) -> None:
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        for shard in range(self.num_shards):
+            self._save_shard_files(shard)
+        self._write_manifest()
+
+    @classmethod
+    def load_local(cls, path: str, embeddings: Embeddings, max_workers: Optional[int] = None, **kwargs: Any) -> "ShardedFAISS":
+        """Load all shards in parallel. ``kwargs`` go to ``FAISS.load_local``."""
+        root = Path(path)
+        manifest = json.loads((root / MANIFEST).read_text(encoding="utf-8"))
+        with ThreadPoolExecutor(max_workers=manifest["num_shards"]) as pool:
+            shards = list(pool.map(
+                lambda shard: FAISS.load_local(str(_shard_dir(root, shard)), embeddings, **kwargs),
+                range(manifest["num_shards"]),
+            ))
+        return cls(embeddings, shards, path=path, max_workers=max_workers)
+
+    def close(self) -> None:
+        """Stop the search threads."""
+        self.executor.shutdown(wait=True)
+
+    # -- search --------------------------------------------------------------
+
+    def similarity_search_with_score_by_vector(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        vector = np.asarray(embedding, dtype=np.float32)
+        futures = [
+            self.executor.submit(shard.similarity_search_with_score_by_vector, vector, k, **kwargs)
+            for shard in self.shards
+            if shard.index.ntotal
+        ]
+        results = [hit for future in futures for hit in future.result()]
+        # Inner-product scores rank high-first, distances low-first
+        if self.distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT:
+            return heapq.nlargest(k, results, key=lambda hit: hit[1])
+        return heapq.nsmallest(k, results, key=lambda hit: hit[1])
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k, **kwargs)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        return self.shards[0]._select_relevance_score_fn()
+
+
+def benchmark(num_vectors: int = 200_000, dimension: int = 768, shard_counts=(1, 2, 4, 8), queries: int = 200):
+    """Build time and query latency against shard count, on random vectors."""
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+
+    embedding = DeterministicFakeEmbedding(size=dimension)
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((num_vectors, dimension), dtype=np.float32)
+    text_embeddings = [(f"chunk {i}", vector) for i, vector in enumerate(vectors)]
+    query_vectors = rng.standard_normal((queries, dimension), dtype=np.float32)
+
+    print(f"{num_vectors} vectors, {dimension} dims, flat L2 index")
+    for num_shards in shard_counts:
+        start = time.perf_counter()
+        store = ShardedFAISS.from_embeddings(text_embeddings, embedding, num_shards=num_shards)
+        build = time.perf_counter() - start
+
+        latencies = []
+        for vector in query_vectors:
+            start = time.perf_counter()
+            store.similarity_search_with_score_by_vector(vector, k=4)
+            latencies.append(time.perf_counter() - start)
+        store.close()
+        latencies.sort()
+        print(
+            f"{num_shards} shards: build {build:.1f}s, "
+            f"query p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+            f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from dotenv import find_dotenv, load_dotenv
+
+    parser = argparse.ArgumentParser(description="Sharded FAISS store")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="Split an existing FAISS index into shards")
+    build.add_argument("--source", default="index")
+    build.add_argument("--out", default="index_sharded")
+    build.add_argument("--shards", type=int, default=4)
+    reshard = subparsers.add_parser("reshard", help="Rebuild a sharded index with another number of shards")
+    reshard.add_argument("--path", default="index_sharded")
+    reshard.add_argument("--out", required=True)
+    reshard.add_argument("--shards", type=int, required=True)
+    bench = subparsers.add_parser("bench", help="Query latency and build time against shard count")
+    bench.add_argument("--vectors", type=int, default=200_000)
+    bench.add_argument("--dim", type=int, default=768)
+    args = parser.parse_args()
+
+    if args.command in ("build", "reshard"):
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+        load_dotenv(find_dotenv())
+        embeddings = GoogleGenerativeAIEmbeddings(model="gemini-embedding-001")
+        if args.command == "build":
+            source = FAISS.load_local(args.source, embeddings, allow_dangerous_deserialization=True)
+            store = ShardedFAISS.from_faiss(source, num_shards=args.shards, path=args.out)
+        else:
+            source = ShardedFAISS.load_local(args.path, embeddings, allow_dangerous_deserialization=True)
+            store = source.reshard(args.shards, path=args.out)
+            source.close()
+        print(f"{len(store)} vectors in {store.num_shards} shards written to {args.out}")
+        store.close()
+    else:
+        benchmark(args.vectors, args.dim)
@@ -0,0 +1,148 @@
+"""Vectorized similarity helpers for embedding matrices.
+
+All functions work on 2D float32 matrices with one embedding per row. Rows are
+L2-normalized once, so cosine similarity becomes a plain matrix product.
+All-pairs searches are computed block by block, so memory stays bounded by
+``block_size * n`` instead of ``n * n``.
+"""
+
+import numpy as np
+
+
+def normalize(vectors):
+    """Return a float32 copy of ``vectors`` with every row scaled to unit length."""
+    matrix = np.array(vectors, dtype=np.float32, ndmin=2)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def cosine_similarity(A, B):
+    """Cosine similarity between two vectors, or between the rows of two matrices."""
+    a = normalize(A)
+    b = normalize(B)
+    scores = a @ b.T
+    if np.ndim(A) == 1 and np.ndim(B) == 1:
+        return float(scores[0, 0])
+    return scores
+
+
+def top_k(queries, corpus, k=4, block_size=4096, normalized=False):
+    """Top-k most similar corpus rows for every query row.
+
+    Returns ``(scores, indices)``, both shaped ``(len(queries), k)`` and sorted by
+    descending similarity.
+    """
+    if not normalized:
+        queries = normalize(queries)
+        corpus = normalize(corpus)
+    k = min(k, len(corpus))
+    scores = np.empty((len(queries), k), dtype=np.float32)
+    indices = np.empty((len(queries), k), dtype=np.int64)
+
+    for start in range(0, len(queries), block_size):
+        block = queries[start : start + block_size] @ corpus.T
+        scores[start : start + len(block)], indices[start : start + len(block)] = (
+            _block_top_k(block, k)
+        )
+    return scores, indices
+
+
+def all_pairs_top_k(embeddings, k=4, block_size=4096, normalized=False):
+    """Top-k nearest neighbours of every row within the same matrix, excluding itself."""
+    if not normalized:
+        embeddings = normalize(embeddings)
+    n = len(embeddings)
+    k = min(k, n - 1)
+    scores = np.empty((n, k), dtype=np.float32)
+    indices = np.empty((n, k), dtype=np.int64)
+
+    for start in range(0, n, block_size):
+        block = embeddings[start : start + block_size] @ embeddings.T
+        rows = np.arange(len(block))
+        block[rows, start + rows] = -np.inf
+        scores[start : start + len(block)], indices[start : start + len(block)] = (
+            _block_top_k(block, k)
+        )
+    return scores, indices
+
+
+def near_duplicate_pairs(embeddings, threshold=0.95, block_size=4096, normalized=False):
+    """All index pairs ``(i, j)`` with ``i < j`` whose similarity is at least ``threshold``.
+
+    Returns ``(pairs, scores)`` where ``pairs`` has shape ``(m, 2)``.
+    """
+    if not normalized:
+        embeddings = normalize(embeddings)
+    n = len(embeddings)
+    found_pairs = []
+    found_scores = []
+
+    for start in range(0, n, block_size):
+        block = embeddings[start : start + block_size] @ embeddings[start:].T
+        rows, cols = np.nonzero(block >= threshold)
+        # Only keep the upper triangle so every pair is reported once
+        upper = cols > rows
+        rows, cols = rows[upper], cols[upper]
+        found_pairs.append(np.stack([rows + start, cols + start], axis=1))
+        found_scores.append(block[rows, cols])
+
+    if not found_pairs:
+        return np.empty((0, 2), dtype=np.int64), np.empty(0, dtype=np.float32)
+    return np.concatenate(found_pairs), np.concatenate(found_scores)
+
+
+def cluster_duplicates(embeddings, threshold=0.95, block_size=4096, normalized=False):
+    """Group rows into near-duplicate clusters.
+
+    Returns a list of clusters (lists of row indices, smallest index first) that
+    contain more than one row.
+    """
+    pairs, _ = near_duplicate_pairs(embeddings, threshold, block_size, normalized)
+    parent = np.arange(len(embeddings))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in pairs:
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    clusters = {}
+    for i in range(len(embeddings)):
+        clusters.setdefault(find(i), []).append(i)
+    return [members for members in clusters.values() if len(members) > 1]
+
+
+def _block_top_k(block, k):
+    if k <= 0:
+        empty = np.empty((len(block), 0))
+        return empty, empty
+    # argpartition is O(n) per row; only the k survivors get sorted
+    part = np.argpartition(-block, k - 1, axis=1)[:, :k]
+    part_scores = np.take_along_axis(block, part, axis=1)
+    order = np.argsort(-part_scores, axis=1)
+    return (
+        np.take_along_axis(part_scores, order, axis=1),
+        np.take_along_axis(part, order, axis=1),
+    )
+
+
+if __name__ == "__main__":
+    import time
+
+    rng = np.random.default_rng(0)
+    corpus = normalize(rng.standard_normal((20_000, 768)))
+    corpus[1] = corpus[0]
+
+    start = time.perf_counter()
+    scores, indices = all_pairs_top_k(corpus, k=5, normalized=True)
+    print(f"all_pairs_top_k on {len(corpus)} rows: {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    clusters = cluster_duplicates(corpus, threshold=0.99, normalized=True)
+    print(f"cluster_duplicates: {time.perf_counter() - start:.2f}s, clusters: {clusters}")
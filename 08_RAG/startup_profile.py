@@ -0,0 +1,91 @@
+"""Cold-start benchmark for the FastAPI services.
+
+Reports the heaviest imports (``python -X importtime``) of a service module and
+measures, for a fresh uvicorn process, the time until the port accepts
+connections and the time until the readiness endpoint returns 200.
+
+    python startup_profile.py
+    python startup_profile.py --app-dir ../12_MicroServiceArchitecture/service3 --module app --ready-path /service3/ready
+"""
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+
+def import_profile(module, app_dir=".", top=15):
+    """``(cumulative seconds, package)`` of the slowest imports, and the total."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=app_dir,
+        capture_output=True,
+        text=True,
+    )
+    timings = []
+    for line in result.stderr.splitlines():
+        # "import time:       self [us] |      cumulative | imported package"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, package = line[len("import time:"):].split("|")
+        timings.append((int(cumulative) / 1e6, package.rstrip()))
+    total = timings[-1][0] if timings else 0.0
+    top_level = [timing for timing in timings if not timing[1].startswith("  ")]
+    return sorted(top_level, reverse=True)[:top], total, result.returncode
+
+
+def _wait(condition, start, timeout):
+    """Seconds since ``start`` when ``condition`` first holds, None on timeout."""
+    while time.perf_counter() - start < timeout:
+        if condition():
+            return time.perf_counter() - start
+        time.sleep(0.02)
+    return None
+
+
+def startup_times(module, app_dir=".", port=5599, ready_path="/ready", timeout=120):
+    """Seconds from process start to listening and to ready (None on timeout)."""
+    def listening():
+        with socket.socket() as sock:
+            return sock.connect_ex(("127.0.0.1", port)) == 0
+
+    def ready():
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}{ready_path}", timeout=1) as response:
+                return response.status == 200
+        except (urllib.error.URLError, OSError):
+            return False
+
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", f"{module}:app", "--port", str(port), "--log-level", "warning"],
+        cwd=app_dir,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    try:
+        return _wait(listening, start, timeout), _wait(ready, start, timeout)
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import-time profile and cold-start times of a FastAPI service")
+    parser.add_argument("--app-dir", default=".")
+    parser.add_argument("--module", default="api")
+    parser.add_argument("--ready-path", default="/ready")
+    parser.add_argument("--port", type=int, default=5599)
+    args = parser.parse_args()
+
+    top, total, returncode = import_profile(args.module, args.app_dir)
+    print(f"import {args.module}: {total:.3f}s" + ("" if returncode == 0 else " (import failed)"))
+    for seconds, package in top:
+        print(f"  {seconds:8.3f}s  {package.strip()}")
+
+    listen, ready = startup_times(args.module, args.app_dir, args.port, args.ready_path)
+    print(f"listening after {listen:.2f}s" if listen is not None else "never listened")
+    print(f"ready after {ready:.2f}s" if ready is not None else "not ready before the timeout")
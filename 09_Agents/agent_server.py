@@ -0,0 +1,300 @@
+"""HTTP service serving `create_agent` threads concurrently.
+
+* Turns of the same thread_id run one after another (per-thread lock), while
+  different threads run in parallel on the event loop.
+* A middleware limits the number of in-flight model calls for the whole process.
+* `/threads/{thread_id}/stream` streams model and tool steps as NDJSON.
+
+Run with Gemini:
+    uvicorn agent_server:app --port 5577
+
+Load test with a fake model (no API key needed):
+    AGENT_FAKE_MODEL=1 AGENT_DB=load.sqlite python agent_server.py --load-test --threads 1000 --turns 3
+
+A local SQLite file is faster than the disks the service usually runs on.
+AGENT_CHECKPOINT_DELAY_MS adds a blocking delay to every checkpoint read and
+write, like a slow or networked disk. The load test reports the worst
+event-loop stall, which stays small only while checkpoint I/O is kept off the loop.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List
+
+from dotenv import find_dotenv, load_dotenv
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from langchain.agents import create_agent
+from langchain.agents.middleware import AgentMiddleware
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.tools import tool
+from pydantic import BaseModel
+
+from compact_checkpointer import CompactSqliteSaver
+from course_utils.rate_limiter import INTERACTIVE, SharedRateLimiter, limiter_from_env
+
+load_dotenv(find_dotenv())
+
+MAX_INFLIGHT_MODEL_CALLS = int(os.getenv("MAX_INFLIGHT_MODEL_CALLS", "32"))
+CHECKPOINT_DELAY = float(os.getenv("AGENT_CHECKPOINT_DELAY_MS", "0")) / 1000
+
+
+@tool
+def fake_weather_api(city: str) -> str:
+    """
+    Check the weather in a specified city.
+
+    Args:
+        city (str): The name of the city where you want to check the weather.
+
+    Returns:
+        str: A description of the current weather in the specified city.
+    """
+    return "Sunny, 22°C"
+
+
+tools = [fake_weather_api]
+
+
+class ModelConcurrencyLimit(AgentMiddleware):
+    """Allow at most ``limit`` model calls in flight across all threads."""
+
+    def __init__(self, limit: int):
+        super().__init__()
+        self.semaphore = asyncio.Semaphore(limit)
+        self.waiting = 0
+
+    async def awrap_model_call(self, request, handler):
+        self.waiting += 1
+        async with self.semaphore:
+            self.waiting -= 1
+            return await handler(request)
+
+
+class RateLimitMiddleware(AgentMiddleware):
+    """Route model calls through the rate limiter shared with the other Gemini services."""
+
+    def __init__(self, limiter: SharedRateLimiter, priority: str = INTERACTIVE):
+        super().__init__()
+        self.limiter = limiter
+        self.priority = priority
+
+    async def awrap_model_call(self, request, handler):
+        tokens = self.limiter.estimate_tokens(request.messages)
+        return await self.limiter.acall(lambda: handler(request), self.priority, tokens)
+
+
+class FakeAgentModel(GenericFakeChatModel):
+    """Fake chat model with a fixed latency, for load tests."""
+
+    latency: float = 0.2
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    async def _agenerate(self, *args: Any, **kwargs: Any):
+        await asyncio.sleep(self.latency)
+        return await super()._agenerate(*args, **kwargs)
+
+
+class SlowDiskSaver(CompactSqliteSaver):
+    """CompactSqliteSaver with a blocking delay per call, for load tests."""
+
+    def __init__(self, path: str, delay: float, **kwargs: Any):
+        super().__init__(path, **kwargs)
+        self.delay = delay
+
+    def get_tuple(self, config):
+        time.sleep(self.delay)
+        return super().get_tuple(config)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        time.sleep(self.delay)
+        return super().put(config, checkpoint, metadata, new_versions)
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        time.sleep(self.delay)
+        return super().put_writes(config, writes, task_id, task_path)
+
+
+def fake_messages():
+    while True:
+        yield AIMessage(content="Sunny, 22°C, matey!")
+
+
+class ThreadLocks:
+    """asyncio locks per thread_id that are dropped once nobody uses them."""
+
+    def __init__(self):
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._users: Dict[str, int] = {}
+
+    @asynccontextmanager
+    async def hold(self, thread_id: str):
+        lock = self._locks.setdefault(thread_id, asyncio.Lock())
+        self._users[thread_id] = self._users.get(thread_id, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._users[thread_id] -= 1
+            if not self._users[thread_id]:
+                del self._users[thread_id]
+                del self._locks[thread_id]
+
+    def __len__(self):
+        return len(self._locks)
+
+
+class Turn(BaseModel):
+    message: str
+
+
+def build_agent(fake: bool = False):
+    limiter = ModelConcurrencyLimit(MAX_INFLIGHT_MODEL_CALLS)
+    middleware = [limiter]
+    if fake:
+        model = FakeAgentModel(messages=fake_messages())
+    else:
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        # 429s are retried by the shared rate limiter, with jitter
+        model = ChatGoogleGenerativeAI(model="gemini-2.5-flash", max_retries=0)
+        middleware.append(RateLimitMiddleware(limiter_from_env()))
+    path = os.getenv("AGENT_DB", "agents.sqlite")
+    checkpointer = SlowDiskSaver(path, CHECKPOINT_DELAY) if CHECKPOINT_DELAY else CompactSqliteSaver(path)
+    agent = create_agent(
+        model,
+        tools=tools,
+        system_prompt="You are a helpful assistant",
+        middleware=middleware,
+        checkpointer=checkpointer,
+    )
+    return agent, limiter
+
+
+def serialize_message(message: BaseMessage) -> Dict[str, Any]:
+    data = {"type": message.type, "content": message.content}
+    if getattr(message, "tool_calls", None):
+        data["tool_calls"] = message.tool_calls
+    if getattr(message, "name", None):
+        data["name"] = message.name
+    return data
+
+
+agent, limiter = build_agent(fake=bool(os.getenv("AGENT_FAKE_MODEL")))
+thread_locks = ThreadLocks()
+stats = {"turns": 0, "active_turns": 0}
+app = FastAPI()
+
+
+def turn_input(turn: Turn, thread_id: str):
+    return (
+        {"messages": [{"role": "user", "content": turn.message}]},
+        {"configurable": {"thread_id": thread_id}},
+    )
+
+
+@app.post("/threads/{thread_id}/invoke")
+async def invoke(thread_id: str, turn: Turn):
+    async with thread_locks.hold(thread_id):
+        stats["active_turns"] += 1
+        try:
+            result = await agent.ainvoke(*turn_input(turn, thread_id))
+        except Exception as e:
+            raise HTTPException(detail=str(e), status_code=500)
+        finally:
+            stats["active_turns"] -= 1
+            stats["turns"] += 1
+    return {"thread_id": thread_id, "reply": result["messages"][-1].content}
+
+
+@app.post("/threads/{thread_id}/stream")
+async def stream(thread_id: str, turn: Turn):
+    async def events():
+        async with thread_locks.hold(thread_id):
+            stats["active_turns"] += 1
+            try:
+                async for update in agent.astream(*turn_input(turn, thread_id), stream_mode="updates"):
+                    for step, values in update.items():
+                        messages: List[BaseMessage] = (values or {}).get("messages", [])
+                        for message in messages:
+                            yield json.dumps({"step": step, "message": serialize_message(message)}) + "\n"
+            except Exception as e:
+                yield json.dumps({"error": str(e)}) + "\n"
+            finally:
+                stats["active_turns"] -= 1
+                stats["turns"] += 1
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+@app.get("/stats")
+async def get_stats():
+    return {
+        **stats,
+        "locked_threads": len(thread_locks),
+        "waiting_model_calls": limiter.waiting,
+        "max_inflight_model_calls": MAX_INFLIGHT_MODEL_CALLS,
+    }
+
+
+async def load_test(threads: int, turns: int):
+    """Drive the app in-process with concurrent threads and report latency."""
+    import httpx
+
+    latencies = []
+    stalls = [0.0]
+
+    async def watch_loop(interval=0.01):
+        # How late the loop wakes up: blocking calls on the loop show up here
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            stalls[0] = max(stalls[0], time.perf_counter() - start - interval)
+
+    async def conversation(client, thread_id):
+        for turn in range(turns):
+            start = time.perf_counter()
+            response = await client.post(
+                f"/threads/{thread_id}/invoke", json={"message": f"Weather in Berlin? ({turn})"}
+            )
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://agent", timeout=None) as client:
+        watcher = asyncio.create_task(watch_loop())
+        start = time.perf_counter()
+        await asyncio.gather(*(conversation(client, f"load-{i}") for i in range(threads)))
+        elapsed = time.perf_counter() - start
+        watcher.cancel()
+
+    latencies.sort()
+    print(f"{threads} threads x {turns} turns in {elapsed:.2f}s ({len(latencies) / elapsed:.1f} turns/s)")
+    print(
+        f"p50 {latencies[len(latencies) // 2] * 1000:.0f} ms, "
+        f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.0f} ms, "
+        f"worst event-loop stall {stalls[0] * 1000:.0f} ms "
+        f"(checkpoint delay {CHECKPOINT_DELAY * 1000:.0f} ms)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent agent service")
+    parser.add_argument("--load-test", action="store_true", help="Run an in-process load test")
+    parser.add_argument("--threads", type=int, default=1000)
+    parser.add_argument("--turns", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.load_test:
+        asyncio.run(load_test(args.threads, args.turns))
+    else:
+        import uvicorn
+
+        uvicorn.run(app, host="0.0.0.0", port=5577)
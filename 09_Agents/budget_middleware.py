@@ -0,0 +1,321 @@
+"""Budget enforcement middleware for `create_agent`.
+
+`cap_after_three_messages` in agents.ipynb stops a thread after three messages.
+BudgetMiddleware replaces that cap with real accounting. It tracks tokens, model
+calls and model wall time per thread and globally. Before each model call it:
+
+1. answers trivial turns ("hi", "thanks", ...) with a canned reply,
+2. returns the cached answer for an identical request (same thread, model,
+   system prompt, tools and messages),
+3. refuses the call once a hard budget is exhausted,
+4. trims (or summarizes) the history once a thread is over its soft token budget.
+
+    agent = create_agent(llm, tools=tools, middleware=[BudgetMiddleware()], checkpointer=InMemorySaver())
+
+Run this file for a benchmark with a fake model.
+"""
+
+import dataclasses
+import hashlib
+import json
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+from langchain.agents.middleware import AgentMiddleware, ModelRequest, ModelResponse
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, trim_messages
+from langchain_core.messages.utils import count_tokens_approximately
+from langgraph.config import get_config
+
+TRIVIAL_REPLIES = {
+    r"(hi|hello|hey)( there)?[!.]*": "Hello! How can I help you?",
+    r"(thanks|thank you)( very much| a lot)?[!.]*": "You're welcome!",
+    r"(bye|goodbye)[!.]*": "Goodbye!",
+}
+
+
+@dataclass
+class Budget:
+    """Limits for one thread or for the whole process; None means unlimited."""
+
+    max_tokens: Optional[int] = None
+    max_calls: Optional[int] = None
+    max_seconds: Optional[float] = None
+
+
+@dataclass
+class Usage:
+    tokens: int = 0
+    calls: int = 0
+    seconds: float = 0.0
+
+    def exceeds(self, budget: Budget) -> bool:
+        return (
+            (budget.max_tokens is not None and self.tokens >= budget.max_tokens)
+            or (budget.max_calls is not None and self.calls >= budget.max_calls)
+            or (budget.max_seconds is not None and self.seconds >= budget.max_seconds)
+        )
+
+
+def _current_thread_id() -> str:
+    try:
+        return str(get_config()["configurable"].get("thread_id", "default"))
+    except RuntimeError:
+        return "default"
+
+
+def _request_key(request: ModelRequest, thread_id: str) -> str:
+    # Per thread: an answer is never served to another conversation
+    payload = {
+        "thread": thread_id,
+        "model": getattr(request.model, "model", type(request.model).__name__),
+        "system": request.system_prompt,
+        "tools": sorted(getattr(t, "name", str(t)) for t in request.tools or []),
+        "messages": [[m.type, m.content, getattr(m, "tool_calls", None)] for m in request.messages],
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class BudgetMiddleware(AgentMiddleware):
+    """Token, call and wall-time budgets with caching and short-circuiting.
+
+    Args:
+        thread_budget: Hard limits per thread_id, by default 50,000 tokens and
+            50 model calls.
+        global_budget: Hard limits for all threads of this process together,
+            unlimited by default.
+        soft_thread_tokens: Once a thread has used this many tokens, the history
+            sent to the model is trimmed to ``trim_to_tokens``.
+        trim_to_tokens: Approximate token size of the trimmed history.
+        summarizer: Optional chat model that summarizes the trimmed-away messages
+            into a system message instead of dropping them.
+        cache_size: Number of cached model answers (0 disables the cache).
+        max_threads: Number of threads whose usage is tracked; the least
+            recently active ones are forgotten (their budget starts over).
+        trivial_replies: Regex (matched against the whole lower-cased last user
+            message) to canned reply.
+        exhausted_reply: Answer returned once a hard budget is exhausted.
+    """
+
+    def __init__(
+        self,
+        thread_budget: Optional[Budget] = None,
+        global_budget: Optional[Budget] = None,
+        soft_thread_tokens: int = 20_000,
+        trim_to_tokens: int = 4_000,
+        summarizer: Optional[BaseChatModel] = None,
+        cache_size: int = 1024,
+        max_threads: int = 10_000,
+        trivial_replies: Optional[Dict[str, str]] = None,
+        exhausted_reply: str = "Sorry, the usage budget for this conversation is exhausted.",
+    ):
+        super().__init__()
+        self.thread_budget = thread_budget if thread_budget is not None else Budget(max_tokens=50_000, max_calls=50)
+        self.global_budget = global_budget if global_budget is not None else Budget()
+        self.soft_thread_tokens = soft_thread_tokens
+        self.trim_to_tokens = trim_to_tokens
+        self.summarizer = summarizer
+        self.cache_size = cache_size
+        self.max_threads = max_threads
+        self.trivial_replies = [
+            (re.compile(pattern), reply)
+            for pattern, reply in (TRIVIAL_REPLIES if trivial_replies is None else trivial_replies).items()
+        ]
+        self.exhausted_reply = exhausted_reply
+
+        self.thread_usage: "OrderedDict[str, Usage]" = OrderedDict()
+        self.global_usage = Usage()
+        self.stats = {"model_calls": 0, "cache_hits": 0, "trivial": 0, "blocked": 0, "trimmed": 0}
+        self._cache: "OrderedDict[str, AIMessage]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    # -- steps before the model call ---------------------------------------
+
+    def _trivial_reply(self, request: ModelRequest) -> Optional[AIMessage]:
+        if not request.messages or not isinstance(request.messages[-1], HumanMessage):
+            return None
+        text = str(request.messages[-1].content).strip().lower()
+        for pattern, reply in self.trivial_replies:
+            if pattern.fullmatch(text):
+                return AIMessage(content=reply)
+        return None
+
+    def _usage(self, thread_id: str) -> Usage:
+        with self._lock:
+            usage = self.thread_usage.get(thread_id)
+            if usage is None:
+                usage = self.thread_usage[thread_id] = Usage()
+                while len(self.thread_usage) > self.max_threads:
+                    self.thread_usage.popitem(last=False)
+            else:
+                self.thread_usage.move_to_end(thread_id)
+            return usage
+
+    def _cached(self, key: str) -> Optional[AIMessage]:
+        with self._lock:
+            if key not in self._cache:
+                return None
+            self._cache.move_to_end(key)
+            message = self._cache[key]
+        # A new id and no usage, so the hit is not counted again as model tokens
+        usage = message.usage_metadata and {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+        return message.model_copy(update={"id": str(uuid.uuid4()), "usage_metadata": usage})
+
+    def _remember(self, key: str, message: AIMessage) -> None:
+        if not self.cache_size:
+            return
+        with self._lock:
+            self._cache[key] = message
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _trim(self, request: ModelRequest):
+        """(kept messages, dropped messages); nothing dropped if the history fits."""
+        kept = trim_messages(
+            request.messages,
+            max_tokens=self.trim_to_tokens,
+            token_counter=count_tokens_approximately,
+            strategy="last",
+            start_on="human",
+            include_system=True,
+        )
+        return kept, request.messages[: len(request.messages) - len(kept)]
+
+    def _summary_prompt(self, dropped):
+        return [*dropped, HumanMessage(content="Summarize the conversation so far in a few sentences.")]
+
+    def _shrunk(self, request: ModelRequest, kept, summary: Optional[AIMessage]) -> ModelRequest:
+        messages = kept
+        if summary is not None:
+            messages = [SystemMessage(content=f"Summary of earlier conversation: {summary.content}"), *kept]
+        self.stats["trimmed"] += 1
+        return dataclasses.replace(request, messages=messages)
+
+    def _shrink(self, request: ModelRequest) -> ModelRequest:
+        kept, dropped = self._trim(request)
+        if not dropped:
+            return request
+        summary = self.summarizer.invoke(self._summary_prompt(dropped)) if self.summarizer is not None else None
+        return self._shrunk(request, kept, summary)
+
+    async def _ashrink(self, request: ModelRequest) -> ModelRequest:
+        kept, dropped = self._trim(request)
+        if not dropped:
+            return request
+        summary = None
+        if self.summarizer is not None:
+            summary = await self.summarizer.ainvoke(self._summary_prompt(dropped))
+        return self._shrunk(request, kept, summary)
+
+    def _before(self, request: ModelRequest):
+        """Return (short-circuit answer or None, cache key, thread usage, whether to shrink)."""
+        trivial = self._trivial_reply(request)
+        if trivial is not None:
+            self.stats["trivial"] += 1
+            return trivial, None, None, False
+
+        thread_id = _current_thread_id()
+        usage = self._usage(thread_id)
+        with self._lock:
+            exhausted = usage.exceeds(self.thread_budget) or self.global_usage.exceeds(self.global_budget)
+        if exhausted:
+            self.stats["blocked"] += 1
+            return AIMessage(content=self.exhausted_reply), None, usage, False
+
+        key = _request_key(request, thread_id) if self.cache_size else None
+        cached = self._cached(key) if key else None
+        if cached is not None:
+            self.stats["cache_hits"] += 1
+            return cached, key, usage, False
+
+        return None, key, usage, usage.tokens >= self.soft_thread_tokens
+
+    def _after(self, response: ModelResponse, key: Optional[str], usage: Usage, seconds: float) -> None:
+        tokens = 0
+        for message in response.result:
+            if isinstance(message, AIMessage) and message.usage_metadata:
+                tokens += message.usage_metadata.get("total_tokens", 0)
+        with self._lock:
+            self.stats["model_calls"] += 1
+            for counter in (usage, self.global_usage):
+                counter.tokens += tokens
+                counter.calls += 1
+                counter.seconds += seconds
+        if key and len(response.result) == 1 and isinstance(response.result[0], AIMessage):
+            self._remember(key, response.result[0])
+
+    # -- middleware hooks ----------------------------------------------------
+
+    def wrap_model_call(
+        self, request: ModelRequest, handler: Callable[[ModelRequest], ModelResponse]
+    ) -> ModelResponse | AIMessage:
+        answer, key, usage, shrink = self._before(request)
+        if answer is not None:
+            return answer
+        if shrink:
+            request = self._shrink(request)
+        start = time.perf_counter()
+        response = handler(request)
+        self._after(response, key, usage, time.perf_counter() - start)
+        return response
+
+    async def awrap_model_call(self, request: ModelRequest, handler) -> ModelResponse | AIMessage:
+        answer, key, usage, shrink = self._before(request)
+        if answer is not None:
+            return answer
+        if shrink:
+            request = await self._ashrink(request)
+        start = time.perf_counter()
+        response = await handler(request)
+        self._after(response, key, usage, time.perf_counter() - start)
+        return response
+
+
+if __name__ == "__main__":
+    from itertools import cycle
+
+    from langchain.agents import create_agent
+    from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+    from langgraph.checkpoint.memory import InMemorySaver
+
+    def fake_answers():
+        for i in cycle(range(100)):
+            yield AIMessage(
+                content=f"Answer {i}",
+                usage_metadata={"input_tokens": 800, "output_tokens": 200, "total_tokens": 1000},
+            )
+
+    class CountingModel(GenericFakeChatModel):
+        calls: int = 0
+
+        def _generate(self, *args: Any, **kwargs: Any):
+            self.calls += 1
+            return super()._generate(*args, **kwargs)
+
+    workload = ["hi", "When do you open?", "thanks", "Do you have vegan pizza?", "bye"]
+    threads = 200
+
+    results = {}
+    for name, middleware in [("no middleware", []), ("budget middleware", [BudgetMiddleware()])]:
+        model = CountingModel(messages=fake_answers())
+        agent = create_agent(model, tools=[], middleware=middleware, checkpointer=InMemorySaver())
+        start = time.perf_counter()
+        for thread in range(threads):
+            for text in workload:
+                agent.invoke(
+                    {"messages": [{"role": "user", "content": text}]},
+                    {"configurable": {"thread_id": str(thread)}},
+                )
+        results[name] = (model.calls, time.perf_counter() - start)
+        if middleware:
+            print(middleware[0].stats)
+
+    baseline_calls = results["no middleware"][0]
+    for name, (calls, seconds) in results.items():
+        saved = baseline_calls - calls
+        print(f"{name:>18}: {calls} model calls ({saved} saved), {seconds:.2f}s")
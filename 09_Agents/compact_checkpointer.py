@@ -0,0 +1,419 @@
+"""Disk-backed, delta-encoded checkpointer for `create_agent` threads.
+
+`InMemorySaver()` keeps the complete message list of every checkpoint of every
+thread as Python objects and forgets everything on restart. CompactSqliteSaver
+stores checkpoints in SQLite instead:
+
+* Each checkpoint stores only the messages appended since its parent. Every
+  `snapshot_every` checkpoints a full snapshot is written, so rebuilding a
+  checkpoint never walks more than that many rows.
+* Checkpoint blobs are zlib-compressed.
+* Only the latest state of recently used threads is kept in memory (LRU),
+  bounded by `max_hot_threads` threads and `max_hot_messages` messages in
+  total; threads longer than `max_thread_messages` are never kept. Everything
+  else is loaded from disk on demand.
+* `list()` decodes checkpoints lazily while iterating.
+* The async API runs the SQLite calls in worker threads, so a slow disk does
+  not stall the event loop.
+
+    from compact_checkpointer import CompactSqliteSaver
+
+    agent = create_agent(llm, tools=tools, checkpointer=CompactSqliteSaver("agents.sqlite"))
+"""
+
+import asyncio
+import sqlite3
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+)
+
+MESSAGES_KEY = "messages"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    depth INTEGER NOT NULL,
+    type TEXT,
+    checkpoint BLOB,
+    messages_type TEXT,
+    messages BLOB,
+    metadata_type TEXT,
+    metadata BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT,
+    value BLOB,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+"""
+
+
+class CompactSqliteSaver(BaseCheckpointSaver):
+    """SQLite checkpointer storing per-thread message logs as compressed deltas.
+
+    Args:
+        path: SQLite database file (``":memory:"`` works for experiments).
+        snapshot_every: Write a full message snapshot after this many deltas.
+        max_hot_threads: Number of threads whose latest messages stay in memory.
+        max_hot_messages: Total number of messages kept in memory over all threads.
+        max_thread_messages: Threads with more messages are not kept in memory.
+        compression_level: zlib level used for all blobs.
+    """
+
+    def __init__(
+        self,
+        path: str = "checkpoints.sqlite",
+        snapshot_every: int = 20,
+        max_hot_threads: int = 1000,
+        max_hot_messages: int = 50_000,
+        max_thread_messages: int = 500,
+        compression_level: int = 6,
+        *,
+        serde=None,
+    ):
+        super().__init__(serde=serde)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        self.conn.commit()
+        self.snapshot_every = snapshot_every
+        self.max_hot_threads = max_hot_threads
+        self.max_hot_messages = max_hot_messages
+        self.max_thread_messages = max_thread_messages
+        self.compression_level = compression_level
+        self.lock = threading.RLock()
+        # (thread_id, checkpoint_ns) -> (checkpoint_id, depth, messages)
+        self._hot: "OrderedDict[Tuple[str, str], Tuple[str, int, list]]" = OrderedDict()
+        self._hot_messages = 0
+
+    # -- serialization -----------------------------------------------------
+
+    def _dump(self, obj) -> Tuple[str, bytes]:
+        type_, data = self.serde.dumps_typed(obj)
+        return type_, zlib.compress(data, self.compression_level)
+
+    def _load(self, type_: str, data: bytes):
+        return self.serde.loads_typed((type_, zlib.decompress(data)))
+
+    # -- hot thread cache --------------------------------------------------
+
+    def _forget(self, key):
+        _, _, messages = self._hot.pop(key)
+        self._hot_messages -= len(messages)
+
+    def _remember(self, key, checkpoint_id, depth, messages):
+        if key in self._hot:
+            self._forget(key)
+        if len(messages) > self.max_thread_messages:
+            return
+        self._hot[key] = (checkpoint_id, depth, messages)
+        self._hot_messages += len(messages)
+        while len(self._hot) > self.max_hot_threads or self._hot_messages > self.max_hot_messages:
+            self._forget(next(iter(self._hot)))
+
+    def _load_messages(self, thread_id, checkpoint_ns, checkpoint_id):
+        """Rebuild the full message list by walking back to the last snapshot."""
+        key = (thread_id, checkpoint_ns)
+        hot = self._hot.get(key)
+        if hot is not None and hot[0] == checkpoint_id:
+            self._hot.move_to_end(key)
+            return list(hot[2]), hot[1]
+
+        tails = []
+        current, depth = checkpoint_id, None
+        while current is not None:
+            row = self.conn.execute(
+                "SELECT parent_checkpoint_id, depth, messages_type, messages FROM checkpoints "
+                "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                (thread_id, checkpoint_ns, current),
+            ).fetchone()
+            if row is None:
+                raise LookupError(
+                    f"Checkpoint {current!r} of thread {thread_id!r} is missing, "
+                    f"cannot rebuild the messages of checkpoint {checkpoint_id!r}"
+                )
+            parent_id, row_depth, messages_type, messages = row
+            if depth is None:
+                depth = row_depth
+            if messages is None:
+                # Checkpoint without a messages channel
+                return None, depth
+            tails.append(self._load(messages_type, messages))
+            if row_depth == 0:
+                break
+            current = parent_id
+
+        messages = [message for tail in reversed(tails) for message in tail]
+        return messages, depth or 0
+
+    # -- BaseCheckpointSaver -----------------------------------------------
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        configurable = config["configurable"]
+        thread_id = configurable["thread_id"]
+        checkpoint_ns = configurable.get("checkpoint_ns", "")
+        parent_id = configurable.get("checkpoint_id")
+        key = (thread_id, checkpoint_ns)
+
+        checkpoint = checkpoint.copy()
+        channel_values = dict(checkpoint.get("channel_values", {}))
+        messages = channel_values.pop(MESSAGES_KEY, None)
+        checkpoint["channel_values"] = channel_values
+
+        with self.lock:
+            depth, tail = 0, messages
+            if isinstance(messages, list) and parent_id is not None:
+                parent_messages, parent_depth = self._load_messages(thread_id, checkpoint_ns, parent_id)
+                if (
+                    parent_messages is not None
+                    and parent_depth + 1 < self.snapshot_every
+                    and messages[: len(parent_messages)] == parent_messages
+                ):
+                    depth, tail = parent_depth + 1, messages[len(parent_messages) :]
+
+            type_, data = self._dump(checkpoint)
+            metadata_type, metadata_data = self._dump(metadata)
+            messages_type, messages_data = (None, None) if messages is None else self._dump(tail)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    thread_id,
+                    checkpoint_ns,
+                    checkpoint["id"],
+                    parent_id,
+                    depth,
+                    type_,
+                    data,
+                    messages_type,
+                    messages_data,
+                    metadata_type,
+                    metadata_data,
+                ),
+            )
+            self.conn.commit()
+            if isinstance(messages, list):
+                self._remember(key, checkpoint["id"], depth, list(messages))
+
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        configurable = config["configurable"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, data = self._dump(value)
+            rows.append(
+                (
+                    configurable["thread_id"],
+                    configurable.get("checkpoint_ns", ""),
+                    configurable["checkpoint_id"],
+                    task_id,
+                    WRITES_IDX_MAP.get(channel, idx),
+                    channel,
+                    type_,
+                    data,
+                    task_path,
+                )
+            )
+        # Special writes (errors, interrupts) are overwritten, regular ones kept
+        verb = "INSERT OR REPLACE" if all(w[0] in WRITES_IDX_MAP for w in writes) else "INSERT OR IGNORE"
+        with self.lock:
+            self.conn.executemany(f"{verb} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self.conn.commit()
+
+    def _to_tuple(self, thread_id, checkpoint_ns, row) -> CheckpointTuple:
+        checkpoint_id, parent_id, type_, data, metadata_type, metadata_data = row
+        checkpoint = self._load(type_, data)
+        messages, _ = self._load_messages(thread_id, checkpoint_ns, checkpoint_id)
+        if messages is not None:
+            checkpoint["channel_values"] = {**checkpoint["channel_values"], MESSAGES_KEY: messages}
+
+        writes = self.conn.execute(
+            "SELECT task_id, channel, type, value FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            checkpoint=checkpoint,
+            metadata=self._load(metadata_type, metadata_data),
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": checkpoint_ns,
+                        "checkpoint_id": parent_id,
+                    }
+                }
+                if parent_id
+                else None
+            ),
+            pending_writes=[
+                (task_id, channel, self._load(value_type, value))
+                for task_id, channel, value_type, value in writes
+            ],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        configurable = config["configurable"]
+        thread_id = configurable["thread_id"]
+        checkpoint_ns = configurable.get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+
+        columns = "checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata"
+        with self.lock:
+            if checkpoint_id:
+                row = self.conn.execute(
+                    f"SELECT {columns} FROM checkpoints "
+                    "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                ).fetchone()
+            else:
+                row = self.conn.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+                    "ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, checkpoint_ns),
+                ).fetchone()
+            if row is None:
+                return None
+            return self._to_tuple(thread_id, checkpoint_ns, row)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        query = "SELECT thread_id, checkpoint_ns, checkpoint_id FROM checkpoints"
+        clauses, params = [], []
+        if config is not None:
+            clauses.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if "checkpoint_ns" in config["configurable"]:
+                clauses.append("checkpoint_ns = ?")
+                params.append(config["configurable"]["checkpoint_ns"])
+        if before is not None:
+            clauses.append("checkpoint_id < ?")
+            params.append(get_checkpoint_id(before))
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY checkpoint_id DESC"
+
+        with self.lock:
+            ids = self.conn.execute(query, params).fetchall()
+
+        # Rows are decoded one at a time, only as far as the caller iterates
+        yielded = 0
+        for thread_id, checkpoint_ns, checkpoint_id in ids:
+            if limit is not None and yielded >= limit:
+                return
+            with self.lock:
+                row = self.conn.execute(
+                    "SELECT checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata "
+                    "FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                ).fetchone()
+                checkpoint_tuple = self._to_tuple(thread_id, checkpoint_ns, row)
+            if filter and not all(
+                checkpoint_tuple.metadata.get(k) == v for k, v in filter.items()
+            ):
+                continue
+            yielded += 1
+            yield checkpoint_tuple
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self.lock:
+            self.conn.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+            self.conn.execute("DELETE FROM writes WHERE thread_id = ?", (thread_id,))
+            self.conn.commit()
+            for key in [key for key in self._hot if key[0] == thread_id]:
+                self._forget(key)
+
+    # The async API runs the blocking SQLite calls in worker threads
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        items = self.list(config, filter=filter, before=before, limit=limit)
+        done = object()
+        while (item := await asyncio.to_thread(next, items, done)) is not done:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
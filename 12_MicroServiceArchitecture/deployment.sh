@@ -18,7 +18,11 @@ do_docker() {
     echo "Build images..."
     docker build -t mypostgres ./postgres
     docker build -t myservice2 ./service2
+    # service3 installs the shared course_utils package, which lives outside its build context
+    rm -rf ./service3/course_utils
+    cp -r ../course_utils ./service3/course_utils
     docker build -t myservice3 ./service3
+    rm -rf ./service3/course_utils
     docker build -t myfrontend ./frontend
 
     echo "Tag and push images..."
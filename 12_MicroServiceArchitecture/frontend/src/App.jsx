@@ -1,10 +1,51 @@
-import React, { useState, useEffect } from "react";
+import React, {
+  useState,
+  useEffect,
+  useLayoutEffect,
+  useRef,
+  useCallback,
+} from "react";
 import { FaSpinner } from "react-icons/fa";
 
+const PAGE_SIZE = 20;
+
+const fetchPage = async (conversationId, before) => {
+  const params = new URLSearchParams({ limit: PAGE_SIZE });
+  if (before !== null) {
+    params.set("before", before);
+  }
+  // The browser revalidates with the ETag and reuses its cached copy on a 304
+  const response = await fetch(
+    `http://localhost/service2/${conversationId}?${params}`
+  );
+
+  // First, check if the response status code is not in the successful range
+  if (!response.ok) {
+    throw new Error(
+      `An error occurred: ${response.status} ${response.statusText}`
+    );
+  }
+
+  // Try parsing the response as JSON
+  const data = await response.json();
+
+  if (data.error) {
+    throw new Error(`Server responded with an error: ${data.error}`);
+  }
+
+  return data;
+};
+
 const App = () => {
   const [conversation, setConversation] = useState({ conversation: [] });
+  // Cursor of the next older page, null when everything is loaded
+  const [before, setBefore] = useState(null);
+  const [isLoadingOlder, setIsLoadingOlder] = useState(false);
   const [userMessage, setUserMessage] = useState("");
   const [isLoading, setIsLoading] = useState(false);
+  const messagesRef = useRef(null);
+  // Distance from the bottom to keep when older messages are prepended
+  const scrollAnchor = useRef(0);
 
   useEffect(() => {
     const fetchConversation = async () => {
@@ -16,25 +57,9 @@ const App = () => {
       }
 
       try {
-        const response = await fetch(
-          `http://localhost/service2/${conversationId}`
-        );
-
-        // First, check if the response status code is not in the successful range
-        if (!response.ok) {
-          throw new Error(
-            `An error occurred: ${response.status} ${response.statusText}`
-          );
-        }
-
-        // Try parsing the response as JSON
-        const data = await response.json();
-
-        if (data.error) {
-          throw new Error(`Server responded with an error: ${data.error}`);
-        }
-
-        setConversation(data);
+        const data = await fetchPage(conversationId, null);
+        setConversation({ conversation: data.conversation });
+        setBefore(data.before);
       } catch (error) {
         // This block will handle any errors that occur during the fetch operation
         console.error("Error fetching conversation:", error.toString());
@@ -44,6 +69,51 @@ const App = () => {
     fetchConversation();
   }, []);
 
+  const loadOlder = useCallback(async () => {
+    const conversationId = localStorage.getItem("conversationId");
+    if (!conversationId || before === null || isLoadingOlder) {
+      return;
+    }
+    setIsLoadingOlder(true);
+    try {
+      const data = await fetchPage(conversationId, before);
+      const element = messagesRef.current;
+      scrollAnchor.current = element.scrollHeight - element.scrollTop;
+      setConversation((current) => ({
+        conversation: [...data.conversation, ...current.conversation],
+      }));
+      setBefore(data.before);
+    } catch (error) {
+      console.error("Error fetching older messages:", error.toString());
+    } finally {
+      setIsLoadingOlder(false);
+    }
+  }, [before, isLoadingOlder]);
+
+  useLayoutEffect(() => {
+    const element = messagesRef.current;
+    if (!element) {
+      return;
+    }
+    // Stay at the same message after a prepend, at the bottom otherwise
+    element.scrollTop = element.scrollHeight - scrollAnchor.current;
+    scrollAnchor.current = 0;
+  }, [conversation]);
+
+  useEffect(() => {
+    const element = messagesRef.current;
+    // A first page shorter than the box cannot be scrolled, so fetch more
+    if (element && element.scrollHeight <= element.clientHeight) {
+      loadOlder();
+    }
+  }, [loadOlder]);
+
+  const handleScroll = (event) => {
+    if (event.currentTarget.scrollTop < 40) {
+      loadOlder();
+    }
+  };
+
   const generateConversationId = () =>
     "_" + Math.random().toString(36).slice(2, 11);
 
@@ -54,6 +124,7 @@ const App = () => {
   const handleNewSession = () => {
     localStorage.removeItem("conversationId");
     setConversation({ conversation: [] });
+    setBefore(null);
   };
 
   const handleSubmit = async () => {
@@ -64,10 +135,8 @@ const App = () => {
       localStorage.setItem("conversationId", conversationId);
     }
 
-    const newConversation = [
-      ...conversation.conversation,
-      { role: "user", content: userMessage },
-    ];
+    // service2 keeps the history, only the new message is sent
+    const newConversation = [{ role: "user", content: userMessage }];
 
     const response = await fetch(
       `http://localhost/service2/${conversationId}`,
@@ -79,7 +148,13 @@ const App = () => {
     );
 
     const data = await response.json();
-    setConversation(data);
+    if (data.error) {
+      console.error("Error sending message:", data.error);
+    } else {
+      setConversation((current) => ({
+        conversation: [...current.conversation, ...data.conversation],
+      }));
+    }
     setUserMessage("");
     setIsLoading(false);
   };
@@ -96,7 +171,16 @@ const App = () => {
     >
       <h1 className="text-3xl font-bold mb-4 text-white">Restaurant Chatbot</h1>
       {conversation.conversation && conversation.conversation.length > 0 && (
-        <div className="flex flex-col p-4 bg-white rounded shadow w-full max-w-md space-y-4">
+        <div
+          ref={messagesRef}
+          onScroll={handleScroll}
+          className="flex flex-col p-4 bg-white rounded shadow w-full max-w-md space-y-4 max-h-[70vh] overflow-y-auto"
+        >
+          {isLoadingOlder && (
+            <div className="flex justify-center text-gray-500">
+              <FaSpinner className="animate-spin" />
+            </div>
+          )}
           {conversation.conversation
             .filter((message) => message.role !== "system")
             .map((message, index) => (
@@ -1,10 +1,12 @@
-from typing import List
-from fastapi import FastAPI
+from typing import List, Optional
+from fastapi import FastAPI, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
 from pydantic import BaseModel
+import msgpack
+import orjson
 import redis
 import requests
-import json
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -12,6 +14,10 @@ logger = logging.getLogger(__name__)
 
 r = redis.Redis(host="redis", port=6379, db=0)
 
+SYSTEM_MESSAGE = {"role": "system", "content": "You are a helpful assistant."}
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 200
+
 app = FastAPI()
 app.add_middleware(
     CORSMiddleware,
@@ -19,6 +25,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
 
@@ -31,38 +38,102 @@ class Conversation(BaseModel):
     conversation: List[Message]
 
 
+def messages_key(conversation_id: str) -> str:
+    # One Redis list per conversation, one JSON-encoded message per element
+    return f"conversation:{conversation_id}"
+
+
+def generation_key(conversation_id: str) -> str:
+    # Set from a global counter whenever the conversation is created, so a
+    # deleted and recreated conversation never reuses an ETag
+    return f"conversation:{conversation_id}:generation"
+
+
+GENERATION_COUNTER = "conversation:generations"
+
+
+def migrate(conversation_id: str) -> None:
+    # Conversations stored before pagination are a single JSON blob under the bare id
+    legacy = r.get(conversation_id)
+    if legacy is None or r.exists(messages_key(conversation_id)):
+        return
+    messages = orjson.loads(legacy)["conversation"]
+    pipe = r.pipeline()
+    pipe.rpush(messages_key(conversation_id), *[orjson.dumps(message) for message in messages])
+    pipe.delete(conversation_id)
+    pipe.execute()
+
+
+def encode(request: Request, page: dict, raw_messages: List[bytes]):
+    # Stored messages are already JSON, so the JSON body is stitched together without decoding them
+    if "application/msgpack" in request.headers.get("accept", ""):
+        page = {**page, "conversation": [orjson.loads(message) for message in raw_messages]}
+        return msgpack.packb(page), "application/msgpack"
+    body = orjson.dumps(page)
+    return body[:-1] + b',"conversation":[' + b",".join(raw_messages) + b"]}", "application/json"
+
+
 @app.get("/service2/{conversation_id}")
-async def get_conversation(conversation_id: str):
+async def get_conversation(
+    conversation_id: str,
+    request: Request,
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    before: Optional[int] = Query(None, ge=0),
+):
+    """Page of at most ``limit`` messages ending just before index ``before``.
+
+    Without ``before`` the latest messages are returned. The response carries
+    the cursor for the next (older) page, null once the first message is reached.
+    """
     logger.info(f"Retrieving initial id {conversation_id}")
-    existing_conversation_json = r.get(conversation_id)
-    if existing_conversation_json:
-        existing_conversation = json.loads(existing_conversation_json)
-        return existing_conversation
-    else:
+    migrate(conversation_id)
+    pipe = r.pipeline()
+    pipe.llen(messages_key(conversation_id))
+    pipe.get(generation_key(conversation_id))
+    total, generation = pipe.execute()
+    if not total:
         return {"error": "Conversation not found"}
+    generation = int(generation or 0)
+
+    end = total if before is None else min(before, total)
+    start = max(0, end - limit)
+    encoding = "msgpack" if "application/msgpack" in request.headers.get("accept", "") else "json"
+    # The history is append-only: the latest page changes only with the length,
+    # and a page that ends at or below the current length never changes. A
+    # cursor past the end returns the latest page, which still grows.
+    if before is None or before > total:
+        etag = f'"{generation}-{total}-{limit}-{encoding}"'
+        cache_control = "no-cache"
+    else:
+        etag = f'"{generation}-{start}-{end}-{encoding}"'
+        cache_control = "private, max-age=31536000, immutable"
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    raw_messages = r.lrange(messages_key(conversation_id), start, end - 1) if end else []
+    body, media_type = encode(request, {"before": start or None}, raw_messages)
+    return Response(body, media_type=media_type, headers=headers)
 
 
 @app.post("/service2/{conversation_id}")
 async def service2(conversation_id: str, conversation: Conversation):
-    logger.info(f"Sending Conversation with ID {conversation_id} to OpenAI")
-    existing_conversation_json = r.get(conversation_id)
-    if existing_conversation_json:
-        existing_conversation = json.loads(existing_conversation_json)
-    else:
-        existing_conversation = {
-            "conversation": [
-                {"role": "system", "content": "You are a helpful assistant."}
-            ]
-        }
+    """Append the last message of ``conversation`` and return it with the reply.
 
-    existing_conversation["conversation"].append(
-        conversation.model_dump()["conversation"][-1]
-    )
+    Only the new user message is read from the request body; the history is
+    kept in Redis and sent to service3 from there.
+    """
+    logger.info(f"Sending Conversation with ID {conversation_id} to OpenAI")
+    migrate(conversation_id)
+    key = messages_key(conversation_id)
+    existing_messages = [orjson.loads(message) for message in r.lrange(key, 0, -1)]
+    new_messages = [] if existing_messages else [SYSTEM_MESSAGE]
+    new_messages.append(conversation.model_dump()["conversation"][-1])
 
     try:
         response = requests.post(
             f"http://service3:8000/service3/{conversation_id}",
-            json=existing_conversation,
+            json={"conversation": existing_messages + new_messages},
         )
         response.raise_for_status()
     except requests.exceptions.RequestException as e:
@@ -71,10 +142,12 @@ async def service2(conversation_id: str, conversation: Conversation):
 
     assistant_message = response.json()["reply"]
 
-    existing_conversation["conversation"].append(
-        {"role": "assistant", "content": assistant_message}
-    )
+    new_messages.append({"role": "assistant", "content": assistant_message})
 
-    r.set(conversation_id, json.dumps(existing_conversation))
+    pipe = r.pipeline()
+    if not existing_messages:
+        pipe.set(generation_key(conversation_id), r.incr(GENERATION_COUNTER))
+    pipe.rpush(key, *[orjson.dumps(message) for message in new_messages])
+    pipe.execute()
 
-    return existing_conversation
+    return {"conversation": new_messages}
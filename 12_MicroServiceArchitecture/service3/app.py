@@ -1,26 +1,27 @@
-from typing import List
-from fastapi import FastAPI
+"""FAQ bot service.
+
+Only FastAPI is imported at module level. LangChain, the Gemini clients and the
+PGVector store are imported and built by a warm-up task started from the
+lifespan, so the pod listens right away and the readiness probe
+(/service3/ready) only passes once everything is built.
+"""
+
+from typing import Any, Dict, List
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
+import asyncio
 import os
+import time
+from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
-import google.generativeai as genai
-from langchain_core.prompts import PromptTemplate
 import logging
 from dotenv import find_dotenv, load_dotenv
-from langchain_postgres import PGVector
-from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
-from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
-from langchain_core.prompts import (
-    PromptTemplate,
-    SystemMessagePromptTemplate,
-)
-
-ROLE_CLASS_MAP = {"assistant": AIMessage, "user": HumanMessage, "system": SystemMessage}
+from starlette.concurrency import run_in_threadpool
+from single_flight import SingleFlight, request_key
 
 load_dotenv(find_dotenv())
 
-openai.google_api_key=os.getenv("GOOGLE_API_KEY")
-
 db_user = os.getenv("DB_USER")
 db_password = os.getenv("DB_PASSWORD")
 db_host = os.getenv("DB_HOST")
@@ -44,15 +45,6 @@ class Conversation(BaseModel):
     conversation: List[Message]
 
 
-embeddings = GoogleGenerativeAIEmbeddings(model="gemini-embedding-001")
-chat = ChatGoogleGenerativeAI(temperature=0)
-store = PGVector(
-    collection_name=db_name,
-    connection=CONNECTION_STRING,
-    embeddings=embeddings,
-)
-retriever = store.as_retriever()
-
 prompt_template = """As a FAQ Bot for our restaurant, you have the following information about our restaurant:
 
 {context}
@@ -60,13 +52,97 @@ prompt_template = """As a FAQ Bot for our restaurant, you have the following inf
 Please provide the most suitable response for the users question.
 Answer:"""
 
-prompt = PromptTemplate(template=prompt_template, input_variables=["context"])
-system_message_prompt = SystemMessagePromptTemplate(prompt=prompt)
+# Filled by warm_up(): retriever, packer, chat model, prompt and message classes
+state: Dict[str, Any] = {}
+startup = {"ready": False, "failed": False, "error": None, "attempts": 0, "seconds": {}}
+# Failed warm-ups are retried with backoff; after the last one /healthz fails so the pod is restarted
+WARM_UP_ATTEMPTS = int(os.getenv("WARM_UP_ATTEMPTS", "5"))
+
+
+def load_retriever():
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+    from langchain_postgres import PGVector
+
+    from course_utils.context_packer import ContextPacker
+
+    embeddings = GoogleGenerativeAIEmbeddings(model="gemini-embedding-001")
+    store = PGVector(
+        collection_name=db_name,
+        connection=CONNECTION_STRING,
+        embeddings=embeddings,
+    )
+    return {
+        "retriever": store.as_retriever(),
+        "packer": ContextPacker(max_tokens=int(os.getenv("CONTEXT_TOKEN_BUDGET", "600"))),
+    }
+
+
+def load_chat():
+    from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+    from langchain_core.prompts import PromptTemplate, SystemMessagePromptTemplate
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    from llm_cache import cache_from_env
+    from course_utils.rate_limiter import limiter_from_env
+
+    # Shares the Gemini quota with the other services through Redis (GEMINI_LIMITER_REDIS_URL)
+    limiter = limiter_from_env()
+    # Answers shared by all replicas (LLM_CACHE_REDIS_URL); hits skip the rate limiter
+    llm_cache = cache_from_env()
+    gemini = ChatGoogleGenerativeAI(temperature=0, max_retries=0)
+    prompt = PromptTemplate(template=prompt_template, input_variables=["context"])
+    return {
+        "limiter": limiter,
+        "llm_cache": llm_cache,
+        "gemini": gemini,
+        "chat": llm_cache.wrap(limiter.wrap(gemini), gemini),
+        "system_message_prompt": SystemMessagePromptTemplate(prompt=prompt),
+        "role_class_map": {"assistant": AIMessage, "user": HumanMessage, "system": SystemMessage},
+    }
+
+
+async def timed(name, fn):
+    start = time.perf_counter()
+    result = await asyncio.to_thread(fn)
+    startup["seconds"][name] = round(time.perf_counter() - start, 3)
+    return result
+
+
+async def warm_up():
+    start = time.perf_counter()
+    for attempt in range(1, WARM_UP_ATTEMPTS + 1):
+        startup["attempts"] = attempt
+        try:
+            for resources in await asyncio.gather(timed("retriever", load_retriever), timed("chat", load_chat)):
+                state.update(resources)
+        except Exception as e:
+            startup["error"] = repr(e)
+            logger.exception("Warm-up attempt %d of %d failed", attempt, WARM_UP_ATTEMPTS)
+            if attempt < WARM_UP_ATTEMPTS:
+                await asyncio.sleep(min(2**attempt, 30))
+            continue
+        startup["error"] = None
+        startup["seconds"]["total"] = round(time.perf_counter() - start, 3)
+        startup["ready"] = True
+        return
+    startup["failed"] = True
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Not awaited: the server accepts connections while the warm-up runs
+    task = asyncio.create_task(warm_up())
+    yield
+    task.cancel()
+
+
+# Identical questions asked at the same time share one retrieval + generation
+flight = SingleFlight()
 
 
 def create_messages(conversation):
     return [
-        ROLE_CLASS_MAP[message.role](content=message.content)
+        state["role_class_map"][message.role](content=message.content)
         for message in conversation
     ]
 
@@ -74,12 +150,12 @@ def create_messages(conversation):
 def format_docs(docs):
     formatted_docs = []
     for doc in docs:
-        formatted_doc = "Source: " + doc.metadata["source"]
+        formatted_doc = "Source: " + doc.metadata["source"] + "\n" + doc.page_content
         formatted_docs.append(formatted_doc)
-    return "\n".join(formatted_docs)
+    return "\n\n".join(formatted_docs)
 
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -89,16 +165,50 @@ app.add_middleware(
 )
 
 
+@app.get("/service3/healthz")
+async def healthz():
+    if startup["failed"]:
+        return JSONResponse(startup, status_code=500)
+    return {"status": "ok"}
+
+
+@app.get("/service3/ready")
+async def ready():
+    return JSONResponse(startup, status_code=200 if startup["ready"] else 503)
+
+
 @app.post("/service3/{conversation_id}")
 async def service3(conversation_id: str, conversation: Conversation):
+    if not startup["ready"]:
+        raise HTTPException(detail="Warming up", status_code=503, headers={"Retry-After": "1"})
     query = conversation.conversation[-1].content
 
-    docs = retriever.invoke(query=query)
-    docs = format_docs(docs=docs)
+    async def answer():
+        # PGVector is synchronous, keep it off the event loop
+        docs = await run_in_threadpool(state["retriever"].invoke, query)
+        # Merged, deduplicated and trimmed to the sentences relevant to the query
+        docs = state["packer"].pack(query, docs)
+        docs = format_docs(docs=docs)
+
+        prompt = state["system_message_prompt"].format(context=docs)
+        messages = [prompt] + create_messages(conversation=conversation.conversation)
+
+        result = await state["chat"].ainvoke(messages)
+        return result.content
+
+    history = [(message.role, message.content) for message in conversation.conversation]
+    key = request_key(prompt_template, history, state["gemini"].model)
+    reply = await flight.do(key, answer)
 
-    prompt = system_message_prompt.format(context=docs)
-    messages = [prompt] + create_messages(conversation=conversation.conversation)
+    return {"id": conversation_id, "reply": reply}
 
-    result = chat.invoke(messages)
 
-    return {"id": conversation_id, "reply": result.content}
+@app.get("/service3/stats")
+async def stats():
+    limiter = state.get("limiter")
+    llm_cache = state.get("llm_cache")
+    return {
+        "coalescing": flight.report(),
+        "rate_limiter": limiter.report() if limiter else None,
+        "llm_cache": llm_cache.report() if llm_cache else None,
+    }
@@ -0,0 +1,343 @@
+"""Exact-match cache of chat model responses, shared by all service3 replicas.
+
+service3 calls Gemini with ``temperature=0``, so the same system prompt
+(retrieved context) and message list produce the same answer. Responses are
+cached under a SHA-256 of the model parameters and the canonical JSON of the
+messages:
+
+* L1: a small in-process LRU with a short TTL, answered without a network hop.
+* L2: Redis, zlib-compressed, shared by every replica. Entries expire
+  ``ttl`` seconds after their last hit; once the stored values exceed
+  ``max_bytes`` the least recently used ones are evicted by a Lua script.
+
+``RedisLLMCache`` is a LangChain ``BaseCache`` and can be passed to
+``set_llm_cache``. service3 instead puts it in front of the rate limiter with
+``wrap``, so cache hits do not use any of the Gemini quota; its keys are the
+serialized messages and ``model_key`` (model name and sampling parameters).
+Every caller gets its own copy of a cached message, with a new id and zero
+token usage. Hit rates are counted per replica and reported by ``report``.
+
+    cache = cache_from_env()
+    chat = cache.wrap(limiter.wrap(gemini), gemini)
+"""
+
+import hashlib
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from typing import Any, Optional, Sequence
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.language_models import BaseChatModel
+from langchain_core.load import dumps, loads
+from langchain_core.messages import BaseMessage, convert_to_messages
+from langchain_core.outputs import ChatGeneration
+from langchain_core.prompt_values import PromptValue
+from langchain_core.runnables import Runnable, RunnableConfig
+
+try:
+    import redis
+except ImportError:  # Redis is optional, the cache is then per process
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# KEYS: entry, LRU index (zset), sizes (hash), byte counter. ARGV: value, ttl, max bytes.
+# Returns the number of evicted entries.
+_SET_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local ttl, max_bytes = tonumber(ARGV[2]), tonumber(ARGV[3])
+
+local function forget(key)
+  local size = tonumber(redis.call('HGET', KEYS[3], key) or '0')
+  redis.call('HDEL', KEYS[3], key)
+  redis.call('ZREM', KEYS[2], key)
+  redis.call('DECRBY', KEYS[4], size)
+  return size
+end
+
+-- Entries that expired by TTL are gone, but their sizes are still counted
+for _, key in ipairs(redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now - ttl, 'LIMIT', 0, 100)) do
+  forget(key)
+end
+forget(KEYS[1])
+
+local size = string.len(ARGV[1])
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ttl)
+redis.call('HSET', KEYS[3], KEYS[1], size)
+redis.call('ZADD', KEYS[2], now, KEYS[1])
+local total = redis.call('INCRBY', KEYS[4], size)
+
+local evicted = 0
+while total > max_bytes do
+  local oldest = redis.call('ZRANGE', KEYS[2], 0, 0)[1]
+  if not oldest or oldest == KEYS[1] then break end
+  redis.call('DEL', oldest)
+  total = total - forget(oldest)
+  evicted = evicted + 1
+end
+return evicted
+"""
+
+# KEYS: entry, LRU index. ARGV: ttl. A hit refreshes the TTL and the LRU position.
+_GET_SCRIPT = """
+local value = redis.call('GET', KEYS[1])
+if value then
+  local clock = redis.call('TIME')
+  redis.call('EXPIRE', KEYS[1], ARGV[1])
+  redis.call('ZADD', KEYS[2], tonumber(clock[1]) + tonumber(clock[2]) / 1000000, KEYS[1])
+end
+return value
+"""
+
+
+def canonical_key(prompt: str, llm_string: str) -> str:
+    """SHA-256 of the model parameters and the prompt, JSON re-serialized with sorted keys."""
+    try:
+        prompt = json.dumps(json.loads(prompt), sort_keys=True, separators=(",", ":"))
+    except ValueError:
+        pass
+    return hashlib.sha256(f"{llm_string}\x1f{prompt}".encode("utf-8")).hexdigest()
+
+
+# Model attributes that change the answer; those a model does not have are None
+MODEL_PARAMS = ("model", "model_name", "temperature", "top_p", "top_k", "max_output_tokens", "max_tokens", "stop")
+
+
+def model_key(model: BaseChatModel, **kwargs: Any) -> str:
+    """The ``llm_string`` of ``model``: its class, name and sampling parameters plus call kwargs."""
+    params = {name: getattr(model, name, None) for name in MODEL_PARAMS}
+    return json.dumps({"class": type(model).__name__, **params, **kwargs}, sort_keys=True, default=str)
+
+
+def _fresh_copy(message: BaseMessage) -> BaseMessage:
+    # Callers may mutate what they get, and a hit must not be counted as model tokens
+    update = {"id": str(uuid.uuid4())}
+    if getattr(message, "usage_metadata", None):
+        update["usage_metadata"] = {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+    return message.model_copy(update=update, deep=True)
+
+
+def _encode(generations: RETURN_VAL_TYPE) -> bytes:
+    return zlib.compress(dumps(list(generations)).encode("utf-8"))
+
+
+def _decode(value: bytes) -> RETURN_VAL_TYPE:
+    return loads(zlib.decompress(value).decode("utf-8"))
+
+
+class _LocalLRU:
+    """In-process LRU with a TTL, the L1 in front of Redis."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+    def get(self, key: str) -> Optional[RETURN_VAL_TYPE]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, generations = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return generations
+
+    def put(self, key: str, generations: RETURN_VAL_TYPE) -> None:
+        if not self.max_entries:
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, generations)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+
+class RedisLLMCache(BaseCache):
+    """Two-level exact-match LLM cache (in-process LRU + Redis).
+
+    Redis errors are logged and counted; the lookup is then a miss and the
+    response is only kept in L1.
+
+    Args:
+        redis_url: Share the cache through this Redis; in-process only if None.
+        prefix: Prefix of all Redis keys of the cache.
+        ttl: Seconds an entry lives in Redis after its last hit.
+        max_bytes: Bound on the compressed values in Redis; LRU eviction above it.
+        local_entries: Size of the in-process LRU, 0 disables it.
+        local_ttl: Seconds an entry is served from the in-process LRU.
+    """
+
+    def __init__(
+        self,
+        redis_url: Optional[str] = None,
+        prefix: str = "llmcache",
+        ttl: int = 24 * 3600,
+        max_bytes: int = 64 * 2**20,
+        local_entries: int = 256,
+        local_ttl: float = 300,
+    ):
+        self.prefix = prefix
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._local = _LocalLRU(local_entries, local_ttl)
+        self._lock = threading.Lock()
+        self.stats = {"l1_hits": 0, "l2_hits": 0, "misses": 0, "writes": 0, "evictions": 0, "errors": 0}
+
+        self._redis = None
+        if redis_url and redis is not None:
+            self._redis = redis.Redis.from_url(redis_url, socket_timeout=0.5)
+            self._get_script = self._redis.register_script(_GET_SCRIPT)
+            self._set_script = self._redis.register_script(_SET_SCRIPT)
+        elif redis_url:
+            logger.warning("redis is not installed, the LLM cache is per process")
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.stats[name] += amount
+
+    def _redis_failed(self, error: Exception) -> None:
+        self._count("errors")
+        logger.warning("LLM cache Redis call failed: %s", error)
+
+    def _index_keys(self):
+        return [f"{self.prefix}:lru", f"{self.prefix}:sizes", f"{self.prefix}:bytes"]
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = f"{self.prefix}:{canonical_key(prompt, llm_string)}"
+        generations = self._local.get(key)
+        if generations is not None:
+            self._count("l1_hits")
+            return generations
+
+        if self._redis is not None:
+            try:
+                value = self._get_script(keys=[key, f"{self.prefix}:lru"], args=[self.ttl])
+                generations = _decode(value) if value is not None else None
+            except redis.RedisError as e:
+                self._redis_failed(e)
+            except (zlib.error, ValueError) as e:
+                logger.warning("Dropping unreadable LLM cache entry %s: %s", key, e)
+            if generations is not None:
+                self._local.put(key, generations)
+                self._count("l2_hits")
+                return generations
+
+        self._count("misses")
+        return None
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        key = f"{self.prefix}:{canonical_key(prompt, llm_string)}"
+        self._local.put(key, list(return_val))
+        self._count("writes")
+        if self._redis is None:
+            return
+        try:
+            evicted = self._set_script(
+                keys=[key, *self._index_keys()],
+                args=[_encode(return_val), self.ttl, self.max_bytes],
+            )
+        except redis.RedisError as e:
+            self._redis_failed(e)
+            return
+        self._count("evictions", int(evicted))
+
+    def clear(self, **kwargs: Any) -> None:
+        """Empty L1 and remove every Redis key under the prefix."""
+        self._local.clear()
+        if self._redis is None:
+            return
+        batch = []
+        for key in self._redis.scan_iter(match=f"{self.prefix}:*", count=500):
+            batch.append(key)
+            if len(batch) == 500:
+                self._redis.delete(*batch)
+                batch = []
+        if batch:
+            self._redis.delete(*batch)
+
+    def wrap(self, runnable: Runnable, model: BaseChatModel) -> "CachedChatModel":
+        """Answer from the cache before calling ``runnable`` (for example a rate-limited ``model``)."""
+        return CachedChatModel(runnable, model, self)
+
+    def report(self):
+        """Hit rates of this replica and the size of the shared cache."""
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats["l1_hits"] + stats["l2_hits"] + stats["misses"]
+        stored_bytes = None
+        if self._redis is not None:
+            try:
+                stored_bytes = int(self._redis.get(f"{self.prefix}:bytes") or 0)
+            except redis.RedisError as e:
+                self._redis_failed(e)
+        return {
+            **stats,
+            "replica": socket.gethostname(),
+            "hit_rate": round((stats["l1_hits"] + stats["l2_hits"]) / lookups, 3) if lookups else None,
+            "l1_hit_rate": round(stats["l1_hits"] / lookups, 3) if lookups else None,
+            "l1_entries": len(self._local.entries),
+            "shared": self._redis is not None,
+            "stored_bytes": stored_bytes,
+        }
+
+
+class CachedChatModel(Runnable):
+    """A chat model runnable whose responses are looked up in a RedisLLMCache first.
+
+    Keys are the serialized messages and ``model_key(model)``. Hits are
+    returned as copies, so callers never share a message object.
+    """
+
+    def __init__(self, bound: Runnable, model: BaseChatModel, cache: RedisLLMCache):
+        self.bound = bound
+        self.model = model
+        self.cache = cache
+
+    def _keys(self, input: Any, kwargs: dict):
+        messages = input.to_messages() if isinstance(input, PromptValue) else convert_to_messages(input)
+        return dumps(messages), model_key(self.model, **kwargs)
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        prompt, llm_string = self._keys(input, kwargs)
+        cached: Optional[Sequence] = self.cache.lookup(prompt, llm_string)
+        if cached:
+            return _fresh_copy(cached[0].message)
+        result = self.bound.invoke(input, config, **kwargs)
+        self.cache.update(prompt, llm_string, [ChatGeneration(message=result.model_copy(deep=True))])
+        return result
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        prompt, llm_string = self._keys(input, kwargs)
+        # BaseCache runs the synchronous Redis calls in the default executor
+        cached: Optional[Sequence] = await self.cache.alookup(prompt, llm_string)
+        if cached:
+            return _fresh_copy(cached[0].message)
+        result = await self.bound.ainvoke(input, config, **kwargs)
+        await self.cache.aupdate(prompt, llm_string, [ChatGeneration(message=result.model_copy(deep=True))])
+        return result
+
+
+def cache_from_env(**kwargs: Any) -> RedisLLMCache:
+    """Cache configured by LLM_CACHE_REDIS_URL, LLM_CACHE_TTL and LLM_CACHE_MAX_MB."""
+    return RedisLLMCache(
+        redis_url=os.getenv("LLM_CACHE_REDIS_URL"),
+        ttl=int(os.getenv("LLM_CACHE_TTL", str(24 * 3600))),
+        max_bytes=int(float(os.getenv("LLM_CACHE_MAX_MB", "64")) * 2**20),
+        **kwargs,
+    )
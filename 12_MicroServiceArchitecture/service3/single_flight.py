@@ -0,0 +1,130 @@
+"""Single-flight coalescing of identical concurrent requests.
+
+When many users ask the same question at the same moment, only the first
+request (the leader) runs retrieval and generation. Identical requests that
+arrive while it is still running wait for the leader and receive its result.
+Nothing is cached: once the leader finishes, the next request starts a new call.
+
+    flight = SingleFlight()
+    reply = await flight.do(request_key(system_prompt, messages, model), answer)
+
+Run this file for a benchmark with bursty synthetic traffic.
+"""
+
+import asyncio
+import hashlib
+import json
+import re
+from typing import Any, Awaitable, Callable, Dict, Iterable, Tuple
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING = re.compile(r"[\s?!.]+$")
+
+
+def normalize_text(text: str) -> str:
+    """Lower-case, collapse whitespace and drop trailing punctuation."""
+    return _TRAILING.sub("", _WHITESPACE.sub(" ", text.strip().lower()))
+
+
+def request_key(system_context: str, messages: Iterable[Tuple[str, str]], model: str) -> str:
+    """Key of a model call: the context, every ``(role, content)`` message sent and the model.
+
+    The whole history is part of the key, so requests from conversations that
+    only share their last message never receive each other's reply.
+    """
+    history = [[role, normalize_text(content)] for role, content in messages]
+    payload = json.dumps([normalize_text(system_context), history, model], separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """Share one in-flight coroutine between concurrent callers with the same key."""
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[str, int] = {}
+        self.stats = {"requests": 0, "executions": 0, "coalesced": 0, "errors": 0, "max_waiters": 0}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.stats["requests"] += 1
+        task = self._inflight.get(key)
+        if task is None:
+            # The call runs as its own task, so a disconnecting leader does not
+            # cancel it for the followers
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            self._waiters[key] = 1
+            self.stats["executions"] += 1
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.stats["coalesced"] += 1
+            self._waiters[key] += 1
+            self.stats["max_waiters"] = max(self.stats["max_waiters"], self._waiters[key])
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Task) -> None:
+        del self._inflight[key]
+        del self._waiters[key]
+        if task.cancelled() or task.exception() is not None:
+            self.stats["errors"] += 1
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._inflight)
+
+    def report(self) -> Dict[str, Any]:
+        requests = self.stats["requests"]
+        return {
+            **self.stats,
+            "in_flight": self.in_flight,
+            "coalescing_ratio": self.stats["coalesced"] / requests if requests else 0.0,
+        }
+
+
+if __name__ == "__main__":
+    import random
+    import time
+
+    QUESTIONS = [
+        "When do you open?",
+        "when do you open",
+        "Do you have vegan pizza?",
+        "Is there parking nearby?",
+        "Can I book a table for 8?",
+    ]
+    LATENCY = 0.8  # retrieval + generation
+
+    calls = {"n": 0}
+
+    async def answer():
+        calls["n"] += 1
+        await asyncio.sleep(LATENCY)
+        return "We open at 11 a.m."
+
+    async def burst_traffic(coalesce: bool, bursts: int = 5, burst_size: int = 300):
+        flight = SingleFlight()
+        rng = random.Random(0)
+        calls["n"] = 0
+
+        async def request(question):
+            if coalesce:
+                return await flight.do(request_key("faq", [("user", question)], "gemini"), answer)
+            return await answer()
+
+        start = time.perf_counter()
+        for _ in range(bursts):
+            # A promo goes out: most users ask the same thing within ~200 ms
+            tasks = []
+            for _ in range(burst_size):
+                question = QUESTIONS[0 if rng.random() < 0.7 else rng.randrange(len(QUESTIONS))]
+                tasks.append(asyncio.create_task(request(question)))
+                await asyncio.sleep(rng.uniform(0, 0.2 / burst_size))
+            await asyncio.gather(*tasks)
+        return calls["n"], time.perf_counter() - start, flight.report()
+
+    for coalesce in (False, True):
+        model_calls, seconds, report = asyncio.run(burst_traffic(coalesce))
+        name = "single-flight" if coalesce else "no coalescing"
+        print(f"{name:>14}: {model_calls} model calls for 1500 requests in {seconds:.2f}s")
+        if coalesce:
+            print(report)
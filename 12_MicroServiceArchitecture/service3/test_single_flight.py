@@ -0,0 +1,44 @@
+import asyncio
+
+from single_flight import SingleFlight, request_key
+
+
+def test_same_question_is_coalesced():
+    flight = SingleFlight()
+    calls = []
+
+    async def answer():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "We open at 11 a.m."
+
+    async def main():
+        key = request_key("faq", [("user", "When do you open?")], "gemini")
+        other = request_key("faq", [("user", "when do you open")], "gemini")
+        return await asyncio.gather(flight.do(key, answer), flight.do(other, answer))
+
+    assert asyncio.run(main()) == ["We open at 11 a.m.", "We open at 11 a.m."]
+    assert len(calls) == 1
+
+
+def test_different_histories_are_not_coalesced():
+    flight = SingleFlight()
+
+    def answer_for(name):
+        async def answer():
+            await asyncio.sleep(0.05)
+            return f"reply for {name}"
+        return answer
+
+    alice = [("user", "My name is Alice"), ("assistant", "Hi Alice!"), ("user", "What is my name?")]
+    bob = [("user", "My name is Bob"), ("assistant", "Hi Bob!"), ("user", "What is my name?")]
+
+    async def main():
+        return await asyncio.gather(
+            flight.do(request_key("faq", alice, "gemini"), answer_for("alice")),
+            flight.do(request_key("faq", bob, "gemini"), answer_for("bob")),
+        )
+
+    assert request_key("faq", alice, "gemini") != request_key("faq", bob, "gemini")
+    assert asyncio.run(main()) == ["reply for alice", "reply for bob"]
+    assert flight.stats["coalesced"] == 0
@@ -0,0 +1,213 @@
+"""Speculative rephrase + retrieve for the conversational retrieval chain in 13_04.
+
+`rephrase_chain | retrieved_documents` waits for a full LLM rephrase before the
+retriever starts. SpeculativeRetrieval retrieves with the raw follow-up question
+while the rephrase runs. Retrieval is only repeated when the standalone question
+differs materially from the raw one. Rephrases are cached per
+(chat history, question).
+
+    final_chain = SpeculativeRetrieval(rephrase_chain, retriever) | answer
+
+Run this file for a benchmark with fake latencies.
+"""
+
+import asyncio
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_core.runnables.config import ensure_config
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+_shared_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_shared_executor(max_workers: int = 8) -> ThreadPoolExecutor:
+    """Return the process-wide executor for the speculative retrievals of the sync path."""
+    global _shared_executor
+    if _shared_executor is None:
+        _shared_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculative")
+    return _shared_executor
+
+
+def history_hash(chat_history):
+    """Stable hash of a chat history given as messages or as a plain string."""
+    if isinstance(chat_history, str):
+        payload = chat_history
+    else:
+        payload = json.dumps(
+            [
+                [m.type, m.content] if isinstance(m, BaseMessage) else m
+                for m in chat_history or []
+            ],
+            sort_keys=True,
+            default=str,
+        )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def query_overlap(a, b):
+    """Jaccard overlap of the lower-cased words of two queries."""
+    words_a = set(_WORD_PATTERN.findall(a.lower()))
+    words_b = set(_WORD_PATTERN.findall(b.lower()))
+    if not words_a and not words_b:
+        return 1.0
+    return len(words_a & words_b) / len(words_a | words_b)
+
+
+class SpeculativeRetrieval(Runnable[Dict[str, Any], Dict[str, Any]]):
+    """Rephrase and retrieve concurrently, re-retrieving only when needed.
+
+    Input: ``{"question": str, "chat_history": list | str}``.
+    Output: ``{"question": standalone question, "docs": documents}``, the same
+    shape as ``rephrase_chain | {"docs": retriever, "question": RunnablePassthrough()}``.
+
+    Args:
+        rephrase_chain: Runnable producing the standalone question.
+        retriever: Retriever (or any runnable) mapping a query to documents.
+        min_overlap: Keep the speculative documents when the word overlap of
+            raw and rephrased question is at least this value.
+        cache_size: Number of rephrases kept in the LRU cache.
+        executor: Thread pool for the sync path, defaults to a shared one.
+    """
+
+    def __init__(
+        self,
+        rephrase_chain: Runnable,
+        retriever: Runnable,
+        min_overlap: float = 0.7,
+        cache_size: int = 1024,
+        executor: Optional[ThreadPoolExecutor] = None,
+    ):
+        self.rephrase_chain = rephrase_chain
+        self.retriever = retriever
+        self.min_overlap = min_overlap
+        self.cache_size = cache_size
+        self.stats = {"turns": 0, "cache_hits": 0, "speculation_hits": 0, "re_retrievals": 0}
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.executor = executor
+
+    def _cache_get(self, key):
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.stats["cache_hits"] += 1
+                return self._cache[key]
+        return None
+
+    def _cache_put(self, key, value):
+        with self._lock:
+            self._cache[key] = value
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _needs_rephrase(self, input):
+        return bool(input.get("chat_history"))
+
+    def _finish(self, question, standalone):
+        with self._lock:
+            self.stats["turns"] += 1
+            if standalone is None or query_overlap(question, standalone) >= self.min_overlap:
+                if standalone is not None:
+                    self.stats["speculation_hits"] += 1
+                return True
+            self.stats["re_retrievals"] += 1
+            return False
+
+    def invoke(
+        self, input: Dict[str, Any], config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> Dict[str, Any]:
+        config = ensure_config(config)
+        question = input["question"]
+        key = (history_hash(input.get("chat_history")), question)
+
+        executor = self.executor or get_shared_executor()
+        speculative = executor.submit(self.retriever.invoke, question, config)
+        standalone = None
+        if self._needs_rephrase(input):
+            standalone = self._cache_get(key)
+            if standalone is None:
+                standalone = self.rephrase_chain.invoke(input, config)
+                self._cache_put(key, standalone)
+
+        if self._finish(question, standalone):
+            docs = speculative.result()
+        else:
+            # Miss: do not wait for documents that are thrown away. A retrieval
+            # that already runs finishes in the background.
+            speculative.cancel()
+            docs = self.retriever.invoke(standalone, config)
+        return {"question": standalone or question, "docs": docs}
+
+    async def ainvoke(
+        self, input: Dict[str, Any], config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> Dict[str, Any]:
+        config = ensure_config(config)
+        question = input["question"]
+        key = (history_hash(input.get("chat_history")), question)
+
+        speculative = asyncio.ensure_future(self.retriever.ainvoke(question, config))
+        standalone = None
+        if self._needs_rephrase(input):
+            standalone = self._cache_get(key)
+            if standalone is None:
+                standalone = await self.rephrase_chain.ainvoke(input, config)
+                self._cache_put(key, standalone)
+
+        if not self._finish(question, standalone):
+            speculative.cancel()
+            docs = await self.retriever.ainvoke(standalone, config)
+        else:
+            docs = await speculative
+        return {"question": standalone or question, "docs": docs}
+
+
+if __name__ == "__main__":
+    import time
+
+    from langchain_core.messages import AIMessage, HumanMessage
+    from langchain_core.runnables import RunnableLambda, RunnablePassthrough
+
+    LLM_LATENCY = 0.6
+    RETRIEVER_LATENCY = 0.15
+
+    def fake_rephrase(input):
+        time.sleep(LLM_LATENCY)
+        if input["question"] == "No, really?":
+            return "What does the dog really like to eat?"
+        return input["question"]
+
+    def fake_retriever(query):
+        time.sleep(RETRIEVER_LATENCY)
+        return [f"doc for {query}"]
+
+    rephrase_chain = RunnableLambda(fake_rephrase)
+    retriever = RunnableLambda(fake_retriever)
+    sequential = rephrase_chain | {"docs": retriever, "question": RunnablePassthrough()}
+    speculative = SpeculativeRetrieval(rephrase_chain, retriever)
+
+    history = [HumanMessage(content="What does the dog like to eat?"), AIMessage(content="Thuna!")]
+    # Distinct turns, so the rephrase cache does not inflate the saving
+    turns = [
+        {"question": "What does the cat like to eat?", "chat_history": history},
+        {"question": "No, really?", "chat_history": history},
+        {"question": "What does the bird like to eat?", "chat_history": history},
+        {"question": "Where does the dog live?", "chat_history": history},
+    ]
+
+    for name, chain in [("sequential", sequential), ("speculative", speculative)]:
+        start = time.perf_counter()
+        for turn in turns:
+            chain.invoke(turn)
+        per_turn = (time.perf_counter() - start) / len(turns)
+        print(f"{name:>12}: {per_turn * 1000:.0f} ms per turn")
+    print(speculative.stats)
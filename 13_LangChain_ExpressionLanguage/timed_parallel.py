@@ -0,0 +1,209 @@
+"""RunnableParallel replacement with per-branch deadlines and fallbacks.
+
+Usage in the 13_0x notebooks:
+
+    from timed_parallel import TimedParallel
+
+    chain = (
+        TimedParallel(
+            {"context": retriever, "question": RunnablePassthrough()},
+            timeouts={"context": 0.2},
+            fallbacks={"context": []},
+        )
+        | prompt
+        | model
+    )
+
+Every branch runs on a shared, bounded thread pool (sync) or as its own task
+(async). A branch that misses its deadline is replaced by its fallback, so a
+slow retriever can no longer hold up the whole chain.
+
+A TimedParallel inside a branch of another one uses the shared pool of the
+next nesting level. If both levels used one pool, outer branches could hold
+every worker while they wait for inner branches queued behind them.
+
+Limit of the sync path: Python threads cannot be stopped. A branch that has
+already started keeps running on its pool thread after its deadline, and while
+it runs that thread is not available to later calls. If many branches hang,
+later calls queue behind them and miss their deadlines too. Give slow or
+unreliable branches their own ``executor``, sized for the expected number of
+stuck calls, or use ``ainvoke``, where a timed-out branch is really cancelled.
+Such an executor must not also be given to a TimedParallel nested inside them.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Mapping, Optional
+
+from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_core.runnables.base import coerce_to_runnable
+from langchain_core.runnables.config import ensure_config, patch_config
+
+logger = logging.getLogger(__name__)
+
+_shared_executors: Dict[int, ThreadPoolExecutor] = {}
+_executors_lock = threading.Lock()
+# Nesting level of the TimedParallel branch running on the current thread
+_nesting = threading.local()
+
+
+def get_shared_executor(max_workers: int = 16, level: int = 0) -> ThreadPoolExecutor:
+    """Return the process-wide executor used by every TimedParallel at nesting ``level``."""
+    with _executors_lock:
+        if level not in _shared_executors:
+            _shared_executors[level] = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix=f"timed-parallel-{level}"
+            )
+        return _shared_executors[level]
+
+
+class TimedParallel(Runnable[Any, Dict[str, Any]]):
+    """Run branches in parallel, each with an optional deadline and fallback.
+
+    Args:
+        steps: Mapping of output key to runnable (or anything coercible to one).
+        timeouts: Deadline in seconds per key. Keys without one wait indefinitely.
+        fallbacks: Value used when a branch times out or fails. A callable is
+            called with the chain input. Branches without a fallback re-raise.
+        default_timeout: Deadline for keys missing from ``timeouts``.
+        on_timings: Called with ``{key: (seconds, status)}`` after every run,
+            where status is "ok", "timeout" or "error".
+        executor: Thread pool for the sync path, defaults to the shared one
+            (see the module docstring for branches that overrun their deadline).
+    """
+
+    def __init__(
+        self,
+        steps: Mapping[str, Any],
+        timeouts: Optional[Mapping[str, float]] = None,
+        fallbacks: Optional[Mapping[str, Any]] = None,
+        default_timeout: Optional[float] = None,
+        on_timings: Optional[Callable[[Dict[str, tuple]], None]] = None,
+        executor: Optional[ThreadPoolExecutor] = None,
+    ):
+        self.steps = {key: coerce_to_runnable(step) for key, step in steps.items()}
+        self.timeouts = dict(timeouts or {})
+        self.fallbacks = dict(fallbacks or {})
+        self.default_timeout = default_timeout
+        self.on_timings = on_timings
+        self.executor = executor
+
+    def _timeout(self, key):
+        return self.timeouts.get(key, self.default_timeout)
+
+    def _fallback(self, key, input, error):
+        if key not in self.fallbacks:
+            raise error
+        fallback = self.fallbacks[key]
+        return fallback(input) if callable(fallback) else fallback
+
+    def _report(self, timings):
+        logger.debug("TimedParallel branch timings: %s", timings)
+        if self.on_timings is not None:
+            self.on_timings(timings)
+
+    def invoke(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> Dict[str, Any]:
+        config = ensure_config(config)
+        level = getattr(_nesting, "level", 0)
+        executor = self.executor or get_shared_executor(level=level)
+        started = time.perf_counter()
+        finished = {}
+
+        def run_branch(key, step):
+            # A TimedParallel inside this branch submits to the next level's pool
+            _nesting.level = level + 1
+            # Timed inside the branch: results are collected in key order, not finish order
+            try:
+                return step.invoke(input, patch_config(config, run_name=key))
+            finally:
+                finished[key] = time.perf_counter() - started
+                _nesting.level = 0
+
+        futures = {key: executor.submit(run_branch, key, step) for key, step in self.steps.items()}
+
+        output, timings = {}, {}
+        for key, future in futures.items():
+            timeout = self._timeout(key)
+            # Deadlines are measured from the start of the parallel step
+            remaining = None if timeout is None else max(0.0, started + timeout - time.perf_counter())
+            try:
+                output[key] = future.result(timeout=remaining)
+                status = "ok"
+            except FutureTimeoutError as e:
+                # Queued work is dropped; a running branch keeps its pool thread until it returns
+                future.cancel()
+                output[key] = self._fallback(key, input, e)
+                timings[key] = (time.perf_counter() - started, "timeout")
+                continue
+            except Exception as e:
+                output[key] = self._fallback(key, input, e)
+                status = "error"
+            timings[key] = (finished[key], status)
+
+        self._report(timings)
+        return output
+
+    async def ainvoke(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> Dict[str, Any]:
+        config = ensure_config(config)
+        started = time.perf_counter()
+        timings = {}
+
+        async def run_branch(key, step):
+            try:
+                result = await asyncio.wait_for(
+                    step.ainvoke(input, patch_config(config, run_name=key)),
+                    timeout=self._timeout(key),
+                )
+                status = "ok"
+            except asyncio.TimeoutError as e:
+                # wait_for has already cancelled the branch task
+                result = self._fallback(key, input, e)
+                status = "timeout"
+            except Exception as e:
+                result = self._fallback(key, input, e)
+                status = "error"
+            timings[key] = (time.perf_counter() - started, status)
+            return key, result
+
+        results = await asyncio.gather(
+            *(run_branch(key, step) for key, step in self.steps.items())
+        )
+        self._report(timings)
+        return dict(results)
+
+
+if __name__ == "__main__":
+    from langchain_core.runnables import RunnableLambda, RunnablePassthrough
+
+    def slow_retriever(question):
+        time.sleep(1.0)
+        return ["the dog loves to eat pizza"]
+
+    async def aslow_retriever(question):
+        await asyncio.sleep(1.0)
+        return ["the dog loves to eat pizza"]
+
+    branches = TimedParallel(
+        {
+            "context": RunnableLambda(slow_retriever, afunc=aslow_retriever),
+            "question": RunnablePassthrough(),
+        },
+        timeouts={"context": 0.2},
+        fallbacks={"context": []},
+        on_timings=print,
+    )
+
+    start = time.perf_counter()
+    print(branches.invoke("What does the dog like to eat?"))
+    print(f"sync: {time.perf_counter() - start:.3f}s")
+
+    start = time.perf_counter()
+    print(asyncio.run(branches.ainvoke("What does the dog like to eat?")))
+    print(f"async: {time.perf_counter() - start:.3f}s")
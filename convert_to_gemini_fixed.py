@@ -6,274 +6,350 @@ Usage:
     python convert_to_gemini_fixed.py --file path.py     # Convert single file
     python convert_to_gemini_fixed.py --notebooks         # Convert only notebooks
     python convert_to_gemini_fixed.py --preview           # Preview changes without applying
+
+Options:
+    --workers N          Number of worker processes (default: CPU count)
+    --no-cache           Re-check files even if they did not change since the last run
+    --report PATH        Write a unified diff of all changes to PATH
+
+All rewrite rules are compiled into a single regular expression and applied in
+one pass per file or notebook cell. Source code is tokenized first, so matches
+inside comments and string literals (including f-strings) are left alone.
+Files whose content hash matches the cache from the last run are skipped; the
+cache is dropped whenever the rules or the target model change.
 """
 
 import os
+import io
 import json
 import re
 import argparse
+import bisect
+import difflib
+import hashlib
 import sys
+import tokenize
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+CACHE_FILE = ".gemini_convert_cache.json"
+SKIP_DIRS = {"venv", ".venv", ".git", "node_modules", "__pycache__"}
+
+GEMINI_MODEL = '"gemini-1.5-flash"'
+
+# (pattern, replacement) - order matters: at the same position the first
+# matching rule wins, so specific rules come first
+RULES = [
+    (r'from\s+langchain_openai\s+import\s+ChatOpenAI\b',
+     'from langchain_google_genai import ChatGoogleGenerativeAI'),
+    (r'from\s+langchain_openai\s+import\s+OpenAIEmbeddings\b',
+     'from langchain_google_genai import GoogleGenerativeAIEmbeddings'),
+    (r'from\s+langchain_community\.embeddings\s+import\s+OpenAIEmbeddings\b',
+     'from langchain_google_genai import GoogleGenerativeAIEmbeddings'),
+    (r'from\s+langchain_openai\s+import\s+',
+     'from langchain_google_genai import '),
+    (r'\bimport\s+openai[ \t]*(?=\n|$)',
+     'import google.generativeai as genai'),
+    (r'\bChatOpenAI\s*\(',
+     'ChatGoogleGenerativeAI('),
+    (r'\bOpenAIEmbeddings\s*\(',
+     'GoogleGenerativeAIEmbeddings('),
+    (r'\bapi_key\s*=\s*os\.getenv\(["\']OPENAI_API_KEY["\']\)',
+     'google_api_key=os.getenv("GOOGLE_API_KEY")'),
+    (r'\bopenai\.chat\.completions\.create\(',
+     'genai.GenerativeModel("gemini-2.0-flash").generate_content('),
+    # Only the model argument, like the original converter: other "gpt-4"
+    # strings (e.g. tiktoken.encoding_for_model("gpt-4")) are left alone
+    (r'\bmodel\s*=\s*["\'](?:gpt-4o-mini|gpt-4o|gpt-4|gpt-3\.5-turbo)["\']',
+     f'model={GEMINI_MODEL}'),
+]
+
+# Stored in the cache, so files are re-checked once the rules change
+RULES_HASH = hashlib.sha256(json.dumps([RULES, GEMINI_MODEL]).encode("utf-8")).hexdigest()
+
+# Token types of f-strings (3.12+) and t-strings (3.14+); empty on older Pythons
+FSTRING_STARTS = {getattr(tokenize, name) for name in ("FSTRING_START", "TSTRING_START") if hasattr(tokenize, name)}
+FSTRING_ENDS = {getattr(tokenize, name) for name in ("FSTRING_END", "TSTRING_END") if hasattr(tokenize, name)}
+
+COMBINED = re.compile(
+    "|".join(f"(?P<r{i}>{pattern})" for i, (pattern, _) in enumerate(RULES)),
+    re.MULTILINE,
+)
+
+
+def protected_spans(source):
+    """Return sorted (start, end) offsets of comments and string literals.
+
+    Lines starting with ``%`` or ``!`` (notebook magics) are blanked before
+    tokenizing. If the code still cannot be tokenized, nothing is protected.
+    """
+    lines = source.splitlines(keepends=True)
+    cleaned = "".join(
+        " " * (len(line) - 1) + line[-1:] if line.lstrip().startswith(("%", "!")) else line
+        for line in lines
+    )
+    line_offsets = [0]
+    for line in lines:
+        line_offsets.append(line_offsets[-1] + len(line))
+
+    def offset(position):
+        return line_offsets[position[0] - 1] + position[1]
+
+    spans, open_fstrings = [], []
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(cleaned).readline):
+            # Python 3.12+ splits f-strings into several tokens; the whole
+            # f-string, including the code in its braces, stays protected
+            if token.type in FSTRING_STARTS:
+                open_fstrings.append(offset(token.start))
+            elif token.type in FSTRING_ENDS and open_fstrings:
+                start = open_fstrings.pop()
+                if not open_fstrings:
+                    spans.append((start, offset(token.end)))
+            elif token.type in (tokenize.STRING, tokenize.COMMENT) and not open_fstrings:
+                spans.append((offset(token.start), offset(token.end)))
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        return []
+    return sorted(spans)
+
+
+def rewrite_source(source):
+    """Apply all rules to ``source`` in a single pass."""
+    spans = protected_spans(source)
+    starts = [start for start, _ in spans]
+
+    def inside_protected(position):
+        i = bisect.bisect_right(starts, position) - 1
+        return i >= 0 and spans[i][0] <= position < spans[i][1]
+
+    def replace(match):
+        if inside_protected(match.start()):
+            return match.group(0)
+        return RULES[int(match.lastgroup[1:])][1]
+
+    return COMBINED.sub(replace, source)
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def convert_path(path, preview_only=False):
+    """Convert one file. Runs in a worker process.
+
+    Returns a dict with the path, status ("converted", "unchanged" or "error"),
+    the content hash after conversion, a unified diff and an optional error.
+    """
+    path = Path(path)
+    result = {"path": str(path), "status": "unchanged", "hash": None, "diff": "", "error": None}
+    try:
+        raw = path.read_bytes()
+        original = raw.decode("utf-8")
+
+        if path.suffix == ".ipynb":
+            notebook = json.loads(original)
+            before, after = [], []
+            for cell in notebook.get("cells", []):
+                if cell.get("cell_type") != "code":
+                    continue
+                source = cell.get("source", [])
+                source_text = "".join(source) if isinstance(source, list) else source
+                converted = rewrite_source(source_text)
+                before.append(source_text)
+                after.append(converted)
+                if converted != source_text:
+                    cell["source"] = converted.splitlines(keepends=True) if isinstance(source, list) else converted
+            changed = before != after
+            old_text = "".join(text if text.endswith("\n") else text + "\n" for text in before)
+            new_text = "".join(text if text.endswith("\n") else text + "\n" for text in after)
+            new_content = json.dumps(notebook, indent=1) if changed else original
+        else:
+            new_content = rewrite_source(original)
+            changed = new_content != original
+            old_text, new_text = original, new_content
+
+        if changed:
+            result["status"] = "converted"
+            result["diff"] = "".join(difflib.unified_diff(
+                old_text.splitlines(keepends=True),
+                new_text.splitlines(keepends=True),
+                fromfile=f"a/{os.path.relpath(path)}",
+                tofile=f"b/{os.path.relpath(path)}",
+            ))
+            if not preview_only:
+                path.write_text(new_content, encoding="utf-8")
+        result["hash"] = content_hash(new_content.encode("utf-8") if changed else raw)
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = str(e)
+    return result
+
+
 class GeminiConverter:
-    def __init__(self, repo_root):
+    def __init__(self, repo_root, workers=None, use_cache=True):
         self.repo_root = Path(repo_root)
+        self.workers = workers
+        self.use_cache = use_cache
         self.changes = []
-        
+        self.diffs = []
+        self.cache_path = self.repo_root / CACHE_FILE
+        self.cache = {}
+        if use_cache and self.cache_path.exists():
+            try:
+                stored = json.loads(self.cache_path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                stored = {}
+            # Files converted with other rules must be checked again
+            if isinstance(stored, dict) and stored.get("rules") == RULES_HASH:
+                self.cache = stored.get("files", {})
+
+    def _cache_key(self, path):
+        try:
+            return str(Path(path).resolve().relative_to(self.repo_root.resolve()))
+        except ValueError:
+            return str(Path(path).resolve())
+
+    def _is_cached(self, path):
+        if not self.use_cache:
+            return False
+        cached = self.cache.get(self._cache_key(path))
+        return cached is not None and cached == content_hash(Path(path).read_bytes())
+
+    def _save_cache(self):
+        if self.use_cache:
+            self.cache_path.write_text(
+                json.dumps({"rules": RULES_HASH, "files": self.cache}, indent=1, sort_keys=True),
+                encoding="utf-8",
+            )
+
+    def _handle_result(self, result, preview_only):
+        path = result["path"]
+        if result["status"] == "error":
+            print(f"[ERROR] Error converting {path}: {result['error']}")
+            return False
+        if result["status"] == "converted":
+            print(f"[PREVIEW] {path}" if preview_only else f"[OK] Converted: {path}")
+            self.changes.append(path)
+            self.diffs.append(result["diff"])
+        else:
+            print(f"[INFO] No changes needed: {path}")
+        # Previewed files still contain OpenAI code, so they must not be cached
+        if not preview_only or result["status"] == "unchanged":
+            self.cache[self._cache_key(path)] = result["hash"]
+        return result["status"] == "converted"
+
+    def convert_files(self, paths, preview_only=False):
+        """Convert many files in a process pool, skipping unchanged ones."""
+        paths = [Path(p) for p in paths]
+        todo = [p for p in paths if not self._is_cached(p)]
+        skipped = len(paths) - len(todo)
+        if skipped:
+            print(f"[INFO] Skipping {skipped} files unchanged since the last run")
+
+        if len(todo) > 1 and self.workers != 1:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                results = list(pool.map(convert_path, todo, [preview_only] * len(todo), chunksize=8))
+        else:
+            results = [convert_path(p, preview_only) for p in todo]
+
+        for result in results:
+            self._handle_result(result, preview_only)
+        self._save_cache()
+        return results
+
     def convert_python_file(self, file_path, preview_only=False):
         """Convert Python file from OpenAI to Gemini"""
         file_path = Path(file_path)
-        
+
         if not file_path.exists():
             print(f"[ERROR] File not found: {file_path}")
             return False
-            
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            original = content
-            
-            # Replace imports
-            content = re.sub(
-                r'from\s+langchain_openai\s+import\s+ChatOpenAI',
-                'from langchain_google_genai import ChatGoogleGenerativeAI',
-                content
-            )
-            
-            content = re.sub(
-                r'from\s+langchain_openai\s+import\s+OpenAIEmbeddings',
-                'from langchain_google_genai import GoogleGenerativeAIEmbeddings',
-                content
-            )
-            
-            content = re.sub(
-                r'from\s+langchain_community\.embeddings\s+import\s+OpenAIEmbeddings',
-                'from langchain_google_genai import GoogleGenerativeAIEmbeddings',
-                content
-            )
-            
-            content = re.sub(
-                r'import\s+openai\s*\n',
-                'import google.generativeai as genai\n',
-                content
-            )
-            
-            # Replace ChatOpenAI with ChatGoogleGenerativeAI
-            content = re.sub(
-                r'ChatOpenAI\s*\(',
-                'ChatGoogleGenerativeAI(',
-                content
-            )
-            
-            # Replace OpenAIEmbeddings with GoogleGenerativeAIEmbeddings
-            content = re.sub(
-                r'OpenAIEmbeddings\s*\(',
-                'GoogleGenerativeAIEmbeddings(',
-                content
-            )
-            
-            # Replace model names
-            model_replacements = {
-                r'model\s*=\s*["\']gpt-4o-mini["\']': 'model="gemini-1.5-flash"',
-                r'model\s*=\s*["\']gpt-4o["\']': 'model="gemini-1.5-flash"',
-                r'model\s*=\s*["\']gpt-4["\']': 'model="gemini-1.5-flash"',
-                r'model\s*=\s*["\']gpt-3.5-turbo["\']': 'model="gemini-1.5-flash"',
-            }
-            
-            for old_model, new_model in model_replacements.items():
-                content = re.sub(old_model, new_model, content)
-            
-            # Replace api_key parameter
-            content = re.sub(
-                r'api_key\s*=\s*os\.getenv\(["\']OPENAI_API_KEY["\']\)',
-                'google_api_key=os.getenv("GOOGLE_API_KEY")',
-                content
-            )
-            
-            # Replace direct API calls
-            content = re.sub(
-                r'openai\.chat\.completions\.create\(',
-                'genai.GenerativeModel("gemini-2.0-flash").generate_content(',
-                content
-            )
-            
-            if content != original:
-                if not preview_only:
-                    with open(file_path, 'w', encoding='utf-8') as f:
-                        f.write(content)
-                    print(f"[OK] Converted: {file_path}")
-                else:
-                    print(f"[PREVIEW] {file_path}")
-                
-                self.changes.append(str(file_path))
-                return True
-            else:
-                print(f"[INFO] No changes needed: {file_path}")
-                return False
-                
-        except Exception as e:
-            print(f"[ERROR] Error converting {file_path}: {str(e)}")
-            return False
-    
+
+        result = convert_path(file_path, preview_only)
+        converted = self._handle_result(result, preview_only)
+        self._save_cache()
+        return converted
+
     def convert_notebook(self, notebook_path, preview_only=False):
         """Convert Jupyter notebook from OpenAI to Gemini"""
         notebook_path = Path(notebook_path)
-        
+
         if not notebook_path.exists() or notebook_path.suffix != '.ipynb':
             print(f"[ERROR] Notebook not found: {notebook_path}")
             return False
-            
-        try:
-            with open(notebook_path, 'r', encoding='utf-8') as f:
-                notebook = json.load(f)
-            
-            original = json.dumps(notebook)
-            code_cells_changed = 0
-            
-            for cell in notebook.get('cells', []):
-                if cell['cell_type'] == 'code':
-                    source_text = ''.join(cell.get('source', []))
-                    
-                    # Replace imports
-                    source_text = re.sub(
-                        r'from\s+langchain_openai\s+import\s+OpenAIEmbeddings',
-                        'from langchain_google_genai import GoogleGenerativeAIEmbeddings',
-                        source_text
-                    )
-                    
-                    source_text = re.sub(
-                        r'from\s+langchain_openai\s+import\s+ChatOpenAI',
-                        'from langchain_google_genai import ChatGoogleGenerativeAI',
-                        source_text
-                    )
-                    
-                    source_text = re.sub(
-                        r'from\s+langchain_openai\s+import\s+(.*)',
-                        lambda m: f'from langchain_google_genai import {m.group(1)}',
-                        source_text
-                    )
-                    
-                    source_text = re.sub(
-                        r'import\s+openai',
-                        'import google.generativeai as genai',
-                        source_text
-                    )
-                    
-                    # Replace ChatOpenAI
-                    source_text = re.sub(
-                        r'ChatOpenAI\s*\(',
-                        'ChatGoogleGenerativeAI(',
-                        source_text
-                    )
-                    
-                    # Replace OpenAIEmbeddings
-                    source_text = re.sub(
-                        r'OpenAIEmbeddings\s*\(',
-                        'GoogleGenerativeAIEmbeddings(',
-                        source_text
-                    )
-                    
-                    # Replace model names
-                    model_replacements = {
-                        r'["\']gpt-4o-mini["\']': '"gemini-1.5-flash"',
-                        r'["\']gpt-4o["\']': '"gemini-1.5-flash"',
-                        r'["\']gpt-4["\']': '"gemini-1.5-flash"',
-                        r'["\']gpt-3.5-turbo["\']': '"gemini-1.5-flash"',
-                    }
-                    
-                    for old_model, new_model in model_replacements.items():
-                        source_text = re.sub(old_model, new_model, source_text)
-                    
-                    # Update source
-                    if isinstance(cell['source'], list):
-                        cell['source'] = source_text.splitlines(keepends=True)
-                    else:
-                        cell['source'] = source_text
-                    
-                    code_cells_changed += 1
-            
-            if json.dumps(notebook) != original:
-                if not preview_only:
-                    with open(notebook_path, 'w', encoding='utf-8') as f:
-                        json.dump(notebook, f, indent=1)
-                    print(f"[OK] Converted: {notebook_path}")
-                else:
-                    print(f"[PREVIEW] {notebook_path}")
-                
-                self.changes.append(str(notebook_path))
-                return True
-            else:
-                print(f"[INFO] No changes needed: {notebook_path}")
-                return False
-                
-        except Exception as e:
-            print(f"[ERROR] Error converting {notebook_path}: {str(e)}")
-            return False
-    
+
+        result = convert_path(notebook_path, preview_only)
+        converted = self._handle_result(result, preview_only)
+        self._save_cache()
+        return converted
+
+    def find_files(self, pattern):
+        files = []
+        for path in self.repo_root.rglob(pattern):
+            if not SKIP_DIRS.intersection(path.relative_to(self.repo_root).parts):
+                files.append(path)
+        return files
+
     def convert_all(self, preview_only=False):
         """Convert all Python files and notebooks"""
         print("\n[INFO] Finding files to convert...")
-        
-        # Find Python files
-        py_files = list(self.repo_root.rglob("*.py"))
-        py_files = [f for f in py_files if "venv" not in str(f) and ".git" not in str(f)]
-        
-        # Find notebooks
-        nb_files = list(self.repo_root.rglob("*.ipynb"))
-        nb_files = [f for f in nb_files if "venv" not in str(f) and ".git" not in str(f)]
-        
+
+        py_files = self.find_files("*.py")
+        nb_files = self.find_files("*.ipynb")
+
         print(f"[INFO] Found {len(py_files)} Python files and {len(nb_files)} notebooks\n")
-        
-        # Convert Python files
-        if py_files:
-            print("Converting Python files...")
-            for py_file in py_files:
-                self.convert_python_file(py_file, preview_only=preview_only)
-        
-        # Convert notebooks
-        if nb_files:
-            print("\nConverting Jupyter notebooks...")
-            for nb_file in nb_files:
-                self.convert_notebook(nb_file, preview_only=preview_only)
-        
+
+        self.convert_files(py_files + nb_files, preview_only=preview_only)
+
         # Summary
         print("\n" + "="*60)
         print(f"CONVERSION COMPLETE")
         print("="*60)
         print(f"Total files modified: {len(self.changes)}")
-        
+
         if self.changes:
             print("\nModified files:")
             for f in self.changes:
                 print(f"  - {f}")
-        
+
         if preview_only:
             print("\n[INFO] Run without --preview to apply changes")
 
+    def write_report(self, report_path):
+        Path(report_path).write_text("".join(self.diffs), encoding="utf-8")
+        print(f"[INFO] Diff report written to {report_path}")
+
+
 def main():
     parser = argparse.ArgumentParser(description="Convert OpenAI code to Gemini API")
     parser.add_argument("--all", action="store_true", help="Convert all files")
     parser.add_argument("--file", type=str, help="Convert specific file")
     parser.add_argument("--notebooks", action="store_true", help="Convert only notebooks")
     parser.add_argument("--preview", action="store_true", help="Preview changes without applying")
-    
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--no-cache", action="store_true", help="Ignore the content-hash cache")
+    parser.add_argument("--report", type=str, help="Write a unified diff of all changes to this file")
+
     args = parser.parse_args()
-    
+
     repo_root = Path(__file__).parent
-    converter = GeminiConverter(repo_root)
-    
+    converter = GeminiConverter(repo_root, workers=args.workers, use_cache=not args.no_cache)
+
     if args.file:
-        converter.convert_python_file(args.file, preview_only=args.preview)
+        if args.file.endswith(".ipynb"):
+            converter.convert_notebook(args.file, preview_only=args.preview)
+        else:
+            converter.convert_python_file(args.file, preview_only=args.preview)
     elif args.all:
         converter.convert_all(preview_only=args.preview)
     elif args.notebooks:
-        nb_files = list(repo_root.rglob("*.ipynb"))
-        nb_files = [f for f in nb_files if "venv" not in str(f)]
-        for nb_file in nb_files:
-            converter.convert_notebook(nb_file, preview_only=args.preview)
+        converter.convert_files(converter.find_files("*.ipynb"), preview_only=args.preview)
     else:
         parser.print_help()
+        return
+
+    if args.report or args.preview:
+        converter.write_report(args.report or "conversion_report.diff")
 
 if __name__ == "__main__":
     main()
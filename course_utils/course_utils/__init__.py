@@ -0,0 +1,5 @@
+"""Helpers shared by several chapters and by service3.
+
+Install once from the repository root with ``pip install -e ./course_utils``
+(service3's image installs a copy staged by deployment.sh).
+"""
@@ -0,0 +1,195 @@
+"""Token-budgeted context packing for stuff-documents chains.
+
+A stuff-documents chain pastes every retrieved chunk into the prompt in full.
+ContextPacker shrinks that context before it reaches the model:
+
+1. chunks of the same source that overlap (``chunk_overlap``) are merged,
+2. duplicate chunks and chunks contained in another chunk are dropped,
+3. every passage is split into sentences that are scored against the query
+   (IDF-weighted term overlap, optionally blended with embedding similarity),
+4. passages are added in relevance order, keeping only their relevant
+   sentences, until the token budget is used up.
+
+    from course_utils.context_packer import ContextPacker, PackedRetriever
+
+    packer = ContextPacker(max_tokens=800)
+    retriever = PackedRetriever(retriever=vectorstore.as_retriever(), packer=packer)
+"""
+
+import math
+import re
+from typing import Callable, List, Optional
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(])|\n+")
+WORD = re.compile(r"\w+")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from",
+    "how", "i", "in", "is", "it", "me", "my", "of", "on", "or", "the", "to", "we", "what",
+    "when", "where", "which", "who", "why", "with", "you", "your",
+}
+
+
+def approximate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)."""
+    return max(1, math.ceil(len(text) / 4))
+
+
+def _terms(text: str) -> List[str]:
+    return [word for word in WORD.findall(text.lower()) if word not in STOPWORDS]
+
+
+def _overlap(a: str, b: str, min_overlap: int = 10) -> int:
+    """Length of the longest suffix of ``a`` that is a prefix of ``b``."""
+    for size in range(min(len(a), len(b)), min_overlap - 1, -1):
+        if a.endswith(b[:size]):
+            return size
+    return 0
+
+
+def _stitch(first: str, second: str) -> Optional[str]:
+    size = _overlap(first, second)
+    return first + second[size:] if size else None
+
+
+def merge_adjacent(docs: List[Document]) -> List[Document]:
+    """Merge chunks of the same source whose texts overlap, drop duplicates.
+
+    The merged passage takes the position of its best-ranked chunk.
+    """
+    passages: List[Document] = []
+    for doc in docs:
+        text = doc.page_content.strip()
+        source = doc.metadata.get("source")
+        for i, passage in enumerate(passages):
+            if passage.metadata.get("source") != source:
+                continue
+            existing = passage.page_content
+            if text in existing:
+                break
+            if existing in text:
+                passages[i] = Document(page_content=text, metadata=passage.metadata)
+                break
+            merged = _stitch(existing, text) or _stitch(text, existing)
+            if merged:
+                passages[i] = Document(page_content=merged, metadata=passage.metadata)
+                break
+        else:
+            passages.append(Document(page_content=text, metadata=dict(doc.metadata)))
+    return passages
+
+
+class ContextPacker:
+    """Fit retrieved documents into a token budget, most relevant sentences first.
+
+    Args:
+        max_tokens: Token budget for the whole context.
+        embeddings: Optional embeddings; sentence scores then blend in cosine
+            similarity to the query (one extra embedding call per query).
+        lexical_weight: Weight of the term-overlap score when embeddings are used.
+        min_score: Sentences scoring below this are dropped. The best sentence of
+            a passage is always kept.
+        token_counter: Function counting the tokens of a string, for example
+            ``llm.get_num_tokens``. Defaults to a character-based estimate.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 1000,
+        embeddings: Optional[Embeddings] = None,
+        lexical_weight: float = 0.5,
+        min_score: float = 0.1,
+        token_counter: Callable[[str], int] = approximate_tokens,
+    ):
+        self.max_tokens = max_tokens
+        self.embeddings = embeddings
+        self.lexical_weight = lexical_weight
+        self.min_score = min_score
+        self.token_counter = token_counter
+        self.stats = {"queries": 0, "input_tokens": 0, "packed_tokens": 0}
+
+    def _scores(self, query: str, sentences: List[str]) -> np.ndarray:
+        sentence_terms = [set(_terms(sentence)) for sentence in sentences]
+        query_terms = set(_terms(query))
+        n = len(sentences)
+        idf = {
+            term: math.log(1 + n / (1 + sum(term in terms for terms in sentence_terms)))
+            for term in query_terms
+        }
+        total = sum(idf.values()) or 1.0
+        scores = np.array(
+            [sum(idf[term] for term in query_terms & terms) / total for terms in sentence_terms],
+            dtype=np.float32,
+        )
+        if self.embeddings is not None:
+            vectors = np.asarray(self.embeddings.embed_documents(sentences), dtype=np.float32)
+            query_vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+            query_vector /= np.linalg.norm(query_vector) + 1e-12
+            scores = self.lexical_weight * scores + (1 - self.lexical_weight) * (vectors @ query_vector)
+        return scores
+
+    def pack(self, query: str, docs: List[Document]) -> List[Document]:
+        """Return packed documents whose combined size stays within ``max_tokens``."""
+        passages = merge_adjacent(docs)
+        split = [[s.strip() for s in SENTENCE_SPLIT.split(p.page_content) if s.strip()] for p in passages]
+        flat = [sentence for sentences in split for sentence in sentences]
+        if not flat:
+            return []
+        scores = self._scores(query, flat)
+
+        # Score, rank and sentence indices of every passage
+        ranked, offset = [], 0
+        for rank, sentences in enumerate(split):
+            passage_scores = scores[offset:offset + len(sentences)]
+            offset += len(sentences)
+            if not sentences:
+                continue
+            keep = [i for i, score in enumerate(passage_scores) if score >= self.min_score]
+            keep = keep or [int(np.argmax(passage_scores))]
+            ranked.append((float(passage_scores.max()), rank, sentences, passage_scores, keep))
+        ranked.sort(key=lambda item: (-item[0], item[1]))
+
+        packed, used = [], 0
+        for _, rank, sentences, passage_scores, keep in ranked:
+            remaining = self.max_tokens - used
+            if remaining <= 0:
+                break
+            # Most relevant sentences first until the passage no longer fits
+            chosen, size = [], 0
+            for i in sorted(keep, key=lambda i: -passage_scores[i]):
+                tokens = self.token_counter(sentences[i])
+                if size + tokens <= remaining:
+                    chosen.append(i)
+                    size += tokens
+            if not chosen:
+                continue
+            chosen.sort()
+            text = sentences[chosen[0]]
+            for previous, i in zip(chosen, chosen[1:]):
+                text += (" " if i == previous + 1 else " ... ") + sentences[i]
+            packed.append(Document(page_content=text, metadata=passages[rank].metadata))
+            used += size
+
+        self.stats["queries"] += 1
+        self.stats["input_tokens"] += sum(self.token_counter(doc.page_content) for doc in docs)
+        self.stats["packed_tokens"] += used
+        return packed
+
+
+class PackedRetriever(BaseRetriever):
+    """Wraps a retriever and packs its documents with a ContextPacker."""
+
+    retriever: BaseRetriever
+    packer: ContextPacker
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        docs = self.retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        return self.packer.pack(query, docs)
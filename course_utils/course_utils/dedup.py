@@ -0,0 +1,253 @@
+"""Near-duplicate chunk filter that runs between the text splitter and the vector store.
+
+Chunks are compared by MinHash (Jaccard similarity of word shingles, with LSH
+banding to find candidates) or SimHash (Hamming distance of 64-bit fingerprints,
+with the fingerprints split into bands to find candidates).
+Candidate pairs can additionally be confirmed by embedding cosine similarity.
+Only chunks that take part in a candidate pair are embedded for that check.
+
+Every duplicate group keeps its earliest chunk as the representative, and a
+chunk is only removed if it is similar to that representative itself: A ~ B
+and B ~ C do not remove C unless A ~ C as well.
+
+    dedup = NearDuplicateFilter(method="minhash", threshold=0.8)
+    docs = dedup.transform_documents(text_splitter.split_documents(documents))
+"""
+
+import hashlib
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence
+
+import numpy as np
+from langchain_core.documents import BaseDocumentTransformer, Document
+from langchain_core.embeddings import Embeddings
+
+_MERSENNE_PRIME = (1 << 31) - 1
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+@dataclass
+class DuplicateMatch:
+    removed: Document
+    kept: Document
+    score: float
+
+
+@dataclass
+class DedupReport:
+    total: int = 0
+    kept: int = 0
+    matches: List[DuplicateMatch] = field(default_factory=list)
+
+    @property
+    def removed(self):
+        return self.total - self.kept
+
+    def summary(self):
+        lines = [f"Kept {self.kept} of {self.total} chunks, removed {self.removed}"]
+        for match in self.matches:
+            lines.append(
+                f"  - {match.removed.metadata.get('source')} ~ "
+                f"{match.kept.metadata.get('source')} ({match.score:.2f}): "
+                f"{match.removed.page_content[:60]!r}"
+            )
+        return "\n".join(lines)
+
+
+def _tokens(text):
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+def _hash32(value):
+    digest = hashlib.blake2b(value.encode("utf-8"), digest_size=4).digest()
+    return int.from_bytes(digest, "little")
+
+
+def _shingles(text, size):
+    tokens = _tokens(text)
+    if len(tokens) < size:
+        return {" ".join(tokens)}
+    return {" ".join(tokens[i : i + size]) for i in range(len(tokens) - size + 1)}
+
+
+def _simhash(text):
+    weights = np.zeros(64, dtype=np.int64)
+    for token in _tokens(text):
+        digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+        bits = np.unpackbits(np.frombuffer(digest, dtype=np.uint8))
+        weights += np.where(bits == 1, 1, -1)
+    return int("".join("1" if w > 0 else "0" for w in weights), 2)
+
+
+class NearDuplicateFilter(BaseDocumentTransformer):
+    """Drop or merge near-duplicate chunks before they are embedded.
+
+    Args:
+        method: "minhash" or "simhash".
+        threshold: Minimum estimated Jaccard similarity (minhash) to treat two
+            chunks as duplicates.
+        max_hamming_distance: Maximum number of differing fingerprint bits (simhash).
+        shingle_size: Number of words per shingle (minhash).
+        num_perm: Number of MinHash permutations; must be divisible by ``bands``.
+        bands: Number of LSH bands used to find candidate pairs (minhash).
+        embeddings: Optional embedding model to confirm candidate pairs.
+        embedding_threshold: Minimum cosine similarity for the embedding check.
+        merge: Keep the removed chunk's source in the kept chunk's metadata
+            under ``duplicate_sources`` instead of dropping it silently.
+    """
+
+    def __init__(
+        self,
+        method: str = "minhash",
+        threshold: float = 0.8,
+        max_hamming_distance: int = 3,
+        shingle_size: int = 3,
+        num_perm: int = 128,
+        bands: int = 32,
+        embeddings: Optional[Embeddings] = None,
+        embedding_threshold: float = 0.95,
+        merge: bool = False,
+    ):
+        if method not in ("minhash", "simhash"):
+            raise ValueError(f"Unknown dedup method: {method}")
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.method = method
+        self.threshold = threshold
+        self.max_hamming_distance = max_hamming_distance
+        self.shingle_size = shingle_size
+        self.num_perm = num_perm
+        self.bands = bands
+        self.embeddings = embeddings
+        self.embedding_threshold = embedding_threshold
+        self.merge = merge
+        self.last_report = DedupReport()
+
+        rng = np.random.default_rng(42)
+        self._a = rng.integers(1, _MERSENNE_PRIME, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _MERSENNE_PRIME, num_perm, dtype=np.uint64)
+
+    def _minhash(self, text):
+        hashes = np.array(
+            [_hash32(s) % _MERSENNE_PRIME for s in _shingles(text, self.shingle_size)],
+            dtype=np.uint64,
+        )
+        permuted = (np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME
+        return permuted.min(axis=0)
+
+    def _minhash_candidates(self, texts):
+        signatures = np.stack([self._minhash(text) for text in texts])
+        rows = self.num_perm // self.bands
+        candidates = set()
+        for band in range(self.bands):
+            buckets = {}
+            for i, sig in enumerate(signatures[:, band * rows : (band + 1) * rows]):
+                buckets.setdefault(sig.tobytes(), []).append(i)
+            for members in buckets.values():
+                for x, i in enumerate(members):
+                    for j in members[x + 1 :]:
+                        candidates.add((i, j))
+
+        def score(i, j):
+            value = float(np.mean(signatures[i] == signatures[j]))
+            return value if value >= self.threshold else None
+
+        return candidates, score
+
+    def _simhash_candidates(self, texts):
+        fingerprints = [_simhash(text) for text in texts]
+        # Two fingerprints within d bits of each other agree on at least one of d + 1 bands
+        bands = min(self.max_hamming_distance + 1, 64)
+        edges = [64 * band // bands for band in range(bands + 1)]
+        candidates = set()
+        for start, end in zip(edges, edges[1:]):
+            mask = (1 << (end - start)) - 1
+            buckets = {}
+            for i, fingerprint in enumerate(fingerprints):
+                buckets.setdefault((fingerprint >> start) & mask, []).append(i)
+            for members in buckets.values():
+                for x, i in enumerate(members):
+                    for j in members[x + 1 :]:
+                        candidates.add((i, j))
+
+        def score(i, j):
+            distance = bin(fingerprints[i] ^ fingerprints[j]).count("1")
+            return 1 - distance / 64 if distance <= self.max_hamming_distance else None
+
+        return candidates, score
+
+    def _confirm_with_embeddings(self, texts, pairs, score):
+        """Wrap ``score`` so that a pair must also pass the embedding threshold."""
+        involved = sorted({i for pair in pairs for i in pair})
+        vectors = np.asarray(
+            self.embeddings.embed_documents([texts[i] for i in involved]),
+            dtype=np.float32,
+        )
+        # Empty chunks can embed to a zero vector
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        position = {doc_index: row for row, doc_index in enumerate(involved)}
+
+        def confirmed(i, j):
+            if i not in position or j not in position or score(i, j) is None:
+                return None
+            value = float(vectors[position[i]] @ vectors[position[j]])
+            return value if value >= self.embedding_threshold else None
+
+        return confirmed
+
+    def transform_documents(
+        self, documents: Sequence[Document], **kwargs
+    ) -> Sequence[Document]:
+        documents = list(documents)
+        report = DedupReport(total=len(documents))
+        texts = [doc.page_content for doc in documents]
+
+        if not texts:
+            candidates, score = set(), None
+        elif self.method == "minhash":
+            candidates, score = self._minhash_candidates(texts)
+        else:
+            candidates, score = self._simhash_candidates(texts)
+        pairs = [(i, j) for i, j in candidates if score(i, j) is not None]
+        if pairs and self.embeddings is not None:
+            score = self._confirm_with_embeddings(texts, pairs, score)
+
+        # The earliest chunk of every duplicate group is its representative. Pairs
+        # are visited by their later chunk, so a representative is final when used,
+        # and a chunk joins a group only if it is similar to the representative
+        keeper = list(range(len(documents)))
+        duplicates = []
+        for i, j in sorted(pairs, key=lambda pair: (pair[1], pair[0])):
+            if keeper[j] != j:
+                continue
+            root = keeper[i]
+            value = score(root, j)
+            if value is not None:
+                keeper[j] = root
+                duplicates.append((j, root, value))
+
+        if self.merge:
+            # Merged metadata goes into copies, the caller's documents stay unchanged
+            for root in {root for _, root, _ in duplicates}:
+                documents[root] = documents[root].model_copy(deep=True)
+        for j, root, score in duplicates:
+            report.matches.append(
+                DuplicateMatch(removed=documents[j], kept=documents[root], score=score)
+            )
+
+        kept = []
+        for i, doc in enumerate(documents):
+            if keeper[i] == i:
+                kept.append(doc)
+
+        if self.merge:
+            for match in report.matches:
+                sources = match.kept.metadata.setdefault("duplicate_sources", [])
+                source = match.removed.metadata.get("source")
+                if source not in sources:
+                    sources.append(source)
+
+        report.kept = len(kept)
+        self.last_report = report
+        return kept
@@ -0,0 +1,498 @@
+"""Client-side rate limiting of Gemini calls, shared by all services.
+
+Every process that talks to Gemini draws from the same two token buckets:
+requests per minute and tokens per minute. With ``redis_url`` the buckets live
+in Redis and are updated atomically by a Lua script, so all services and
+replicas share one view of the project quota. Without Redis, or while it is
+unreachable, each process falls back to its own in-memory buckets; after a
+Redis error it tries Redis again every ``redis_retry`` seconds.
+
+On top of the buckets every process adapts its number of concurrent calls
+AIMD-style: one extra slot after a window of successful calls, half the slots
+after a 429 (and a gentle decrease when latency exceeds ``latency_target``).
+A 429 also sets a short shared cool-down, and every caller then waits a random
+part of its backoff, so processes do not retry in lockstep.
+
+Interactive calls go first. Batch calls leave ``batch_reserve`` of both buckets
+and of the concurrency slots to interactive calls, and wait while interactive
+calls are queued.
+
+    from course_utils.rate_limiter import BATCH, limiter_from_env
+
+    limiter = limiter_from_env()
+    llm = limiter.wrap(ChatGoogleGenerativeAI(model="gemini-2.5-flash", max_retries=0))
+    batch_llm = limiter.wrap(ChatGoogleGenerativeAI(model="gemini-2.5-flash", max_retries=0), priority=BATCH)
+
+The wrapped models retry 429s themselves, so the client's own retries are disabled.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterator, Optional
+
+from langchain_core.messages import HumanMessage, convert_to_messages
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.prompt_values import PromptValue
+from langchain_core.runnables import Runnable, RunnableConfig
+
+try:
+    import redis
+except ImportError:  # Redis is optional, the limiter then works per process
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+
+POLL_INTERVAL = 0.02
+
+# KEYS: bucket hash, cool-down key. ARGV: rpm, tpm, burst seconds, reserve, request cost, token cost.
+# Returns the seconds to wait (as a string, Redis truncates Lua numbers), "0" when granted.
+_TAKE_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local cooldown = redis.call('PTTL', KEYS[2])
+if cooldown > 0 then return tostring(cooldown / 1000) end
+
+local rpm, tpm = tonumber(ARGV[1]), tonumber(ARGV[2])
+local burst, reserve = tonumber(ARGV[3]), tonumber(ARGV[4])
+local cost_r, cost_t = tonumber(ARGV[5]), tonumber(ARGV[6])
+local cap_r, cap_t = rpm * burst / 60, tpm * burst / 60
+
+local state = redis.call('HMGET', KEYS[1], 'requests', 'tokens', 'ts')
+local elapsed = 0
+if state[3] then elapsed = math.max(0, now - tonumber(state[3])) end
+local level_r = math.min(cap_r, (tonumber(state[1]) or cap_r) + elapsed * rpm / 60)
+local level_t = math.min(cap_t, (tonumber(state[2]) or cap_t) + elapsed * tpm / 60)
+
+local need_r = math.min(cost_r + reserve * cap_r, cap_r)
+local need_t = math.min(cost_t + reserve * cap_t, cap_t)
+local wait = 0
+if level_r < need_r then wait = math.max(wait, (need_r - level_r) * 60 / rpm) end
+if level_t < need_t then wait = math.max(wait, (need_t - level_t) * 60 / tpm) end
+if wait == 0 then
+  level_r = level_r - cost_r
+  level_t = level_t - cost_t
+end
+redis.call('HSET', KEYS[1], 'requests', level_r, 'tokens', level_t, 'ts', now)
+redis.call('EXPIRE', KEYS[1], 3600)
+return tostring(wait)
+"""
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """True for HTTP 429 / RESOURCE_EXHAUSTED errors of the Gemini clients."""
+    if getattr(error, "code", None) == 429 or getattr(error, "status_code", None) == 429:
+        return True
+    if type(error).__name__ in ("ResourceExhausted", "TooManyRequests", "RateLimitError"):
+        return True
+    message = str(error)
+    return "429" in message or "RESOURCE_EXHAUSTED" in message
+
+
+def used_tokens(result: Any) -> int:
+    """Total tokens reported in the usage metadata of a model result."""
+    messages = getattr(result, "result", result)
+    if not isinstance(messages, (list, tuple)):
+        messages = [messages]
+    return sum((getattr(m, "usage_metadata", None) or {}).get("total_tokens", 0) for m in messages)
+
+
+class _LocalBuckets:
+    """In-process version of the Redis token buckets."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.levels = None
+        self.updated = time.monotonic()
+        self.cooldown_until = 0.0
+
+    def take(self, rpm, tpm, burst, reserve, cost_r, cost_t) -> float:
+        with self.lock:
+            now = time.monotonic()
+            if now < self.cooldown_until:
+                return self.cooldown_until - now
+            cap_r, cap_t = rpm * burst / 60, tpm * burst / 60
+            level_r, level_t = self.levels or (cap_r, cap_t)
+            elapsed = now - self.updated
+            level_r = min(cap_r, level_r + elapsed * rpm / 60)
+            level_t = min(cap_t, level_t + elapsed * tpm / 60)
+
+            need_r = min(cost_r + reserve * cap_r, cap_r)
+            need_t = min(cost_t + reserve * cap_t, cap_t)
+            wait = max(0.0, (need_r - level_r) * 60 / rpm, (need_t - level_t) * 60 / tpm)
+            if wait == 0:
+                level_r -= cost_r
+                level_t -= cost_t
+            self.levels, self.updated = (level_r, level_t), now
+            return wait
+
+    def adjust(self, tokens: float) -> None:
+        with self.lock:
+            if self.levels is not None:
+                self.levels = (self.levels[0], self.levels[1] - tokens)
+
+    def cool_down(self, seconds: float) -> None:
+        with self.lock:
+            self.cooldown_until = max(self.cooldown_until, time.monotonic() + seconds)
+
+
+class _AdaptiveConcurrency:
+    """Per-process concurrency limit with additive increase, multiplicative decrease."""
+
+    def __init__(self, max_concurrency: int, min_concurrency: int, batch_reserve: float):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.batch_reserve = batch_reserve
+        self.limit = float(max_concurrency)
+        self.in_use = 0
+        self.waiting_interactive = 0
+        self.last_decrease = 0.0
+        self.lock = threading.Lock()
+
+    def try_acquire(self, priority: str) -> bool:
+        with self.lock:
+            limit = max(1, int(self.limit))
+            if priority == BATCH:
+                if self.waiting_interactive or self.in_use >= max(1, int(limit * (1 - self.batch_reserve))):
+                    return False
+            elif self.in_use >= limit:
+                return False
+            self.in_use += 1
+            return True
+
+    def release(self) -> None:
+        with self.lock:
+            self.in_use -= 1
+
+    def waiting(self, priority: str, delta: int) -> None:
+        if priority == INTERACTIVE:
+            with self.lock:
+                self.waiting_interactive += delta
+
+    def increase(self) -> None:
+        with self.lock:
+            # +1 slot once a full window of ``limit`` calls succeeded
+            self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+
+    def decrease(self, factor: float) -> None:
+        with self.lock:
+            # One decrease per second, a burst of 429s from the same overload counts once
+            now = time.monotonic()
+            if now - self.last_decrease >= 1.0:
+                self.limit = max(self.min_concurrency, self.limit * factor)
+                self.last_decrease = now
+
+
+class SharedRateLimiter:
+    """Requests/min and tokens/min limits with adaptive concurrency and priorities.
+
+    Args:
+        requests_per_minute: Request quota of the project.
+        tokens_per_minute: Token quota (input + output) of the project.
+        redis_url: Share the buckets through this Redis; in-process buckets if None.
+        key: Redis key prefix, one per quota.
+        burst_seconds: Bucket size in seconds of quota.
+        max_concurrency: Upper bound of concurrent calls per process.
+        min_concurrency: Lower bound the AIMD decrease never goes below.
+        latency_target: Calls slower than this (seconds) shrink the concurrency.
+        batch_reserve: Share of buckets and slots that batch calls leave free.
+        expected_output_tokens: Output tokens reserved per call before the real
+            usage is known; the difference is settled afterwards.
+        max_retries: Retries after a 429.
+        base_backoff: Shared cool-down after a 429 and base of the jittered backoff.
+        max_backoff: Upper bound of the backoff.
+        redis_retry: Seconds on in-process buckets after a Redis error before
+            Redis is tried again.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int = 60,
+        tokens_per_minute: int = 1_000_000,
+        redis_url: Optional[str] = None,
+        key: str = "gemini",
+        burst_seconds: float = 10.0,
+        max_concurrency: int = 16,
+        min_concurrency: int = 1,
+        latency_target: Optional[float] = None,
+        batch_reserve: float = 0.2,
+        expected_output_tokens: int = 256,
+        max_retries: int = 6,
+        base_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        redis_retry: float = 5.0,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.key = key
+        self.burst_seconds = burst_seconds
+        self.latency_target = latency_target
+        self.batch_reserve = batch_reserve
+        self.expected_output_tokens = expected_output_tokens
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.redis_retry = redis_retry
+
+        self._local = _LocalBuckets()
+        self._concurrency = _AdaptiveConcurrency(max_concurrency, min_concurrency, batch_reserve)
+        self._redis = None
+        self._redis_retry_at = 0.0
+        if redis_url and redis is not None:
+            self._redis = redis.Redis.from_url(redis_url, socket_timeout=0.5)
+            self._take_script = self._redis.register_script(_TAKE_SCRIPT)
+        elif redis_url:
+            logger.warning("redis is not installed, rate limits are enforced per process")
+        self.stats = {"calls": 0, "throttled": 0, "retries": 0, "wait_seconds": 0.0, "batch_calls": 0}
+
+    # -- buckets -------------------------------------------------------------
+
+    @property
+    def _shared(self) -> bool:
+        """True while the buckets are in Redis (not after a recent Redis error)."""
+        return self._redis is not None and time.monotonic() >= self._redis_retry_at
+
+    def _redis_failed(self, error: Exception) -> None:
+        # The client reconnects by itself on the next call after the pause
+        logger.warning(
+            "Rate limiter Redis unavailable, using in-process buckets for %.0fs: %s", self.redis_retry, error
+        )
+        self._redis_retry_at = time.monotonic() + self.redis_retry
+
+    def _take(self, priority: str, tokens: int) -> float:
+        reserve = self.batch_reserve if priority == BATCH else 0.0
+        args = (self.requests_per_minute, self.tokens_per_minute, self.burst_seconds, reserve, 1, tokens)
+        if self._shared:
+            try:
+                return float(self._take_script(keys=[f"{self.key}:bucket", f"{self.key}:cooldown"], args=args))
+            except redis.RedisError as e:
+                self._redis_failed(e)
+        return self._local.take(*args)
+
+    def _adjust(self, tokens: int) -> None:
+        if not tokens:
+            return
+        if self._shared:
+            try:
+                self._redis.hincrbyfloat(f"{self.key}:bucket", "tokens", -tokens)
+                return
+            except redis.RedisError as e:
+                self._redis_failed(e)
+        self._local.adjust(tokens)
+
+    def _cool_down(self, seconds: float) -> None:
+        if self._shared:
+            try:
+                self._redis.set(f"{self.key}:cooldown", 1, px=int(seconds * 1000))
+                return
+            except redis.RedisError as e:
+                self._redis_failed(e)
+        self._local.cool_down(seconds)
+
+    # -- acquire / release ---------------------------------------------------
+
+    def estimate_tokens(self, input: Any) -> int:
+        """Approximate input tokens of a prompt plus the expected output."""
+        if isinstance(input, PromptValue):
+            messages = input.to_messages()
+        elif isinstance(input, str):
+            messages = [HumanMessage(content=input)]
+        else:
+            messages = convert_to_messages(input)
+        return count_tokens_approximately(messages) + self.expected_output_tokens
+
+    def _try_acquire(self, priority: str, tokens: int) -> float:
+        """0 once a slot and the quota are taken, otherwise seconds to wait."""
+        if not self._concurrency.try_acquire(priority):
+            return POLL_INTERVAL
+        wait = self._take(priority, tokens)
+        if wait:
+            self._concurrency.release()
+            # A little jitter so waiting processes do not wake up together
+            return wait + random.uniform(0, POLL_INTERVAL)
+        return 0.0
+
+    def acquire(self, priority: str = INTERACTIVE, tokens: int = 0) -> None:
+        self._concurrency.waiting(priority, 1)
+        try:
+            while wait := self._try_acquire(priority, tokens):
+                self.stats["wait_seconds"] += wait
+                time.sleep(wait)
+        finally:
+            self._concurrency.waiting(priority, -1)
+
+    async def aacquire(self, priority: str = INTERACTIVE, tokens: int = 0) -> None:
+        self._concurrency.waiting(priority, 1)
+        try:
+            while True:
+                if self._shared:
+                    wait = await asyncio.to_thread(self._try_acquire, priority, tokens)
+                else:
+                    wait = self._try_acquire(priority, tokens)
+                if not wait:
+                    return
+                self.stats["wait_seconds"] += wait
+                await asyncio.sleep(wait)
+        finally:
+            self._concurrency.waiting(priority, -1)
+
+    def _succeeded(self, priority: str, tokens: int, result: Any, seconds: float) -> None:
+        self._concurrency.release()
+        self.stats["calls"] += 1
+        if priority == BATCH:
+            self.stats["batch_calls"] += 1
+        used = used_tokens(result)
+        if used:
+            self._adjust(used - tokens)
+        if self.latency_target is not None and seconds > self.latency_target:
+            self._concurrency.decrease(0.9)
+        else:
+            self._concurrency.increase()
+
+    def _failed(self, error: BaseException, attempt: int) -> Optional[float]:
+        """Backoff before the next attempt, or None if the error is final."""
+        self._concurrency.release()
+        if not is_rate_limit_error(error):
+            return None
+        self.stats["throttled"] += 1
+        self._concurrency.decrease(0.5)
+        self._cool_down(self.base_backoff)
+        if attempt >= self.max_retries:
+            return None
+        self.stats["retries"] += 1
+        # Full jitter: spread the retries of all callers over the backoff window
+        return random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+
+    # -- calls ---------------------------------------------------------------
+
+    def call(self, fn: Callable[[], Any], priority: str = INTERACTIVE, tokens: int = 0) -> Any:
+        """Run ``fn`` within the limits, retrying it after 429s."""
+        for attempt in range(self.max_retries + 1):
+            self.acquire(priority, tokens)
+            start = time.monotonic()
+            try:
+                result = fn()
+            except Exception as e:
+                backoff = self._failed(e, attempt)
+                if backoff is None:
+                    raise
+                time.sleep(backoff)
+                continue
+            except BaseException:
+                self._concurrency.release()
+                raise
+            self._succeeded(priority, tokens, result, time.monotonic() - start)
+            return result
+
+    async def acall(self, fn: Callable[[], Awaitable[Any]], priority: str = INTERACTIVE, tokens: int = 0) -> Any:
+        for attempt in range(self.max_retries + 1):
+            await self.aacquire(priority, tokens)
+            start = time.monotonic()
+            try:
+                result = await fn()
+            except Exception as e:
+                backoff = self._failed(e, attempt)
+                if backoff is None:
+                    raise
+                await asyncio.sleep(backoff)
+                continue
+            except BaseException:
+                # Cancelled: free the slot, nothing to learn from it
+                self._concurrency.release()
+                raise
+            self._succeeded(priority, tokens, result, time.monotonic() - start)
+            return result
+
+    def wrap(self, runnable: Runnable, priority: str = INTERACTIVE) -> "RateLimitedRunnable":
+        """Wrap a chat model (or a model with bound tools or structured output) so every call is limited."""
+        return RateLimitedRunnable(runnable, self, priority)
+
+    def report(self):
+        return {
+            **self.stats,
+            "concurrency_limit": round(self._concurrency.limit, 2),
+            "in_use": self._concurrency.in_use,
+            "shared": self._shared,
+        }
+
+
+class RateLimitedRunnable(Runnable):
+    """A chat model whose calls go through a SharedRateLimiter.
+
+    ``bind_tools`` and ``with_structured_output`` are forwarded to the wrapped
+    model and return a limited runnable again, so the wrapper can be used
+    wherever the model is (e.g. by agents). Streaming holds the slot until the
+    stream is consumed; it is not retried once the first chunk has been produced.
+    """
+
+    def __init__(self, bound: Runnable, limiter: SharedRateLimiter, priority: str = INTERACTIVE):
+        self.bound = bound
+        self.limiter = limiter
+        self.priority = priority
+
+    def _rewrap(self, bound: Runnable) -> "RateLimitedRunnable":
+        return RateLimitedRunnable(bound, self.limiter, self.priority)
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "RateLimitedRunnable":
+        return self._rewrap(self.bound.bind_tools(tools, **kwargs))
+
+    def with_structured_output(self, schema: Any, **kwargs: Any) -> "RateLimitedRunnable":
+        return self._rewrap(self.bound.with_structured_output(schema, **kwargs))
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        tokens = self.limiter.estimate_tokens(input)
+        return self.limiter.call(lambda: self.bound.invoke(input, config, **kwargs), self.priority, tokens)
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        tokens = self.limiter.estimate_tokens(input)
+        return await self.limiter.acall(lambda: self.bound.ainvoke(input, config, **kwargs), self.priority, tokens)
+
+    def stream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Iterator[Any]:
+        tokens = self.limiter.estimate_tokens(input)
+        self.limiter.acquire(self.priority, tokens)
+        start, final = time.monotonic(), None
+        try:
+            for chunk in self.bound.stream(input, config, **kwargs):
+                final = chunk if final is None else final + chunk
+                yield chunk
+        except Exception as e:
+            self.limiter._failed(e, self.limiter.max_retries)
+            raise
+        except BaseException:
+            # Consumer stopped early or was cancelled
+            self.limiter._concurrency.release()
+            raise
+        self.limiter._succeeded(self.priority, tokens, final, time.monotonic() - start)
+
+    async def astream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> AsyncIterator[Any]:
+        tokens = self.limiter.estimate_tokens(input)
+        await self.limiter.aacquire(self.priority, tokens)
+        start, final = time.monotonic(), None
+        try:
+            async for chunk in self.bound.astream(input, config, **kwargs):
+                final = chunk if final is None else final + chunk
+                yield chunk
+        except Exception as e:
+            self.limiter._failed(e, self.limiter.max_retries)
+            raise
+        except BaseException:
+            # Consumer stopped early or was cancelled
+            self.limiter._concurrency.release()
+            raise
+        self.limiter._succeeded(self.priority, tokens, final, time.monotonic() - start)
+
+
+def limiter_from_env(**kwargs: Any) -> SharedRateLimiter:
+    """Limiter configured by GEMINI_RPM, GEMINI_TPM and GEMINI_LIMITER_REDIS_URL."""
+    return SharedRateLimiter(
+        requests_per_minute=int(os.getenv("GEMINI_RPM", "60")),
+        tokens_per_minute=int(os.getenv("GEMINI_TPM", "1000000")),
+        redis_url=os.getenv("GEMINI_LIMITER_REDIS_URL"),
+        **kwargs,
+    )